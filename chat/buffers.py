@@ -0,0 +1,229 @@
+import asyncio
+import atexit
+import logging
+import threading
+from collections import deque
+
+from channels.db import database_sync_to_async
+
+from django.conf import settings
+from django.db import DataError, IntegrityError, connection, transaction
+from django.db.models import Q
+
+logger = logging.getLogger(__name__)
+
+
+class LastMessageAtBuffer:
+    """
+    Write-behind buffer for ChatGroup.last_message_at.
+
+    Every message used to issue its own UPDATE on the chat row, so a busy
+    chat serialized on that row. Messages now only record the newest
+    timestamp per chat in memory. One UPDATE per chat is flushed every
+    `interval` seconds. Updates only move the value forward, so flushes
+    from several processes can run in any order.
+
+    With interval <= 0 the update is written immediately (tests, scripts).
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def touch(self, chat_group_id, message_at):
+        if self.interval <= 0:
+            self._write(chat_group_id, message_at)
+            return
+
+        with self._lock:
+            current = self._pending.get(chat_group_id)
+            if current is None or message_at > current:
+                self._pending[chat_group_id] = message_at
+            if self._timer is None:
+                self._timer = threading.Timer(self.interval, self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Writes every pending timestamp now. Returns the number of chats updated."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+        for chat_group_id, message_at in pending.items():
+            try:
+                self._write(chat_group_id, message_at)
+            except Exception as e:
+                logger.error(f"[LastMessageAtBuffer] Failed to update chat {chat_group_id}: {e}", exc_info=True)
+        return len(pending)
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        finally:
+            # The timer thread owns its own DB connection
+            connection.close()
+
+    @staticmethod
+    def _write(chat_group_id, message_at):
+        from chat.models import ChatGroup
+
+        ChatGroup.objects.filter(id=chat_group_id).filter(
+            Q(last_message_at__isnull=True) | Q(last_message_at__lt=message_at)
+        ).update(last_message_at=message_at)
+
+
+last_message_at_buffer = LastMessageAtBuffer(
+    getattr(settings, "CHAT_LAST_MESSAGE_FLUSH_INTERVAL", 0.25)
+)
+
+# Do not drop the last few hundred milliseconds on a clean shutdown
+atexit.register(last_message_at_buffer.flush)
+
+
+class ChatMessageWriter:
+    """
+    Write-behind persistence for messages sent over the WebSocket.
+
+    The consumer gives the message its id (chat.snowflake) and created_at,
+    broadcasts it right away and enqueues the unsaved instance here. A
+    background task on the event loop bulk inserts the queue in batches
+    of up to `batch_size`, waiting `interval` seconds to let a batch fill.
+
+    One FIFO queue per process, inserted in order, keeps the order inside
+    every chat. A batch that fails is put back at the head of the queue
+    and retried. A message whose id is already taken is skipped when the
+    row is that same message (a batch replayed on shutdown) and otherwise
+    stored under a new id, so a broadcast message is never lost to an id
+    collision. The atexit hook writes everything still queued or in flight.
+    """
+
+    retry_delay = 1.0
+
+    def __init__(self, batch_size, interval):
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue = deque()
+        self._in_flight = []
+        self._lock = threading.Lock()
+        self._loop = None
+        self._wakeup = None
+        self._task = None
+
+    def enqueue(self, message):
+        """Queues an unsaved ChatMessage. Must be called from the event loop."""
+        with self._lock:
+            self._queue.append(message)
+        self._ensure_task()
+        self._wakeup.set()
+
+    def pending(self):
+        with self._lock:
+            return len(self._queue) + len(self._in_flight)
+
+    def _ensure_task(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            await asyncio.sleep(self.interval)
+            while await self._write_next_batch():
+                pass
+
+    async def _write_next_batch(self):
+        with self._lock:
+            if self._in_flight or not self._queue:
+                return False
+            count = min(self.batch_size, len(self._queue))
+            self._in_flight = [self._queue.popleft() for _ in range(count)]
+            batch = self._in_flight
+
+        try:
+            await database_sync_to_async(self._persist)(batch)
+        except Exception as e:
+            logger.error(f"[ChatMessageWriter] Failed to write {len(batch)} messages, retrying: {e}", exc_info=True)
+            with self._lock:
+                self._queue.extendleft(reversed(batch))
+                self._in_flight = []
+            await asyncio.sleep(self.retry_delay)
+            return True
+
+        with self._lock:
+            self._in_flight = []
+        return True
+
+    @staticmethod
+    def _persist_one(message, attempts=3):
+        from chat.models import ChatMessage
+        from chat.snowflake import next_message_id
+
+        for _ in range(attempts):
+            try:
+                with transaction.atomic():
+                    ChatMessage.objects.bulk_create([message])
+                return
+            except IntegrityError as e:
+                existing = ChatMessage.objects.filter(id=message.id).values_list('group_id', 'sender_id', 'created_at').first()
+                if existing is None:
+                    # Not an id conflict: the database rejects the row itself
+                    logger.error(f"[ChatMessageWriter] Dropped message {message.id} in chat {message.group_id}: {e}")
+                    return
+                if existing == (message.group_id, message.sender_id, message.created_at):
+                    return  # Already written, e.g. replayed by flush()
+                new_id = next_message_id()
+                logger.warning(
+                    f"[ChatMessageWriter] Message id {message.id} already taken in chat {existing[0]}, "
+                    f"storing message of chat {message.group_id} as {new_id}"
+                )
+                message.id = new_id
+            except DataError as e:
+                logger.error(f"[ChatMessageWriter] Dropped message {message.id} in chat {message.group_id}: {e}")
+                return
+        logger.error(f"[ChatMessageWriter] Could not store message {message.id} in chat {message.group_id}")
+
+    def flush(self):
+        """Synchronously writes everything queued or in flight. Returns the number of messages."""
+        with self._lock:
+            batch = self._in_flight + list(self._queue)
+            self._queue.clear()
+        if batch:
+            self._persist(batch)
+        return len(batch)
+
+    @staticmethod
+    def _persist(batch):
+        from chat.models import ChatMessage
+
+        try:
+            with transaction.atomic():
+                ChatMessage.objects.bulk_create(batch)
+        except (IntegrityError, DataError):
+            # Row by row, so one bad row (an id collision, a chat deleted meanwhile) does not block the rest
+            for message in batch:
+                ChatMessageWriter._persist_one(message)
+
+        newest = {}
+        for message in batch:
+            newest[message.group_id] = max(newest.get(message.group_id, message.created_at), message.created_at)
+        for chat_group_id, message_at in newest.items():
+            last_message_at_buffer.touch(chat_group_id, message_at)
+
+
+chat_message_writer = ChatMessageWriter(
+    getattr(settings, "CHAT_WRITE_BEHIND_BATCH_SIZE", 200),
+    getattr(settings, "CHAT_WRITE_BEHIND_INTERVAL", 0.05),
+)
+
+# Registered after last_message_at_buffer.flush, so it runs first (atexit is LIFO)
+# and the timestamps it touches are still written by that flush
+atexit.register(chat_message_writer.flush)
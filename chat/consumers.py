@@ -1,18 +1,131 @@
 import json
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.utils import timezone
 
+from .buffers import chat_message_writer
 from .models import ChatGroup, ChatMessage, ChatGroupMember, MessageReceipt
-from .utils import is_group_member
+from .presence import get_online_profile_ids, profile_connected, profile_disconnected
+from .snowflake import next_message_id
+from .typing import typing_tracker
+from .utils import is_group_member, mark_messages_read, group_room_name, user_room_name
 from core.services import get_user_profile
 
 
-def group_room_name(group_id: str) -> str:
-    return f"chat_{group_id}"
+class ChatActionsMixin:
+    """
+    Chat actions and room event handlers shared by the per-room ChatConsumer
+    and the multiplexed UserConsumer. Expects self.profile to be resolved.
+    Every room event carries "chat_id" so one socket can serve many rooms.
+    """
+
+    def _build_message(self, chat_group, payload):
+        return ChatMessage(
+            group_id=chat_group.id,
+            sender_id=self.profile.id,
+            message_type=payload.get("message_type", ChatMessage.TEXT),
+            content=payload.get("content", ""),
+        )
+
+    @database_sync_to_async
+    def _create_message(self, chat_group, payload):
+        msg = self._build_message(chat_group, payload)
+        msg.save()
+        return self._message_data(chat_group, msg)
+
+    def _enqueue_message(self, chat_group, payload):
+        # Write-behind: id and timestamp are final now, the row is inserted later in a batch
+        msg = self._build_message(chat_group, payload)
+        msg.id = next_message_id()
+        msg.created_at = timezone.now()
+        msg.full_clean(exclude=["group", "sender", "file"], validate_unique=False)
+        chat_message_writer.enqueue(msg)
+        return self._message_data(chat_group, msg)
+
+    def _message_data(self, chat_group, msg):
+        return {
+            "id": msg.id,
+            "group": str(chat_group.id),
+            "sender": {"id": self.profile.id, "username": self.profile.username},
+            "message_type": msg.message_type,
+            "content": msg.content,
+            "created_at": msg.created_at.isoformat(),
+        }
 
+    async def send_chat_message(self, chat_group, payload):
+        try:
+            if getattr(settings, "CHAT_WRITE_BEHIND", False):
+                data = self._enqueue_message(chat_group, payload)
+            else:
+                data = await self._create_message(chat_group, payload)
+            # broadcast
+            await self.channel_layer.group_send(
+                group_room_name(chat_group.id),
+                {"type": "chat.message", "chat_id": str(chat_group.id), "data": data}
+            )
+        except Exception as e:
+            await self.send_json({"type": "error", "message": str(e)})
+
+    async def chat_message(self, event):
+        await self.send_json({"type": "message", "chat_id": event["chat_id"], "data": event["data"]})
+
+    async def send_typing(self, chat_group, payload):
+        # Throttled and batched per room in memory, see chat.typing
+        is_typing = bool(payload.get("is_typing"))
+        if is_typing:
+            self.typing_chats.add(chat_group.id)
+        else:
+            self.typing_chats.discard(chat_group.id)
+        await typing_tracker.update(
+            self.channel_layer, chat_group.id, self.profile.id, self.profile.username, is_typing
+        )
 
-class ChatConsumer(AsyncJsonWebsocketConsumer):
+    async def stop_typing(self):
+        typing_chats, self.typing_chats = self.typing_chats, set()
+        for chat_id in typing_chats:
+            await typing_tracker.update(self.channel_layer, chat_id, self.profile.id, self.profile.username, False)
+
+    async def chat_typing(self, event):
+        # data: {"started": [{profile_id, username}], "stopped": [...], "expires_in": seconds, "at": iso}
+        await self.send_json({"type": "typing", "chat_id": event["chat_id"], "data": event["data"]})
+
+    @database_sync_to_async
+    def _mark_read(self, chat_group, up_to_message_id=None):
+        return mark_messages_read(chat_group, self.profile, up_to_message_id)
+
+    async def send_mark_read(self, chat_group, payload):
+        try:
+            read = await self._mark_read(chat_group, payload.get("message_id"))
+            if read:
+                # broadcast the new watermark (and personal chat receipts) to everyone in the group
+                await self.channel_layer.group_send(
+                    group_room_name(chat_group.id),
+                    {"type": "chat.read", "chat_id": str(chat_group.id), "data": read.pop("receipts"), "watermark": read}
+                )
+        except Exception as e:
+            await self.send_json({"type": "error", "message": str(e)})
+
+    async def chat_read(self, event):
+        # Send receipts and the reader's watermark to client
+        await self.send_json({
+            "type": "read", "chat_id": event["chat_id"], "data": event["data"], "watermark": event["watermark"]
+        })
+
+    async def handle_presence(self, payload):
+        try:
+            profile_ids = [int(i) for i in payload.get("profile_ids", [])]
+        except (TypeError, ValueError):
+            await self.send_json({"type": "error", "message": "profile_ids must be a list of integers"})
+            return
+        online = await get_online_profile_ids(profile_ids)
+        await self.send_json({"type": "presence_state", "online": sorted(online)})
+
+    async def presence_update(self, event):
+        await self.send_json({"type": "presence", "data": event["data"]})
+
+
+class ChatConsumer(ChatActionsMixin, AsyncJsonWebsocketConsumer):
     """
     WebSocket path: /ws/chat/<group_id>/
     Protocol (JSON):
@@ -20,8 +133,12 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
         {"action":"send_message","message_type":"text","content":"hi"}
       - typing:
         {"action":"typing","is_typing":true}
-      - mark read:
-        {"action":"mark_read"}
+      - mark read (everything, or up to a message id):
+        {"action":"mark_read"} / {"action":"mark_read","message_id":123}
+      - presence heartbeat (at least every PRESENCE_TIMEOUT seconds):
+        {"action":"heartbeat"}
+      - who is online:
+        {"action":"presence","profile_ids":[1,2,3]}
     """
 
     async def connect(self):
@@ -35,9 +152,13 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
 
         await self.channel_layer.group_add(self.room_name, self.channel_name)
         await self.accept()
+        await profile_connected(self.channel_layer, self.profile.id, self.channel_name)
 
     async def disconnect(self, close_code):
         await self.channel_layer.group_discard(self.room_name, self.channel_name)
+        if getattr(self, "profile", None) is not None:
+            await self.stop_typing()
+            await profile_disconnected(self.channel_layer, self.profile.id, self.channel_name)
 
     @database_sync_to_async
     def authorized(self) -> bool:
@@ -47,110 +168,166 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
         try:
             profile = get_user_profile(user)
             group = ChatGroup.objects.get(id=self.group_id)
-            return is_group_member(group, profile)
+            if not is_group_member(group, profile):
+                return False
         except Exception:
             return False
 
+        # Resolved once per connection, reused by every message/typing event
+        self.profile = profile
+        self.chat_group = group
+        self.is_member = True
+        self.typing_chats = set()
+        return True
+
     async def receive_json(self, content, **kwargs):
+        if not self.is_member:
+            return
         action = content.get("action")
 
         if action == "send_message":
-            await self.handle_send_message(content)
+            await self.send_chat_message(self.chat_group, content)
         elif action == "typing":
-            await self.handle_typing(content)
+            await self.send_typing(self.chat_group, content)
         elif action == "mark_read":
-            await self.handle_mark_read(content)
+            await self.send_mark_read(self.chat_group, content)
+        elif action == "heartbeat":
+            await profile_connected(self.channel_layer, self.profile.id, self.channel_name)
+        elif action == "presence":
+            await self.handle_presence(content)
 
-    @database_sync_to_async
-    def _create_message(self, user, payload):
-        profile = get_user_profile(user)
-        group = ChatGroup.objects.get(id=self.group_id)
-        msg = ChatMessage.objects.create(
-            group=group,
-            sender=profile,
-            message_type=payload.get("message_type", ChatMessage.TEXT),
-            content=payload.get("content", ""),
-        )
-        return {
-            "id": msg.id,
-            "group": str(group.id),
-            "sender": {"id": profile.id, "username": profile.username},
-            "message_type": msg.message_type,
-            "content": msg.content,
-            "created_at": msg.created_at.isoformat(),
-        }
+    async def chat_member_removed(self, event):
+        # Membership revoked (see group.signals): drop this connection
+        if event["profile_id"] == self.profile.id:
+            self.is_member = False
+            await self.channel_layer.group_discard(self.room_name, self.channel_name)
+            await self.close(code=4403)
 
-    async def handle_send_message(self, payload):
-        user = self.scope["user"]
-        try:
-            data = await self._create_message(user, payload)
-            # broadcast
-            await self.channel_layer.group_send(
-                self.room_name,
-                {"type": "chat.message", "data": data}
-            )
-        except Exception as e:
-            await self.send_json({"type": "error", "message": str(e)})
 
-    async def chat_message(self, event):
-        await self.send_json({"type": "message", "data": event["data"]})
+class UserConsumer(ChatActionsMixin, AsyncJsonWebsocketConsumer):
+    """
+    WebSocket path: /ws/user/
+    One connection per user instead of one per chat room. On connect it joins
+    every chat room of the user, the user's notification stream and presence.
+    Room frames carry "chat_id"; actions on a chat name it the same way.
+    Protocol (JSON):
+      - send message / typing / mark read, as on /ws/chat/ plus "chat_id":
+        {"action":"send_message","chat_id":"<uuid>","content":"hi"}
+        {"action":"typing","chat_id":"<uuid>","is_typing":true}
+        {"action":"mark_read","chat_id":"<uuid>","message_id":123}
+      - join a chat created after connecting / stop receiving one:
+        {"action":"subscribe","chat_id":"<uuid>"} / {"action":"unsubscribe","chat_id":"<uuid>"}
+      - presence heartbeat and lookup, as on /ws/chat/:
+        {"action":"heartbeat"} / {"action":"presence","profile_ids":[1,2,3]}
+    Server frames besides the room ones:
+      - {"type":"notification","data":{...}}
+      - {"type":"subscribed"|"unsubscribed","chat_id":"<uuid>"}
+    """
 
-    async def handle_typing(self, payload):
+    async def connect(self):
         user = self.scope["user"]
-        data = {
-            "profile_id": user.profile.id,
-            "username": user.profile.username,
-            "is_typing": bool(payload.get("is_typing")),
-            "at": timezone.now().isoformat(),
-        }
-        await self.channel_layer.group_send(self.room_name, {"type": "chat.typing", "data": data})
+        if not user.is_authenticated or not await self.load_chats(user):
+            await self.close(code=4403)
+            return
 
-    async def chat_typing(self, event):
-        await self.send_json({"type": "typing", "data": event["data"]})
+        self.user_room = user_room_name(self.profile.id)
+        # Last presence event per profile: a profile sharing several chats with
+        # this user is announced in each of those rooms, forward it only once
+        self._presence_seen = {}
+
+        await self.channel_layer.group_add(self.user_room, self.channel_name)
+        for chat_id in self.chats:
+            await self.channel_layer.group_add(group_room_name(chat_id), self.channel_name)
+        await self.accept()
+        await profile_connected(self.channel_layer, self.profile.id, self.channel_name)
+
+    async def disconnect(self, close_code):
+        if getattr(self, "profile", None) is None:
+            return
+        for chat_id in self.chats:
+            await self.channel_layer.group_discard(group_room_name(chat_id), self.channel_name)
+        await self.channel_layer.group_discard(self.user_room, self.channel_name)
+        await self.stop_typing()
+        await profile_disconnected(self.channel_layer, self.profile.id, self.channel_name)
 
     @database_sync_to_async
-    def _mark_read(self, user):
-        profile = user.profile
-        group = ChatGroup.objects.get(id=self.group_id)
-
-        # Find messages in this group not yet seen by this user
-        unseen_messages = ChatMessage.objects.filter(
-            group=group
-        ).exclude(sender=profile).exclude(
-        receipts__user=profile
-    )
-
-        now = timezone.now()
-        receipts = []
-        for msg in unseen_messages:
-            receipt = MessageReceipt.objects.create(
-                message=msg,
-                user=profile,
-                is_seen=True,
-                seen_at=now
-            )
-            receipts.append({
-                "message_id": msg.id,
-                "profile_id": profile.id,
-                "seen_at": now.isoformat(),
-            })
+    def load_chats(self, user) -> bool:
+        try:
+            profile = get_user_profile(user)
+        except Exception:
+            return False
+        if profile is None:
+            return False
 
-        return receipts
+        self.profile = profile
+        self.typing_chats = set()
+        # chat id -> ChatGroup, the rooms this socket is subscribed to
+        self.chats = {
+            str(chat_group.id): chat_group
+            for chat_group in ChatGroup.objects.filter(memberships__profile=profile)
+        }
+        return True
 
+    @database_sync_to_async
+    def _get_member_chat(self, chat_id):
+        return ChatGroup.objects.filter(id=chat_id, memberships__profile=self.profile).first()
 
-    async def handle_mark_read(self, payload):
-        user = self.scope["user"]
-        try:
-            receipts = await self._mark_read(user)
-            if receipts:
-                # broadcast receipts to everyone in the group
-                await self.channel_layer.group_send(
-                    self.room_name,
-                    {"type": "chat.read", "data": receipts}
-                )
-        except Exception as e:
-            await self.send_json({"type": "error", "message": str(e)})
+    async def receive_json(self, content, **kwargs):
+        action = content.get("action")
 
-    async def chat_read(self, event):
-        # Send receipts to client
-        await self.send_json({"type": "read", "data": event["data"]})
+        if action == "heartbeat":
+            await profile_connected(self.channel_layer, self.profile.id, self.channel_name)
+        elif action == "presence":
+            await self.handle_presence(content)
+        elif action == "subscribe":
+            await self.handle_subscribe(content)
+        elif action == "unsubscribe":
+            await self.handle_unsubscribe(content)
+        elif action in ("send_message", "typing", "mark_read"):
+            chat_group = self.chats.get(str(content.get("chat_id")))
+            if chat_group is None:
+                await self.send_json({"type": "error", "message": "Not subscribed to this chat"})
+            elif action == "send_message":
+                await self.send_chat_message(chat_group, content)
+            elif action == "typing":
+                await self.send_typing(chat_group, content)
+            else:
+                await self.send_mark_read(chat_group, content)
+
+    async def handle_subscribe(self, payload):
+        chat_id = str(payload.get("chat_id"))
+        if chat_id not in self.chats:
+            try:
+                chat_group = await self._get_member_chat(chat_id)
+            except Exception:
+                chat_group = None
+            if chat_group is None:
+                await self.send_json({"type": "error", "message": "You are not a member of this chat"})
+                return
+            self.chats[chat_id] = chat_group
+            await self.channel_layer.group_add(group_room_name(chat_id), self.channel_name)
+        await self.send_json({"type": "subscribed", "chat_id": chat_id})
+
+    async def handle_unsubscribe(self, payload):
+        chat_id = str(payload.get("chat_id"))
+        if self.chats.pop(chat_id, None) is not None:
+            await self.channel_layer.group_discard(group_room_name(chat_id), self.channel_name)
+        await self.send_json({"type": "unsubscribed", "chat_id": chat_id})
+
+    async def chat_member_removed(self, event):
+        # Membership revoked (see group.signals): leave that room, keep the socket
+        if event["profile_id"] == self.profile.id:
+            chat_id = str(event["chat_id"])
+            self.chats.pop(chat_id, None)
+            await self.channel_layer.group_discard(group_room_name(chat_id), self.channel_name)
+            await self.send_json({"type": "unsubscribed", "chat_id": chat_id})
+
+    async def presence_update(self, event):
+        data = event["data"]
+        if self._presence_seen.get(data["profile_id"]) == data["at"]:
+            return
+        self._presence_seen[data["profile_id"]] = data["at"]
+        await super().presence_update(event)
+
+    async def notification_created(self, event):
+        await self.send_json({"type": "notification", "data": event["data"]})
@@ -0,0 +1,69 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from chat.buffers import last_message_at_buffer
+from chat.choices import ChatType
+from chat.models import ChatGroup, ChatGroupMember, ChatMessage
+from profiles.models import Profile
+
+
+class StatementCounter:
+    def __init__(self):
+        self.total = 0
+        self.updates = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.total += 1
+        if sql.lstrip().upper().startswith("UPDATE"):
+            self.updates += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = "Benchmark chat message inserts with per-message vs coalesced last_message_at updates (rolled back)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=2000, help='Messages to insert per mode')
+        parser.add_argument('--chats', type=int, default=1, help='Chats the messages are spread over')
+
+    def handle(self, *args, **options):
+        messages = options['messages']
+        chats = max(1, options['chats'])
+
+        sender = Profile.objects.first()
+        if not sender:
+            raise CommandError("Needs at least one profile to send messages as.")
+
+        original_interval = last_message_at_buffer.interval
+        results = []
+        try:
+            for label, interval in (("per-message UPDATE", 0), ("coalesced", 3600)):
+                last_message_at_buffer.interval = interval
+                results.append((label, *self._run(sender, messages, chats)))
+        finally:
+            last_message_at_buffer.interval = original_interval
+
+        for label, elapsed, counter in results:
+            self.stdout.write(
+                f"{label:<20} {messages / elapsed:>10.0f} msg/s  "
+                f"{counter.total} statements ({counter.updates} UPDATE) in {elapsed:.2f}s"
+            )
+
+    def _run(self, sender, messages, chats):
+        counter = StatementCounter()
+        with transaction.atomic():
+            groups = [ChatGroup.objects.create(type=ChatType.GROUP) for _ in range(chats)]
+            ChatGroupMember.objects.bulk_create(ChatGroupMember(group=g, profile=sender) for g in groups)
+
+            with connection.execute_wrapper(counter):
+                started = time.perf_counter()
+                for i in range(messages):
+                    ChatMessage.objects.create(group=groups[i % chats], sender=sender, content=f"bench {i}")
+                # Coalesced mode pays for its flush inside the measured window
+                last_message_at_buffer.flush()
+                elapsed = time.perf_counter() - started
+
+            transaction.set_rollback(True)
+        return elapsed, counter
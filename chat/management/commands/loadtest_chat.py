@@ -0,0 +1,234 @@
+import asyncio
+import json
+import random
+import time
+import tracemalloc
+
+from asgiref.sync import sync_to_async
+from channels.layers import InMemoryChannelLayer, channel_layers
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from chat import presence
+from chat.buffers import chat_message_writer, last_message_at_buffer
+from chat.choices import ChatType
+from chat.models import ChatGroup, ChatGroupMember
+from chat.presence import InMemoryPresenceBackend
+from chat.routing import websocket_urlpatterns
+from notification.models import percentile
+from profiles.models import Profile
+
+
+class WriteCounter:
+    """execute_wrapper counting data-modifying statements."""
+
+    def __init__(self):
+        self.writes = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.lstrip().split(" ", 1)[0].upper() in ("INSERT", "UPDATE", "DELETE"):
+            self.writes += 1
+        return execute(sql, params, many, context)
+
+
+class AsUser:
+    """ASGI wrapper putting an authenticated user in the scope (replaces JWTAuthMiddleware)."""
+
+    def __init__(self, app, user):
+        self.app = app
+        self.user = user
+
+    async def __call__(self, scope, receive, send):
+        return await self.app(dict(scope, user=self.user), receive, send)
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test the chat WebSocket stack in-process: N rooms x M members over "
+        "WebsocketCommunicator and the in-memory channel layer (no Redis needed). "
+        "Reports delivery latency percentiles, DB writes per message and memory per connection. "
+        "With --rate the senders run open loop, so the latencies include queueing under that load."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=10, help='Chat rooms (N)')
+        parser.add_argument('--members', type=int, default=5, help='Members per room (M)')
+        parser.add_argument('--messages', type=int, default=20, help='Messages sent per room')
+        parser.add_argument('--rate', type=float, default=0,
+                            help='Open loop: messages/s sent per room on a timer, whatever the deliveries. '
+                                 '0 (default) is closed loop: each round waits for every delivery.')
+        parser.add_argument('--socket', choices=['room', 'user'], default='room',
+                            help='room: one /ws/chat/<id>/ socket per member per room, user: one /ws/user/ socket per member')
+        parser.add_argument('--write-behind', action='store_true', help='Run with CHAT_WRITE_BEHIND enabled')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rooms, members = options['rooms'], options['members']
+        profiles = list(Profile.objects.select_related('user').filter(user__isnull=False).order_by('id')[:members])
+        if len(profiles) < members:
+            raise CommandError(f"Needs {members} profiles with a user, found {len(profiles)}.")
+
+        chat_groups = [ChatGroup.objects.create(type=ChatType.GROUP) for _ in range(rooms)]
+        ChatGroupMember.objects.bulk_create(
+            ChatGroupMember(group=chat_group, profile=profile) for chat_group in chat_groups for profile in profiles
+        )
+
+        original = (
+            channel_layers.backends.get('default'), presence._backend, getattr(settings, 'CHAT_WRITE_BEHIND', False),
+        )
+        channel_layers.set('default', InMemoryChannelLayer(capacity=100000))
+        presence._backend = InMemoryPresenceBackend(getattr(settings, 'PRESENCE_TIMEOUT', 90))
+        settings.CHAT_WRITE_BEHIND = options['write_behind']
+        try:
+            report = asyncio.run(self._run(chat_groups, profiles, options))
+        finally:
+            channel_layers.backends['default'] = original[0]
+            presence._backend = original[1]
+            settings.CHAT_WRITE_BEHIND = original[2]
+            ChatGroup.objects.filter(id__in=[chat_group.id for chat_group in chat_groups]).delete()
+
+        for label, value in report:
+            self.stdout.write(f"{label:<28} {value}")
+
+    async def _run(self, chat_groups, profiles, options):
+        rng = random.Random(options['seed'])
+        app = URLRouter(websocket_urlpatterns)
+        counter = WriteCounter()
+
+        # database_sync_to_async work runs on one shared thread: count there
+        await sync_to_async(lambda: connection.execute_wrappers.append(counter))()
+
+        tracemalloc.start()
+        baseline = tracemalloc.take_snapshot()
+
+        # sockets[(room index, profile id)] -> communicator receiving that room
+        sockets = {}
+        if options['socket'] == 'room':
+            for index, chat_group in enumerate(chat_groups):
+                for profile in profiles:
+                    sockets[(index, profile.id)] = WebsocketCommunicator(
+                        AsUser(app, profile.user), f"/ws/chat/{chat_group.id}/"
+                    )
+            connections = list(sockets.values())
+        else:
+            per_user = {profile.id: WebsocketCommunicator(AsUser(app, profile.user), "/ws/user/") for profile in profiles}
+            sockets = {(index, profile.id): per_user[profile.id] for index in range(len(chat_groups)) for profile in profiles}
+            connections = list(per_user.values())
+
+        for communicator in connections:
+            connected, _ = await communicator.connect()
+            if not connected:
+                raise CommandError("WebSocket connection was refused")
+
+        connected_snapshot = tracemalloc.take_snapshot()
+        memory = sum(stat.size_diff for stat in connected_snapshot.compare_to(baseline, 'filename'))
+        tracemalloc.stop()
+
+        # Drain presence frames from the connects
+        await asyncio.gather(*(self._drain(communicator) for communicator in connections))
+        counter.writes = 0
+
+        started = time.perf_counter()
+        if options['rate'] > 0:
+            latencies = await self._send_open_loop(chat_groups, profiles, sockets, rng, options)
+        else:
+            latencies = await self._send_closed_loop(chat_groups, profiles, sockets, rng, options)
+        elapsed = time.perf_counter() - started
+
+        await sync_to_async(chat_message_writer.flush)()
+        await sync_to_async(last_message_at_buffer.flush)()
+
+        for communicator in connections:
+            await communicator.disconnect()
+        await sync_to_async(lambda: connection.execute_wrappers.remove(counter))()
+
+        sent = options['messages'] * len(chat_groups)
+        ms = [latency * 1000 for latency in latencies]
+        return [
+            ("socket mode", options['socket']),
+            ("write-behind", options['write_behind']),
+            ("connections", len(connections)),
+            ("messages sent", sent),
+            ("rate (msg/s per room)", f"{options['rate']:g}" if options['rate'] > 0 else "closed loop"),
+            ("deliveries", len(latencies)),
+            ("throughput (msg/s)", f"{sent / elapsed:.0f}"),
+            ("latency p50/p95/p99 (ms)", "/".join(f"{percentile(ms, pct):.2f}" for pct in (50, 95, 99))),
+            ("latency max (ms)", f"{max(ms):.2f}"),
+            ("DB writes per message", f"{counter.writes / sent:.2f}"),
+            ("memory per connection (KB)", f"{memory / len(connections) / 1024:.1f}"),
+        ]
+
+    @staticmethod
+    def _payload(chat_group, n, sent):
+        return {
+            "action": "send_message",
+            "chat_id": str(chat_group.id),
+            "content": json.dumps({"sent": sent, "n": n}),
+        }
+
+    async def _send_closed_loop(self, chat_groups, profiles, sockets, rng, options):
+        """One message per room, then wait for all of their deliveries before the next round."""
+        latencies = []
+        for n in range(options['messages']):
+            expected = {}
+            for index, chat_group in enumerate(chat_groups):
+                sender = rng.choice(profiles)
+                await sockets[(index, sender.id)].send_json_to(self._payload(chat_group, n, time.perf_counter()))
+                for profile in profiles:
+                    communicator = sockets[(index, profile.id)]
+                    expected[communicator] = expected.get(communicator, 0) + 1
+
+            received = await asyncio.gather(
+                *(self._receive_messages(communicator, count) for communicator, count in expected.items())
+            )
+            for batch in received:
+                latencies.extend(batch)
+        return latencies
+
+    async def _send_open_loop(self, chat_groups, profiles, sockets, rng, options):
+        """
+        Every room sends on its own timer (`rate` messages/s) while receivers
+        collect concurrently. Latency runs from the scheduled send time, so a
+        sender falling behind schedule counts as queueing too.
+        """
+        messages, interval = options['messages'], 1 / options['rate']
+        senders = [[rng.choice(profiles) for _ in range(messages)] for _ in chat_groups]
+        expected = {}
+        for index in range(len(chat_groups)):
+            for profile in profiles:
+                communicator = sockets[(index, profile.id)]
+                expected[communicator] = expected.get(communicator, 0) + messages
+
+        start = time.perf_counter()
+
+        async def send_room(index, chat_group):
+            for n, sender in enumerate(senders[index]):
+                scheduled = start + n * interval
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                await sockets[(index, sender.id)].send_json_to(self._payload(chat_group, n, scheduled))
+
+        receiving = asyncio.gather(
+            *(self._receive_messages(communicator, count) for communicator, count in expected.items())
+        )
+        await asyncio.gather(*(send_room(index, chat_group) for index, chat_group in enumerate(chat_groups)))
+        return [latency for batch in await receiving for latency in batch]
+
+    @staticmethod
+    async def _drain(communicator):
+        while not await communicator.receive_nothing(timeout=0.05):
+            await communicator.receive_output()
+
+    @staticmethod
+    async def _receive_messages(communicator, count):
+        latencies = []
+        while len(latencies) < count:
+            frame = await communicator.receive_json_from(timeout=10)
+            if frame.get("type") == "message":
+                sent = json.loads(frame["data"]["content"])["sent"]
+                latencies.append(time.perf_counter() - sent)
+        return latencies
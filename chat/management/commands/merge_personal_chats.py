@@ -0,0 +1,80 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max, Min
+
+from chat.choices import ChatType
+from chat.models import ChatGroup, ChatGroupMember, ChatMessage, personal_pair_key
+
+
+class Command(BaseCommand):
+    help = (
+        "Backfills ChatGroup.pair_key for personal chats and merges duplicate "
+        "personal chats of the same two profiles into the oldest one"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would change')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+
+        members = defaultdict(list)
+        for group_id, profile_id in ChatGroupMember.objects.filter(
+            group__type=ChatType.PERSONAL, group__pair_key__isnull=True
+        ).values_list('group_id', 'profile_id'):
+            members[group_id].append(profile_id)
+
+        by_pair = defaultdict(list)
+        for group_id, profile_ids in members.items():
+            if len(profile_ids) != 2:
+                self.stderr.write(f"Skipping personal chat {group_id}: {len(profile_ids)} members")
+                continue
+            by_pair[personal_pair_key(*profile_ids)].append(group_id)
+
+        keyed = merged = 0
+        for pair_key, group_ids in by_pair.items():
+            existing = ChatGroup.objects.filter(pair_key=pair_key).values_list('id', flat=True).first()
+            groups = list(ChatGroup.objects.filter(id__in=group_ids).order_by('created_at'))
+            keeper_id = existing or groups[0].id
+            duplicates = [group.id for group in groups if group.id != keeper_id]
+
+            if dry_run:
+                self.stdout.write(f"{pair_key}: keep {keeper_id}, merge {len(duplicates)}")
+            else:
+                self._merge(pair_key, keeper_id, duplicates, set_key=not existing)
+            keyed += 1
+            merged += len(duplicates)
+
+        prefix = "Would key" if dry_run else "Keyed"
+        self.stdout.write(self.style.SUCCESS(f"{prefix} {keyed} personal chats, merging {merged} duplicates"))
+
+    @transaction.atomic
+    def _merge(self, pair_key, keeper_id, duplicate_ids, set_key):
+        if duplicate_ids:
+            # Receipts follow their messages
+            ChatMessage.objects.filter(group_id__in=duplicate_ids).update(group_id=keeper_id)
+
+            # Keep the lowest watermark per member so nothing read in one copy hides unread ones of another
+            watermarks = ChatGroupMember.objects.filter(group_id__in=[keeper_id, *duplicate_ids]).values(
+                'profile_id'
+            ).annotate(
+                last_read_message_id=Min('last_read_message_id'),
+                last_read_at=Min('last_read_at'),
+                joined_at=Min('joined_at'),
+            )
+            for row in watermarks:
+                ChatGroupMember.objects.filter(group_id=keeper_id, profile_id=row['profile_id']).update(
+                    last_read_message_id=row['last_read_message_id'],
+                    last_read_at=row['last_read_at'],
+                    joined_at=row['joined_at'],
+                )
+
+            ChatGroup.objects.filter(id__in=duplicate_ids).delete()
+
+        last_message_at = ChatMessage.objects.filter(group_id=keeper_id).aggregate(at=Max('created_at'))['at']
+        updates = {'last_message_at': last_message_at}
+        if set_key:
+            updates['pair_key'] = pair_key
+        ChatGroup.objects.filter(id=keeper_id).update(**updates)
@@ -1,9 +1,12 @@
 import uuid
-from django.db import models
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
 from django.utils import timezone
 
 from profiles.models import Profile
 from chat.choices import ChatType
+from chat.buffers import last_message_at_buffer
+from chat.snowflake import next_message_id
 from group.models import Group
 
 
@@ -20,12 +23,20 @@ class ChatGroup(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
     last_message_at = models.DateTimeField(null=True, blank=True)
+    # "<min profile id>:<max profile id>" for personal chats, null for group chats.
+    # Unique, so there is at most one personal chat per pair (see get_or_create_personal_group)
+    pair_key = models.CharField(max_length=41, unique=True, null=True, blank=True, editable=False)
 
     # for a personal chat, enforce 2 members via app logic (not DB)
     def __str__(self):
         return f"{self.type} - {self.id}"
 
 
+def personal_pair_key(profile_a_id, profile_b_id):
+    low, high = sorted((profile_a_id, profile_b_id))
+    return f"{low}:{high}"
+
+
 class ChatGroupMember(models.Model):
     group = models.ForeignKey(ChatGroup, on_delete=models.CASCADE, related_name="memberships")
     profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name="chat_memberships")
@@ -33,6 +44,8 @@ class ChatGroupMember(models.Model):
     # per-room prefs
     is_muted = models.BooleanField(default=False)
     last_read_at = models.DateTimeField(null=True, blank=True)
+    # read watermark: every message with id <= this is read by the member
+    last_read_message_id = models.BigIntegerField(null=True, blank=True)
 
     class Meta:
         unique_together = ("group", "profile")
@@ -56,7 +69,8 @@ class ChatMessage(models.Model):
     content = models.TextField(blank=True)
     file = models.FileField(upload_to="chat/files/", blank=True, null=True)
 
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Not auto_now_add: write-behind messages carry the time they were broadcast
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
     edited_at = models.DateTimeField(null=True, blank=True)
 
     is_deleted = models.BooleanField(default=False)
@@ -67,12 +81,37 @@ class ChatMessage(models.Model):
         ]
 
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        # lightweight denormalization for chat list ordering
-        ChatGroup.objects.filter(id=self.group_id).update(last_message_at=timezone.now())
+        adding = self._state.adding
+        if adding and self.id is None and getattr(settings, "CHAT_WRITE_BEHIND", False):
+            # Same id sequence as the WebSocket write-behind path
+            self._insert_with_snowflake_id(*args, **kwargs)
+        else:
+            super().save(*args, **kwargs)
+        if adding:
+            # lightweight denormalization for chat list ordering, coalesced per chat (see chat.buffers);
+            # after commit, so a rolled back message never moves its chat up
+            group_id, created_at = self.group_id, self.created_at
+            transaction.on_commit(lambda: last_message_at_buffer.touch(group_id, created_at))
+
+    def _insert_with_snowflake_id(self, *args, attempts=3, **kwargs):
+        kwargs["force_insert"] = True
+        for attempt in range(attempts):
+            self.id = next_message_id()
+            try:
+                with transaction.atomic():
+                    super().save(*args, **kwargs)
+                return
+            except IntegrityError:
+                # Only an id minted by another process (a lost worker id lease) is retried with a new id
+                if attempt == attempts - 1 or not ChatMessage.objects.filter(id=self.id).exists():
+                    raise
 
 
 class MessageReceipt(models.Model):
+    """
+    Per-message seen receipt, only kept for personal chats.
+    Group chats derive read state from ChatGroupMember.last_read_message_id.
+    """
     message = models.ForeignKey(ChatMessage, on_delete=models.CASCADE, related_name="receipts")
     user = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name="message_receipts")
     is_seen = models.BooleanField(default=True)
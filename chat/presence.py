@@ -0,0 +1,253 @@
+import asyncio
+import logging
+import time
+import weakref
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class InMemoryPresenceBackend:
+    """
+    Presence of a single process, for tests and development without Redis.
+    Connections are {profile_id: {channel_name: expires_at}}.
+    """
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self._connections = {}
+
+    def _alive(self, profile_id, now):
+        channels = self._connections.get(profile_id, {})
+        for channel_name in [c for c, expires_at in channels.items() if expires_at <= now]:
+            del channels[channel_name]
+        return channels
+
+    async def connect(self, profile_id, channel_name):
+        now = time.time()
+        channels = self._connections.setdefault(profile_id, {})
+        self._alive(profile_id, now)
+        added = channel_name not in channels
+        channels[channel_name] = now + self.timeout
+        return added and len(channels) == 1
+
+    async def disconnect(self, profile_id, channel_name):
+        channels = self._alive(profile_id, time.time())
+        if channels.pop(channel_name, None) is None or channels:
+            return False
+        self._connections.pop(profile_id, None)
+        return True
+
+    def online_among_sync(self, profile_ids):
+        now = time.time()
+        return {profile_id for profile_id in profile_ids if self._alive(profile_id, now)}
+
+    async def online_among(self, profile_ids):
+        return self.online_among_sync(profile_ids)
+
+    def expire_sync(self):
+        now = time.time()
+        offline = [profile_id for profile_id in list(self._connections) if not self._alive(profile_id, now)]
+        for profile_id in offline:
+            del self._connections[profile_id]
+        return offline
+
+
+# KEYS: connections zset, online set. ARGV: channel, now, expires_at, key ttl, profile id
+_CONNECT_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[2])
+local added = redis.call('ZADD', KEYS[1], ARGV[3], ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+redis.call('SADD', KEYS[2], ARGV[5])
+if added == 1 and redis.call('ZCARD', KEYS[1]) == 1 then return 1 end
+return 0
+"""
+
+# KEYS: connections zset, online set. ARGV: channel ('' to only prune), now, profile id
+_DISCONNECT_SCRIPT = """
+local removed = 0
+if ARGV[1] ~= '' then removed = redis.call('ZREM', KEYS[1], ARGV[1]) end
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[2])
+if redis.call('ZCARD', KEYS[1]) == 0 and redis.call('SREM', KEYS[2], ARGV[3]) == 1 then return 1 end
+return 0
+"""
+
+
+class RedisPresenceBackend:
+    """
+    Presence shared by every ASGI process.
+
+    presence:conn:<profile_id> is a sorted set of the profile's channel names
+    scored by expiry time; its live size is the connection refcount.
+    presence:online is the set of profiles with at least one connection.
+    Connect/disconnect run as Lua scripts so the refcount and the online set
+    change atomically.
+
+    The consumers share a redis.asyncio client per event loop (a connection
+    belongs to the loop that opened it), as channels_redis does with its
+    pools. Sync callers (WSGI views, Celery tasks) use the *_sync methods and
+    one thread-safe redis.Redis client: through async_to_sync every call
+    would get a new loop, and so a new pool that is never closed.
+    """
+    online_key = "presence:online"
+
+    def __init__(self, timeout, url):
+        self.timeout = timeout
+        self.url = url
+        self._clients = weakref.WeakKeyDictionary()
+        self._sync_client = None
+
+    def _client(self):
+        """(client, connect script, disconnect script) of the running event loop."""
+        import redis.asyncio as redis
+
+        loop = asyncio.get_running_loop()
+        entry = self._clients.get(loop)
+        if entry is None:
+            client = redis.from_url(self.url)
+            entry = (client, client.register_script(_CONNECT_SCRIPT), client.register_script(_DISCONNECT_SCRIPT))
+            self._clients[loop] = entry
+        return entry
+
+    def _sync(self):
+        """(client, disconnect script) for sync callers."""
+        if self._sync_client is None:
+            import redis
+
+            client = redis.Redis.from_url(self.url)
+            self._sync_client = (client, client.register_script(_DISCONNECT_SCRIPT))
+        return self._sync_client
+
+    @staticmethod
+    def _conn_key(profile_id):
+        return f"presence:conn:{profile_id}"
+
+    async def connect(self, profile_id, channel_name):
+        now = time.time()
+        _, connect_script, _ = self._client()
+        became_online = await connect_script(
+            keys=[self._conn_key(profile_id), self.online_key],
+            args=[channel_name, now, now + self.timeout, int(self.timeout * 2), profile_id],
+        )
+        return bool(became_online)
+
+    async def disconnect(self, profile_id, channel_name):
+        _, _, disconnect_script = self._client()
+        went_offline = await disconnect_script(
+            keys=[self._conn_key(profile_id), self.online_key],
+            args=[channel_name, time.time(), profile_id],
+        )
+        return bool(went_offline)
+
+    async def online_among(self, profile_ids):
+        profile_ids = list(profile_ids)
+        now = time.time()
+        client, _, _ = self._client()
+        async with client.pipeline(transaction=False) as pipe:
+            for profile_id in profile_ids:
+                pipe.zcount(self._conn_key(profile_id), f"({now}", "+inf")
+            counts = await pipe.execute()
+        return {profile_id for profile_id, count in zip(profile_ids, counts) if count}
+
+    def online_among_sync(self, profile_ids):
+        profile_ids = list(profile_ids)
+        now = time.time()
+        client, _ = self._sync()
+        with client.pipeline(transaction=False) as pipe:
+            for profile_id in profile_ids:
+                pipe.zcount(self._conn_key(profile_id), f"({now}", "+inf")
+            counts = pipe.execute()
+        return {profile_id for profile_id, count in zip(profile_ids, counts) if count}
+
+    def expire_sync(self):
+        offline = []
+        client, disconnect_script = self._sync()
+        for member in client.smembers(self.online_key):
+            profile_id = int(member)
+            if disconnect_script(
+                keys=[self._conn_key(profile_id), self.online_key],
+                args=["", time.time(), profile_id],
+            ):
+                offline.append(profile_id)
+        return offline
+
+
+PRESENCE_BACKENDS = {
+    "memory": lambda timeout: InMemoryPresenceBackend(timeout),
+    "redis": lambda timeout: RedisPresenceBackend(
+        timeout, getattr(settings, "PRESENCE_REDIS_URL", "redis://127.0.0.1:6379/0")
+    ),
+}
+
+_backend = None
+
+
+def get_presence_backend():
+    """Backend selected by settings.PRESENCE_BACKEND (redis by default)."""
+    global _backend
+    if _backend is None:
+        _backend = PRESENCE_BACKENDS[getattr(settings, "PRESENCE_BACKEND", "redis")](
+            getattr(settings, "PRESENCE_TIMEOUT", 90)
+        )
+    return _backend
+
+
+@database_sync_to_async
+def _chat_group_ids(profile_id):
+    from chat.models import ChatGroupMember
+
+    return list(ChatGroupMember.objects.filter(profile_id=profile_id).values_list("group_id", flat=True))
+
+
+async def broadcast_presence(channel_layer, profile_id, is_online):
+    """Sends a presence.update event to every chat room of the profile."""
+    from chat.utils import group_room_name
+
+    event = {
+        "type": "presence.update",
+        "data": {"profile_id": profile_id, "is_online": is_online, "at": timezone.now().isoformat()},
+    }
+    for chat_group_id in await _chat_group_ids(profile_id):
+        await channel_layer.group_send(group_room_name(chat_group_id), event)
+
+
+async def profile_connected(channel_layer, profile_id, channel_name):
+    """Counts a new connection (or a heartbeat of an existing one) for the profile."""
+    if await get_presence_backend().connect(profile_id, channel_name):
+        await broadcast_presence(channel_layer, profile_id, True)
+
+
+async def profile_disconnected(channel_layer, profile_id, channel_name):
+    if await get_presence_backend().disconnect(profile_id, channel_name):
+        await broadcast_presence(channel_layer, profile_id, False)
+
+
+async def get_online_profile_ids(profile_ids):
+    """Which of `profile_ids` currently have a live connection."""
+    return await get_presence_backend().online_among(profile_ids)
+
+
+def get_online_profile_ids_sync(profile_ids):
+    """get_online_profile_ids for sync code (WSGI views)."""
+    return get_presence_backend().online_among_sync(profile_ids)
+
+
+async def _broadcast_offline(channel_layer, profile_ids):
+    for profile_id in profile_ids:
+        await broadcast_presence(channel_layer, profile_id, False)
+
+
+def expire_presence(channel_layer):
+    """
+    Drops connections whose heartbeat expired (process crashed, network gone)
+    and announces the profiles that went offline. Returns their ids. Sync,
+    for the Celery beat task.
+    """
+    offline = get_presence_backend().expire_sync()
+    if offline:
+        async_to_sync(_broadcast_offline)(channel_layer, offline)
+    return offline
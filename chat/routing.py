@@ -1,6 +1,7 @@
 from django.urls import path
-from chat.consumers import ChatConsumer
+from chat.consumers import ChatConsumer, UserConsumer
 
 websocket_urlpatterns = [
     path('ws/chat/<str:group_id>/', ChatConsumer.as_asgi()),
+    path('ws/user/', UserConsumer.as_asgi()),
 ]
\ No newline at end of file
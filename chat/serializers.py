@@ -2,6 +2,7 @@ from rest_framework import serializers
 from chat.models import ChatGroup, ChatGroupMember, ChatMessage, MessageReceipt
 from profiles.serializers import BasicProfileSerializer  
 from group.serializers import BasicGroupDetailSerializer
+from chat.utils import get_seen_by
 
 
 class ChatGroupMemberSerializer(serializers.ModelSerializer):
@@ -36,9 +37,55 @@ class ChatMessageReceiptializer(serializers.ModelSerializer):
 class ChatMessageSerializer(serializers.ModelSerializer):
     sender = BasicProfileSerializer(read_only=True)
     receipts = ChatMessageReceiptializer(many=True, read_only=True)
+    seen_count = serializers.SerializerMethodField()
 
     class Meta:
         model = ChatMessage
-        fields = ["id", "group", "sender", "message_type", "content", "file", "created_at", "edited_at", "is_deleted", "receipts"]
-        read_only_fields = ["id", "sender", "created_at", "edited_at", "is_deleted", "group", "receipts"]
+        fields = ["id", "group", "sender", "message_type", "content", "file", "created_at", "edited_at", "is_deleted", "receipts", "seen_count"]
+        read_only_fields = ["id", "sender", "created_at", "edited_at", "is_deleted", "group", "receipts", "seen_count"]
 
+    def get_seen_count(self, obj):
+        # (profile_id, last_read_message_id) of the chat members, loaded once per page by the view
+        watermarks = self.context.get("read_watermarks")
+        if watermarks is None:
+            return get_seen_by(obj).count()
+        return sum(
+            1 for profile_id, last_read_id in watermarks
+            if last_read_id is not None and last_read_id >= obj.id and profile_id != obj.sender_id
+        )
+
+
+
+class LastMessagePreviewSerializer(serializers.ModelSerializer):
+    sender = BasicProfileSerializer(read_only=True)
+
+    class Meta:
+        model = ChatMessage
+        fields = ["id", "sender", "message_type", "content", "created_at"]
+
+
+class ChatInboxSerializer(ChatGroupSerializer):
+    """
+    Inbox row. Reads the per-chat summaries the view loads for the whole
+    page (context["summaries"], see chat.utils.get_inbox_summaries).
+    """
+    last_message = serializers.SerializerMethodField()
+    unread_count = serializers.SerializerMethodField()
+    other_member = serializers.SerializerMethodField()
+
+    class Meta(ChatGroupSerializer.Meta):
+        fields = ChatGroupSerializer.Meta.fields + ["last_message", "unread_count", "other_member"]
+
+    def _summary(self, obj):
+        return self.context["summaries"][obj.id]
+
+    def get_last_message(self, obj):
+        message = self._summary(obj)["last_message"]
+        return LastMessagePreviewSerializer(message, context=self.context).data if message else None
+
+    def get_unread_count(self, obj):
+        return self._summary(obj)["unread_count"]
+
+    def get_other_member(self, obj):
+        profile = self._summary(obj)["other_member"]
+        return BasicProfileSerializer(profile, context=self.context).data if profile else None
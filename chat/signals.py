@@ -0,0 +1,24 @@
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from notification.models import Notification
+from chat.utils import push_to_user
+
+
+@receiver(post_save, sender=Notification)
+def push_notification_to_user_socket(sender, instance, created, **kwargs):
+    """Streams new notifications to the recipient's /ws/user/ sockets."""
+    if not created:
+        return
+    data = {
+        "id": instance.id,
+        "notification_type": instance.notification_type,
+        "message": instance.message,
+        "sender_id": instance.sender_id,
+        "object_id": instance.object_id,
+        "is_read": instance.is_read,
+        "created_at": instance.created_at.isoformat(),
+    }
+    recipient_id = instance.recipient_id
+    transaction.on_commit(lambda: push_to_user(recipient_id, "notification.created", data))
@@ -0,0 +1,175 @@
+"""
+Snowflake ids for chat messages written behind (settings.CHAT_WRITE_BEHIND).
+
+Every process minting ids (ASGI, WSGI, Celery, forked workers) leases its
+own worker id in Redis (settings.CHAT_WORKER_ID_REDIS_URL) the first time
+it mints one, and keeps the lease while it runs. Two processes can only
+mint the same id when a lease was lost, e.g. to a Redis restart; the
+writers get a new id and retry then.
+
+Turning write-behind on is one-way. The ids it mints are far above the
+autoincrement sequence of chat_chatmessage, and nothing moves that
+sequence forward: with write-behind switched off again, new messages get
+ids below the snowflake ones. History ordered by id and the read
+watermarks (ChatGroupMember.last_read_message_id) would then put them
+before older messages and count them as read. Move the sequence past
+MAX(id) before switching it off.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Time-ordered 53-bit ids (safe as JSON numbers in the browser):
+# 40 bits of milliseconds since EPOCH_MS (until 2058) | 8 bits worker | 5 bits sequence
+EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+WORKER_BITS = 8
+SEQUENCE_BITS = 5
+MAX_WORKERS = 1 << WORKER_BITS
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+WORKER_LEASE_KEY = "chat:snowflake:worker:{}"
+WORKER_LEASE_COUNTER_KEY = "chat:snowflake:next_worker"
+WORKER_LEASE_TTL = 60  # seconds, renewed every third of it
+
+# KEYS: lease key. ARGV: token, ttl. Renews the lease if this process still holds it
+_RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('EXPIRE', KEYS[1], ARGV[2]) end
+return 0
+"""
+
+# KEYS: lease key. ARGV: token
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end
+return 0
+"""
+
+
+class SnowflakeGenerator:
+    """
+    Hands out chat message ids before the row exists, so a message can be
+    broadcast first and persisted later. Ids grow with time, and they are
+    strictly increasing within a process, which keeps the existing
+    "order by id" history and the read watermarks correct.
+    """
+
+    def __init__(self, worker_id):
+        self.worker_id = worker_id & (MAX_WORKERS - 1)
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._sequence = 0
+
+    def set_worker_id(self, worker_id):
+        with self._lock:
+            self.worker_id = worker_id & (MAX_WORKERS - 1)
+
+    def next_id(self):
+        with self._lock:
+            now_ms = int(time.time() * 1000) - EPOCH_MS
+            if now_ms < self._last_ms:
+                # Clock went backwards: keep ids monotonic on the last timestamp
+                now_ms = self._last_ms
+
+            if now_ms == self._last_ms:
+                self._sequence = (self._sequence + 1) & MAX_SEQUENCE
+                if self._sequence == 0:
+                    while now_ms <= self._last_ms:
+                        now_ms = int(time.time() * 1000) - EPOCH_MS
+            else:
+                self._sequence = 0
+
+            self._last_ms = now_ms
+            return (now_ms << (WORKER_BITS + SEQUENCE_BITS)) | (self.worker_id << SEQUENCE_BITS) | self._sequence
+
+
+class WorkerIdLease:
+    """
+    A worker id held by this process in Redis: chat:snowflake:worker:<id> is
+    set (NX, with a TTL) to a token of the process and renewed by a daemon
+    thread. Acquiring starts from an INCR counter, so restarted processes
+    spread over the ids instead of all probing from 0. A lease found lost
+    on renewal is replaced by a new one, handed to `on_change`.
+    """
+
+    def __init__(self, url, ttl=WORKER_LEASE_TTL):
+        self.url = url
+        self.ttl = ttl
+        self.token = f"{os.getpid()}:{uuid.uuid4().hex}"
+        self.worker_id = None
+        self._redis = None
+
+    def _client(self):
+        if self._redis is None:
+            import redis
+
+            self._redis = redis.Redis.from_url(self.url)
+        return self._redis
+
+    def acquire(self):
+        client = self._client()
+        start = client.incr(WORKER_LEASE_COUNTER_KEY)
+        for offset in range(MAX_WORKERS):
+            worker_id = (start + offset) % MAX_WORKERS
+            if client.set(WORKER_LEASE_KEY.format(worker_id), self.token, nx=True, ex=self.ttl):
+                self.worker_id = worker_id
+                return worker_id
+        raise RuntimeError(f"All {MAX_WORKERS} chat worker ids are leased, no snowflake ids can be minted")
+
+    def keep(self, on_change):
+        """Renews the lease in a daemon thread until the process exits, then releases it."""
+        thread = threading.Thread(target=self._renew_forever, args=(on_change,), name="chat-worker-id", daemon=True)
+        thread.start()
+        atexit.register(self.release)
+
+    def _renew_forever(self, on_change):
+        renew = self._client().register_script(_RENEW_SCRIPT)
+        while True:
+            time.sleep(self.ttl / 3)
+            try:
+                if not renew(keys=[WORKER_LEASE_KEY.format(self.worker_id)], args=[self.token, self.ttl]):
+                    lost = self.worker_id
+                    on_change(self.acquire())
+                    logger.warning(f"[WorkerIdLease] Lost chat worker id {lost}, now minting as {self.worker_id}")
+            except Exception as e:
+                # Keep minting: the lease outlives a short outage, and writers retry on a collision
+                logger.warning(f"[WorkerIdLease] Could not renew chat worker id {self.worker_id}: {e}")
+
+    def release(self):
+        try:
+            self._client().register_script(_RELEASE_SCRIPT)(
+                keys=[WORKER_LEASE_KEY.format(self.worker_id)], args=[self.token]
+            )
+        except Exception as e:
+            logger.warning(f"[WorkerIdLease] Could not release chat worker id {self.worker_id}: {e}")
+
+
+def _create_generator():
+    if not getattr(settings, "CHAT_WRITE_BEHIND", False):
+        # Ids only minted by scripts such as loadtest_chat
+        return SnowflakeGenerator(os.getpid())
+    lease = WorkerIdLease(settings.CHAT_WORKER_ID_REDIS_URL)
+    generator = SnowflakeGenerator(lease.acquire())
+    lease.keep(generator.set_worker_id)
+    return generator
+
+
+_generator = None
+_generator_pid = None
+_generator_lock = threading.Lock()
+
+
+def next_message_id():
+    # One generator, and so one lease, per process: a forked worker leases its own
+    global _generator, _generator_pid
+    if _generator_pid != os.getpid():
+        with _generator_lock:
+            if _generator_pid != os.getpid():
+                _generator = _create_generator()
+                _generator_pid = os.getpid()
+    return _generator.next_id()
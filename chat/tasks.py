@@ -0,0 +1,18 @@
+# chat/tasks.py
+
+import logging
+
+from celery import shared_task
+from channels.layers import get_channel_layer
+
+from chat.presence import expire_presence
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def expire_stale_presence():
+    offline = expire_presence(get_channel_layer())
+    if offline:
+        logger.info(f"[Presence] {len(offline)} profiles went offline after missing heartbeats")
+    return len(offline)
@@ -0,0 +1,113 @@
+import asyncio
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from chat.utils import group_room_name
+
+
+class TypingTracker:
+    """
+    Server-side typing state of this process, kept in memory (no DB access).
+
+    - A member's repeated typing-start events only renew their expiry. A
+      start is broadcast again at most once per `throttle` seconds.
+    - A member who stops sending typing events for `timeout` seconds gets an
+      automatic stop.
+    - Changes within `batch_window` seconds are sent as one chat.typing frame
+      per room, listing who started and who stopped typing.
+
+    Frames are deltas, so several processes can each announce their own
+    typists. Clients should also drop a typist after `expires_in` seconds
+    without a new start, in case the announcing process dies.
+    """
+
+    def __init__(self, throttle, timeout, batch_window):
+        self.throttle = throttle
+        self.timeout = timeout
+        self.batch_window = batch_window
+        self._reset(None)
+
+    def _reset(self, loop):
+        self._loop = loop
+        # chat_id -> {profile_id: {"username", "expires_at", "announced_at"}}
+        self._typing = {}
+        # chat_id -> {"started": {profile_id: username}, "stopped": {profile_id: username}}
+        self._pending = {}
+        self._flushes = {}
+        self._sweeper = None
+
+    def _bind_loop(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._reset(loop)
+
+    async def update(self, channel_layer, chat_id, profile_id, username, is_typing):
+        self._bind_loop()
+        now = time.monotonic()
+        # A stop must not leave an empty entry behind: the sweeper runs while there are any
+        state = self._typing.get(chat_id, {}).get(profile_id)
+
+        if is_typing:
+            if state and now - state["announced_at"] < self.throttle:
+                state["expires_at"] = now + self.timeout
+                return
+            typists = self._typing.setdefault(chat_id, {})
+            typists[profile_id] = {"username": username, "expires_at": now + self.timeout, "announced_at": now}
+            self._queue(channel_layer, chat_id, profile_id, username, started=True)
+            if self._sweeper is None or self._sweeper.done():
+                self._sweeper = asyncio.create_task(self._sweep(channel_layer))
+        elif state is not None:
+            self._remove(channel_layer, chat_id, profile_id)
+
+    def _remove(self, channel_layer, chat_id, profile_id):
+        typists = self._typing[chat_id]
+        state = typists.pop(profile_id)
+        if not typists:
+            del self._typing[chat_id]
+        self._queue(channel_layer, chat_id, profile_id, state["username"], started=False)
+
+    def _queue(self, channel_layer, chat_id, profile_id, username, started):
+        pending = self._pending.setdefault(chat_id, {"started": {}, "stopped": {}})
+        if started:
+            pending["stopped"].pop(profile_id, None)
+            pending["started"][profile_id] = username
+        elif pending["started"].pop(profile_id, None) is None:
+            # Only announce a stop for a start that was already sent
+            pending["stopped"][profile_id] = username
+
+        if chat_id not in self._flushes:
+            self._flushes[chat_id] = asyncio.create_task(self._flush_later(channel_layer, chat_id))
+
+    async def _flush_later(self, channel_layer, chat_id):
+        await asyncio.sleep(self.batch_window)
+        self._flushes.pop(chat_id, None)
+        pending = self._pending.pop(chat_id, None)
+        if not pending or not (pending["started"] or pending["stopped"]):
+            return
+
+        data = {
+            "started": [{"profile_id": pid, "username": name} for pid, name in pending["started"].items()],
+            "stopped": [{"profile_id": pid, "username": name} for pid, name in pending["stopped"].items()],
+            "expires_in": self.timeout,
+            "at": timezone.now().isoformat(),
+        }
+        await channel_layer.group_send(
+            group_room_name(chat_id), {"type": "chat.typing", "chat_id": str(chat_id), "data": data}
+        )
+
+    async def _sweep(self, channel_layer):
+        while self._typing:
+            await asyncio.sleep(min(1.0, self.timeout / 2))
+            now = time.monotonic()
+            for chat_id, typists in list(self._typing.items()):
+                for profile_id in [pid for pid, state in typists.items() if state["expires_at"] <= now]:
+                    self._remove(channel_layer, chat_id, profile_id)
+
+
+typing_tracker = TypingTracker(
+    throttle=getattr(settings, "CHAT_TYPING_THROTTLE", 3),
+    timeout=getattr(settings, "CHAT_TYPING_TIMEOUT", 6),
+    batch_window=getattr(settings, "CHAT_TYPING_BATCH_WINDOW", 0.3),
+)
@@ -1,12 +1,14 @@
 from django.urls import path
 from .views import (
-    EnsurePersonalChatAPIView, MyChatGroupsAPIView, GroupMessagesAPIView, SendMessageAPIView,
-    MarkAllMessagesReadAPIView, MarkMessagesReadByIdAPIView
+    EnsurePersonalChatAPIView, MyChatGroupsAPIView, ChatInboxAPIView, GroupMessagesAPIView, SendMessageAPIView,
+    MarkAllMessagesReadAPIView, MarkMessagesReadByIdAPIView, PresenceAPIView
 )
 
 urlpatterns = [
     path("personal-chat/<int:profile_id>/", EnsurePersonalChatAPIView.as_view()),
     path("my-groups/", MyChatGroupsAPIView.as_view()),
+    path("inbox/", ChatInboxAPIView.as_view()),
+    path("presence/", PresenceAPIView.as_view()),
     path("groups/messages/<str:group_id>/", GroupMessagesAPIView.as_view()),
     path("groups/<uuid:group_id>/messages/send/", SendMessageAPIView.as_view()),
     path("mark-read/all/<uuid:group_id>/", MarkAllMessagesReadAPIView.as_view(), name="mark_all_read"),
@@ -1,8 +1,26 @@
-from django.db.models import Q
-from django.db import transaction
-from chat.models import ChatGroup, ChatGroupMember, ChatMessage
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db.models import Count, F, Q, Window
+from django.db.models.functions import RowNumber
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from chat.models import ChatGroup, ChatGroupMember, ChatMessage, MessageReceipt, personal_pair_key
 from chat.choices import ChatType
 
+logger = logging.getLogger(__name__)
+
+
+def group_room_name(group_id) -> str:
+    return f"chat_{group_id}"
+
+
+def user_room_name(profile_id) -> str:
+    """Per-user stream joined by the multiplexed UserConsumer (notifications)."""
+    return f"user_{profile_id}"
+
+
 def get_or_create_personal_group(profile_a, profile_b):
     """
     Returns an existing personal group for these two profiles or creates a new one.
@@ -10,30 +28,176 @@ def get_or_create_personal_group(profile_a, profile_b):
     if profile_a.id == profile_b.id:
         raise ValueError("Cannot create a personal chat with yourself.")
 
-    # Try to find existing personal group with exactly these two members
-    candidate_groups = ChatGroup.objects.filter(type=ChatType.PERSONAL)
-    candidate_groups = candidate_groups.filter(
-        memberships__profile=profile_a
-    ).filter(
-        memberships__profile=profile_b
-    ).distinct()
-
-    group = candidate_groups.first()
+    pair_key = personal_pair_key(profile_a.id, profile_b.id)
+    group = ChatGroup.objects.filter(pair_key=pair_key).first()
     if group:
-        # sanity: ensure only two members for personal chat
         return group
 
-    with transaction.atomic():
-        # Check if they are friends
-        if not profile_a.friends.filter(id=profile_b.id).exists():
-            raise PermissionError("You can only start a personal chat with friends.")
-        group = ChatGroup.objects.create(type=ChatType.PERSONAL)
-        ChatGroupMember.objects.bulk_create([
-            ChatGroupMember(group=group, profile=profile_a),
-            ChatGroupMember(group=group, profile=profile_b),
-        ])
+    # Check if they are friends
+    if not profile_a.friends.filter(id=profile_b.id).exists():
+        raise PermissionError("You can only start a personal chat with friends.")
+
+    try:
+        with transaction.atomic():
+            group = ChatGroup.objects.create(type=ChatType.PERSONAL, pair_key=pair_key)
+            ChatGroupMember.objects.bulk_create([
+                ChatGroupMember(group=group, profile=profile_a),
+                ChatGroupMember(group=group, profile=profile_b),
+            ])
+    except IntegrityError:
+        # A concurrent request created the chat first
+        group = ChatGroup.objects.get(pair_key=pair_key)
     return group
 
 
 def is_group_member(group, profile):
     return group.memberships.filter(profile=profile).exists()
+
+
+def mark_messages_read(group, profile, up_to_message_id=None):
+    """
+    Moves the member's read watermark forward to `up_to_message_id`
+    (latest message of the chat when None). Group chats only store the
+    watermark; personal chats also get receipts for the newly read messages.
+
+    Returns the read event to broadcast, or None when nothing changed.
+    """
+    messages = ChatMessage.objects.filter(group=group)
+    if up_to_message_id is not None:
+        messages = messages.filter(id__lte=up_to_message_id)
+    up_to = messages.order_by("-id").values_list("id", flat=True).first()
+    if up_to is None:
+        return None
+
+    membership = ChatGroupMember.objects.filter(group=group, profile=profile).values_list(
+        "last_read_message_id", flat=True
+    ).first()
+    previous = membership or 0
+    now = timezone.now()
+
+    # Only ever advance the watermark, concurrent readers cannot move it back
+    moved = ChatGroupMember.objects.filter(group=group, profile=profile).filter(
+        Q(last_read_message_id__isnull=True) | Q(last_read_message_id__lt=up_to)
+    ).update(last_read_message_id=up_to, last_read_at=now)
+    if not moved:
+        return None
+
+    receipts = []
+    if group.type == ChatType.PERSONAL:
+        newly_read = list(messages.filter(id__gt=previous).exclude(sender=profile).values_list("id", flat=True))
+        MessageReceipt.objects.bulk_create(
+            [MessageReceipt(message_id=message_id, user=profile, is_seen=True, seen_at=now) for message_id in newly_read],
+            ignore_conflicts=True,
+        )
+        receipts = [
+            {"message_id": message_id, "profile_id": profile.id, "seen_at": now.isoformat()}
+            for message_id in newly_read
+        ]
+
+    return {
+        "profile_id": profile.id,
+        "previous_read_message_id": membership,
+        "last_read_message_id": up_to,
+        "seen_at": now.isoformat(),
+        "receipts": receipts,
+    }
+
+
+def get_unread_messages(membership):
+    """
+    Messages of the member's chat above their read watermark.
+    Falls back to last_read_at for memberships read before watermarks existed.
+    """
+    messages = ChatMessage.objects.filter(
+        group_id=membership.group_id, is_deleted=False
+    ).exclude(sender_id=membership.profile_id)
+
+    if membership.last_read_message_id is not None:
+        return messages.filter(id__gt=membership.last_read_message_id)
+    if membership.last_read_at is not None:
+        return messages.filter(created_at__gt=membership.last_read_at)
+    return messages
+
+
+def get_inbox_summaries(chat_groups, profile):
+    """
+    Inbox data for a page of the profile's chats, in a fixed number of queries
+    whatever the page size:
+      - last message of every chat (ROW_NUMBER() window over the page's chats)
+      - unread count per chat, relative to the member's read watermark
+        (last_read_at for memberships that have none yet)
+      - the other member of every personal chat
+
+    Returns {chat_group_id: {"last_message", "unread_count", "other_member"}}.
+    """
+    group_ids = [chat_group.id for chat_group in chat_groups]
+    summaries = {
+        group_id: {"last_message": None, "unread_count": 0, "other_member": None}
+        for group_id in group_ids
+    }
+    if not group_ids:
+        return summaries
+
+    last_messages = ChatMessage.objects.filter(
+        group_id__in=group_ids, is_deleted=False
+    ).annotate(
+        position=Window(RowNumber(), partition_by=[F("group_id")], order_by=F("id").desc())
+    ).filter(position=1).select_related("sender")
+    for message in last_messages:
+        summaries[message.group_id]["last_message"] = message
+
+    # A single filter() call so every condition uses the same membership join
+    unread = ChatMessage.objects.filter(
+        Q(group__memberships__last_read_message_id__isnull=False, id__gt=F("group__memberships__last_read_message_id")) |
+        Q(group__memberships__last_read_message_id__isnull=True, group__memberships__last_read_at__isnull=True) |
+        Q(group__memberships__last_read_message_id__isnull=True, created_at__gt=F("group__memberships__last_read_at")),
+        group_id__in=group_ids,
+        group__memberships__profile=profile,
+        is_deleted=False,
+    ).exclude(sender=profile).values("group_id").annotate(count=Count("id")).order_by()
+    for row in unread:
+        summaries[row["group_id"]]["unread_count"] = row["count"]
+
+    personal_ids = [chat_group.id for chat_group in chat_groups if chat_group.type == ChatType.PERSONAL]
+    if personal_ids:
+        others = ChatGroupMember.objects.filter(group_id__in=personal_ids).exclude(
+            profile=profile
+        ).select_related("profile")
+        for membership in others:
+            summaries[membership.group_id]["other_member"] = membership.profile
+
+    return summaries
+
+
+def get_seen_by(message):
+    """Members whose read watermark covers the message (sender excluded)."""
+    return ChatGroupMember.objects.filter(
+        group_id=message.group_id, last_read_message_id__gte=message.id
+    ).exclude(profile_id=message.sender_id)
+
+
+def notify_chat_member_removed(chat_group_id, profile_id):
+    """
+    Tells open ChatConsumer connections of the room that `profile_id` is no
+    longer a member, so they close instead of re-checking on every message.
+    """
+    try:
+        channel_layer = get_channel_layer()
+        async_to_sync(channel_layer.group_send)(
+            group_room_name(chat_group_id),
+            {"type": "chat.member_removed", "chat_id": str(chat_group_id), "profile_id": profile_id},
+        )
+    except Exception as e:
+        logger.warning(f"[notify_chat_member_removed] Could not reach channel layer: {e}")
+
+
+def push_to_user(profile_id, event_type, data):
+    """Sends an event to the profile's open UserConsumer sockets."""
+    try:
+        channel_layer = get_channel_layer()
+        async_to_sync(channel_layer.group_send)(
+            user_room_name(profile_id),
+            {"type": event_type, "data": data},
+        )
+    except Exception as e:
+        logger.warning(f"[push_to_user] Could not reach channel layer: {e}")
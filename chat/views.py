@@ -2,7 +2,7 @@
 from django.shortcuts import get_object_or_404
 from django.db import transaction
 from django.utils import timezone
-from django.db.models import Q
+from django.db.models import F, Prefetch, Q
 from django.http import Http404
 
 from rest_framework.views import APIView
@@ -13,10 +13,12 @@ from rest_framework.exceptions import PermissionDenied
 
 from core.services import success_response, error_response, get_user_profile
 from chat.models import ChatGroup, ChatGroupMember, ChatMessage, MessageReceipt
-from chat.serializers import ChatGroupSerializer, ChatMessageSerializer
+from chat.serializers import ChatGroupSerializer, ChatInboxSerializer, ChatMessageSerializer
 from chat.permissions import IsChatMember
-from chat.utils import get_or_create_personal_group, is_group_member
+from chat.utils import get_inbox_summaries, get_or_create_personal_group, is_group_member, mark_messages_read
 from chat.choices import ChatType
+from chat.buffers import last_message_at_buffer
+from chat.presence import get_online_profile_ids_sync
 from profiles.models import Profile
 from core.pagination import PaginationMixin
 
@@ -55,6 +57,9 @@ class MyChatGroupsAPIView(APIView, PaginationMixin):
         profile = get_user_profile(request.user)
         q = request.query_params.get("q")
 
+        # Make this process's pending last_message_at writes visible to the ordering
+        last_message_at_buffer.flush()
+
         groups = ChatGroup.objects.filter(
             memberships__profile=profile, type=ChatType.GROUP
         ).order_by("-last_message_at", "-created_at").distinct()
@@ -71,12 +76,44 @@ class MyChatGroupsAPIView(APIView, PaginationMixin):
         return self.get_paginated_response(serializer.data)
 
 
-class GroupMessagesAPIView(APIView, PaginationMixin):
+class ChatInboxAPIView(APIView, PaginationMixin):
+    """
+    GET /api/chat/inbox/?type=personal|group
+    Personal and group chats of the current user, most recent first, each with
+    its last message, unread count and (for personal chats) the other member.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        profile = get_user_profile(request.user)
+        chat_type = request.query_params.get("type")
+
+        # Make this process's pending last_message_at writes visible to the ordering
+        last_message_at_buffer.flush()
+
+        chat_groups = ChatGroup.objects.filter(memberships__profile=profile).select_related(
+            "group"
+        ).order_by(F("last_message_at").desc(nulls_last=True), "-created_at")
+        if chat_type in ChatType.values:
+            chat_groups = chat_groups.filter(type=chat_type)
+
+        page = self.paginate_queryset(chat_groups, request)
+        serializer = ChatInboxSerializer(
+            page, many=True, context={"request": request, "summaries": get_inbox_summaries(page, profile)}
+        )
+        return self.get_paginated_response(serializer.data)
+
+
+class GroupMessagesAPIView(APIView):
     """
-    GET /api/chat/groups/<uuid:group_id>/messages/?before=<id>&after=<id>
-    Returns paginated messages for a group. (Newest first by default)
+    GET /api/chat/groups/<uuid:group_id>/messages/?before=<id>&after=<id>&limit=<n>
+    Returns a page of messages for a group, newest first (oldest first with `after`).
+    Keyset pagination on the message id: pass `next_before` / `next_after` from the
+    response to continue, no COUNT(*) over the chat history.
     """
     permission_classes = [IsAuthenticated, IsChatMember]
+    default_limit = 30
+    max_limit = 100
 
     def get(self, request, group_id):
         try:
@@ -85,9 +122,12 @@ class GroupMessagesAPIView(APIView, PaginationMixin):
 
             before_id = request.query_params.get("before")
             after_id = request.query_params.get("after")
+            limit = max(1, min(int(request.query_params.get("limit", self.default_limit)), self.max_limit))
 
             messages = ChatMessage.objects.filter(group=group, is_deleted=False).select_related(
-                "sender__user"
+                "sender"
+            ).prefetch_related(
+                Prefetch("receipts", queryset=MessageReceipt.objects.select_related("user"))
             ).order_by("-id")
 
             if before_id:
@@ -95,9 +135,25 @@ class GroupMessagesAPIView(APIView, PaginationMixin):
             if after_id:
                 messages = messages.filter(id__gt=after_id).order_by("id")
 
-            page = self.paginate_queryset(messages, request)
-            serializer = ChatMessageSerializer(page, many=True, context={"request": request})
-            return self.get_paginated_response(serializer.data)
+            # One extra row tells whether there is another page
+            page = list(messages[:limit + 1])
+            has_more = len(page) > limit
+            page = page[:limit]
+
+            read_watermarks = list(group.memberships.values_list("profile_id", "last_read_message_id"))
+            serializer = ChatMessageSerializer(
+                page, many=True, context={"request": request, "read_watermarks": read_watermarks}
+            )
+            ids = [message.id for message in page]
+            return Response({
+                "status": True,
+                "has_more": has_more,
+                "next_before": min(ids) if ids else None,
+                "next_after": max(ids) if ids else None,
+                "data": serializer.data,
+            })
+        except (TypeError, ValueError):
+            return Response(error_response("before, after and limit must be integers"), status=400)
         except Http404 as e:
             return Response(error_response(str(e)),status=404)
         except Exception as e:
@@ -137,35 +193,30 @@ class SendMessageAPIView(APIView):
             return Response(error_response(str(e)), status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+def _read_result(group, profile, read):
+    """Response payload for the REST mark-read endpoints."""
+    if not read:
+        return {"read_count": 0, "last_read_message_id": None}
+    read_count = ChatMessage.objects.filter(
+        group=group,
+        id__gt=read["previous_read_message_id"] or 0,
+        id__lte=read["last_read_message_id"],
+    ).exclude(sender=profile).count()
+    return {"read_count": read_count, "last_read_message_id": read["last_read_message_id"]}
+
+
 class MarkAllMessagesReadAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request, group_id):
         profile = get_user_profile(request.user)
-        now = timezone.now()
 
         try:
-            with transaction.atomic():
-                # Get unseen messages in this chat (excluding own)
-                unseen_messages = ChatMessage.objects.filter(
-                    group_id=group_id
-                ).exclude(sender=profile).exclude(
-                    receipts__user=profile
-                )
-
-                receipts = [
-                    MessageReceipt(message=msg, user=profile, is_seen=True, seen_at=now)
-                    for msg in unseen_messages
-                ]
-                MessageReceipt.objects.bulk_create(receipts, ignore_conflicts=True)
-
-                # Update membership last_read_at
-                ChatGroupMember.objects.filter(
-                    group_id=group_id, profile=profile
-                ).update(last_read_at=now)
+            group = ChatGroup.objects.get(id=group_id)
+            read = mark_messages_read(group, profile)
 
             return Response(success_response(
-                {"read_count": len(receipts)}, 
+                _read_result(group, profile, read),
                 "All unread messages marked as read"
             ))
 
@@ -176,44 +227,50 @@ class MarkAllMessagesReadAPIView(APIView):
 
 
 class MarkMessagesReadByIdAPIView(APIView):
+    """
+    Marks the chat as read up to the newest of the given message ids.
+    """
     permission_classes = [IsAuthenticated]
 
     def post(self, request, group_id):
         profile = get_user_profile(request.user)
-        now = timezone.now()
         message_ids = request.data.get("message_ids", [])
 
         if not isinstance(message_ids, list) or not message_ids:
             return Response(error_response("message_ids must be a non-empty list"), status=400)
 
         try:
-            with transaction.atomic():
-                # Get only given messages from this group
-                target_messages = ChatMessage.objects.filter(
-                    group_id=group_id, id__in=message_ids
-                ).exclude(sender=profile).exclude(
-                    receipts__user=profile
-                )
-
-                receipts = [
-                    MessageReceipt(message=msg, user=profile, is_seen=True, seen_at=now)
-                    for msg in target_messages
-                ]
-                MessageReceipt.objects.bulk_create(receipts, ignore_conflicts=True)
-
-                # Optional: update last_read_at if the latest marked message is newer
-                latest_msg = target_messages.order_by("-created_at").first()
-                if latest_msg:
-                    ChatGroupMember.objects.filter(
-                        group_id=group_id, profile=profile
-                    ).update(last_read_at=now)
+            group = ChatGroup.objects.get(id=group_id)
+            read = mark_messages_read(group, profile, max(int(i) for i in message_ids))
 
             return Response(success_response(
-                {"read_count": len(receipts)}, 
+                _read_result(group, profile, read),
                 "Selected messages marked as read"
             ))
 
+        except (TypeError, ValueError):
+            return Response(error_response("message_ids must be a list of integers"), status=400)
         except ChatGroup.DoesNotExist:
             return Response(error_response("Chat group not found"), status=404)
         except Exception as e:
             return Response(error_response(str(e)), status=500)
+
+
+class PresenceAPIView(APIView):
+    """
+    GET /api/chat/presence/?ids=1,2,3
+    Which of the given profiles are online right now.
+    """
+    permission_classes = [IsAuthenticated]
+    max_ids = 500
+
+    def get(self, request):
+        try:
+            profile_ids = [int(i) for i in request.query_params.get("ids", "").split(",") if i.strip()]
+        except ValueError:
+            return Response(error_response("ids must be a comma separated list of integers"), status=400)
+        if len(profile_ids) > self.max_ids:
+            return Response(error_response(f"At most {self.max_ids} ids per request"), status=400)
+
+        online = get_online_profile_ids_sync(profile_ids)
+        return Response(success_response({"online": sorted(online)}))
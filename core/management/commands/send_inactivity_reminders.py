@@ -1,18 +1,51 @@
-from django.core.management.base import BaseCommand
-from django.utils import timezone
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
 from django.db.models import Q
+from django.utils import timezone
 
-from profiles.models import Profile  
-from django.core.mail import send_mail
-from core.utils import get_inactivity_email_context, get_user
+from profiles.models import Profile
+from core.utils import get_inactivity_email_context, get_inactivity_shared_context, get_user
 from core.services import send_dynamic_email_using_template
+from notification.task_monitor import report_items_processed
+
+
+def send_reminder_batch(batch):
+    """
+    Sends one batch of reminder emails from a pool thread.
+    Returns the ids of profiles whose email went out and the per-email log lines.
+    """
+    sent_ids = []
+    log_lines = []
+    try:
+        for profile_id, email_to, context in batch:
+            success, msg = send_dynamic_email_using_template(
+                template_name="inactivity-reminder",
+                recipient_list=[email_to],
+                context=context,
+            )
+            log_lines.append((success, f"email to {email_to} was {success} {msg}"))
+            if success:
+                sent_ids.append(profile_id)
+    finally:
+        # Each pool thread holds its own DB connection (template lookups)
+        connection.close()
+    return sent_ids, log_lines
 
 
 class Command(BaseCommand):
     help = 'Send reminder emails to inactive users'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Parallel mail sender threads')
+        parser.add_argument('--batch-size', type=int, default=100, help='Emails handed to a sender thread at a time')
+
     def handle(self, *args, **kwargs):
+        workers = max(1, kwargs.get('workers') or 1)
+        batch_size = max(1, kwargs.get('batch_size') or 1)
+
         now = timezone.now()
         cutoff = now - timedelta(hours=48)
         eligible_profiles = Profile.objects.filter(
@@ -21,20 +54,48 @@ class Command(BaseCommand):
             Q(last_active_at__lt=cutoff) | Q(last_active_at__isnull=True)
         ).exclude(
             last_reminder_sent_at__gte=cutoff
+        ).select_related(
+            'user', 'organization__user'
+        ).only(
+            'id', 'username', 'user', 'user__email', 'organization', 'organization__user', 'organization__user__email'
         )
 
-        for profile in eligible_profiles:
-            # suggestions = get_suggested_content(profile)
-            context = get_inactivity_email_context(profile)
-            email_to = get_user(profile).email
-            success, msg = send_dynamic_email_using_template(
-                template_name="inactivity-reminder",
-                recipient_list=[email_to],
-                context=context,
-            )
-            self.stdout.write(self.style.SUCCESS(f"email to {email_to} was {success} {msg}"))
-            if success:
-                profile.last_reminder_sent_at = now
-                profile.save(update_fields=['last_reminder_sent_at'])
+        # Same challenge and top posts for everyone in this run
+        shared_context = get_inactivity_shared_context()
+
+        sent_ids = []
+        pending = set()
+
+        def collect(done):
+            for future in done:
+                batch_sent, log_lines = future.result()
+                sent_ids.extend(batch_sent)
+                for success, line in log_lines:
+                    self.stdout.write(self.style.SUCCESS(line) if success else line)
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            batch = []
+            for profile in eligible_profiles.iterator(chunk_size=batch_size * workers):
+                user = get_user(profile)
+                if not user or not user.email:
+                    continue
+                context = get_inactivity_email_context(profile, shared_context)
+                batch.append((profile.id, user.email, context))
+
+                if len(batch) >= batch_size:
+                    pending.add(pool.submit(send_reminder_batch, batch))
+                    batch = []
+                    # Keep at most two batches per worker in flight
+                    if len(pending) >= workers * 2:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        collect(done)
+
+            if batch:
+                pending.add(pool.submit(send_reminder_batch, batch))
+            collect(wait(pending).done)
+
+        if sent_ids:
+            Profile.objects.filter(id__in=sent_ids).update(last_reminder_sent_at=now)
+        report_items_processed(len(sent_ids))
 
-        self.stdout.write(self.style.SUCCESS(f"Sent {eligible_profiles.count()} reminders"))
+        self.stdout.write(self.style.SUCCESS(f"Sent {len(sent_ids)} reminders"))
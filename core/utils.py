@@ -74,24 +74,35 @@ def update_last_active(profile):
     profile.last_active_at = timezone.now()
     profile.save(update_fields=["last_active_at"])
 
-def get_inactivity_email_context(profile):
+def get_inactivity_shared_context():
+    """
+    Context shared by every inactivity reminder in a run (active challenge and
+    top posts). Compute once and pass to get_inactivity_email_context.
+    """
     
     # To avoid circular import error
     from post.models import Post
-    
-    user_name = profile.username or "Artist"
-    challenge = WeeklyChallenge.objects.filter(is_active=True).first()
+
+    challenge = WeeklyChallenge.objects.filter(is_active=True).only('hashtag').first()
     challenge_hashtag = challenge.hashtag if challenge else "weeklychallenge"
 
-    top_posts = Post.objects.filter(status='published').order_by('-reaction_count')[:3]
+    top_posts = Post.objects.filter(status='published').only('title', 'caption').order_by('-reaction_count')[:3]
     top_titles = [p.title or p.caption[:40] for p in top_posts]
 
     return {
-        "user_name": user_name,
         "challenge_hashtag": challenge_hashtag,
         "top_posts": top_titles,
     }
 
+def get_inactivity_email_context(profile, shared_context=None):
+    if shared_context is None:
+        shared_context = get_inactivity_shared_context()
+
+    return {
+        "user_name": profile.username or "Artist",
+        **shared_context,
+    }
+
 
 # Helper: get file extension
 def get_extension(file):
@@ -43,6 +43,14 @@ app.conf.beat_schedule = {
         'task': 'event.tasks.mark_completed_events_and_notify',
         'schedule': crontab(minute=0), #Runs every 1 hour
     },
+    'rollup-event-activity-every-10-minutes': {
+        'task': 'event.tasks.rollup_event_activity_task',
+        'schedule': crontab(minute='*/10'),
+    },
+    'fail-stale-attendance-exports-every-15-minutes': {
+        'task': 'event.tasks.fail_stale_attendance_exports',
+        'schedule': crontab(minute='*/15'),
+    },
     'trigger_event_analytics_for_all_events':{
         'task':'event.tasks.trigger_event_analytics_for_all_events',
         'schedule': crontab(minute=0, hour='0'),
@@ -59,6 +67,10 @@ app.conf.beat_schedule = {
         'task': 'group.task.send_weekly_group_digest',
         'schedule': crontab(hour=8, minute=0, day_of_week=1),  # Every week at 8:00 AM on Monday
     },
+    'expire-stale-chat-presence-every-minute': {
+        'task': 'chat.tasks.expire_stale_presence',
+        'schedule': crontab(),  # Every minute
+    },
     "delete-old-group-action-logs-daily": {
         "task": "groups.task.delete_old_group_action_logs",
         "schedule": crontab(hour=0, minute=0),  # Runs daily at midnight
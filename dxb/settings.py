@@ -265,6 +265,10 @@ CELERY_TIMEZONE = 'Asia/Kolkata'
 CELERY_RESULT_BACKEND = 'django-db'
 CELERY_CACHE_BACKEND = 'default'
 
+# Where single_instance_task keeps its locks: "database", "cache" (needs a
+# shared cache such as Redis) or "local" (single process / tests)
+TASK_LOCK_STORE = os.environ.get('TASK_LOCK_STORE', 'database')
+
 
 
 LOGGING = {
@@ -332,6 +336,28 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Seconds between coalesced ChatGroup.last_message_at writes (0 = write on every message)
+CHAT_LAST_MESSAGE_FLUSH_INTERVAL = float(os.environ.get('CHAT_LAST_MESSAGE_FLUSH_INTERVAL', 0.25))
+
+# Write-behind for WebSocket messages: broadcast first, bulk insert in batches (see chat.buffers).
+# Message ids become time-ordered snowflake ids (see chat.snowflake): keep it on once enabled. Every process
+# minting them leases its own worker id in the Redis at CHAT_WORKER_ID_REDIS_URL.
+CHAT_WRITE_BEHIND = os.environ.get('CHAT_WRITE_BEHIND', 'False') == 'True'
+CHAT_WRITE_BEHIND_BATCH_SIZE = int(os.environ.get('CHAT_WRITE_BEHIND_BATCH_SIZE', 200))
+CHAT_WRITE_BEHIND_INTERVAL = float(os.environ.get('CHAT_WRITE_BEHIND_INTERVAL', 0.05))
+CHAT_WORKER_ID_REDIS_URL = os.environ.get('CHAT_WORKER_ID_REDIS_URL', 'redis://127.0.0.1:6379/0')
+
+# Typing indicators (see chat.typing): re-announce at most every THROTTLE s, auto-stop after TIMEOUT s
+CHAT_TYPING_THROTTLE = float(os.environ.get('CHAT_TYPING_THROTTLE', 3))
+CHAT_TYPING_TIMEOUT = float(os.environ.get('CHAT_TYPING_TIMEOUT', 6))
+CHAT_TYPING_BATCH_WINDOW = float(os.environ.get('CHAT_TYPING_BATCH_WINDOW', 0.3))
+
+# Online presence (see chat.presence): 'redis' shared by all processes, 'memory' for tests.
+# Connections not heard from (connect/heartbeat) for PRESENCE_TIMEOUT seconds count as gone.
+PRESENCE_BACKEND = os.environ.get('PRESENCE_BACKEND', 'redis')
+PRESENCE_REDIS_URL = os.environ.get('PRESENCE_REDIS_URL', 'redis://127.0.0.1:6379/0')
+PRESENCE_TIMEOUT = int(os.environ.get('PRESENCE_TIMEOUT', 90))
+
 GOOGLE_CLIENT_ID = os.environ.get('GOOGLE_CLIENT_ID', '')
 
 # Google oauth client
@@ -0,0 +1,179 @@
+"""
+Event analytics from pre-aggregated rollups.
+
+rollup_event_activity() folds new EventActivityLog and EventComment rows into
+EventActivityHourly / EventCommenterStat, starting after the last row id it
+processed (EventRollupWatermark). It runs every few minutes, so each run
+only reads the rows added since the last one. get_events_analytics() reads
+the rollups and the Event RSVP counters, so its cost grows with the number
+of active hours of the events, not with their raw activity. Deleted rows
+that were already rolled up are taken back out (unroll_deleted_row, from
+post_delete), so the rollups keep matching the source tables.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, Sum, Value, Window
+from django.db.models.functions import ExtractHour, Greatest, RowNumber, TruncHour
+from django.utils import timezone
+
+from event.choices import EventActivityType
+from event.models import (
+    EventActivityHourly, EventActivityLog, EventComment, EventCommenterStat, EventRollupWatermark,
+    RSVP_COUNTER_FIELDS
+)
+
+# Rows newer than this may still have lower-id neighbours in open
+# transactions; they are left for the next run so none is skipped.
+ROLLUP_SETTLE_DELAY = timedelta(minutes=1)
+# EventRollupWatermark.source of each rolled up table
+ACTIVITY_LOG_SOURCE = 'event_activity_log'
+COMMENT_SOURCE = 'event_comment'
+
+
+def _rollup_batch(source, queryset, time_field, activity_type, count_commenters, before, batch_size):
+    with transaction.atomic():
+        watermark, _ = EventRollupWatermark.objects.get_or_create(source=source)
+        watermark = EventRollupWatermark.objects.select_for_update().get(id=watermark.id)
+
+        ids = list(
+            queryset.filter(id__gt=watermark.last_id, **{f"{time_field}__lt": before})
+            .order_by('id').values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return 0
+        rows = queryset.filter(id__gt=watermark.last_id, id__lte=ids[-1])
+
+        hourly = (
+            rows.annotate(hour=TruncHour(time_field), type=activity_type)
+            .values('event_id', 'type', 'hour').annotate(n=Count('id')).order_by()
+        )
+        _merge_counts(
+            EventActivityHourly, ('event_id', 'activity_type', 'hour'), 'count',
+            {(row['event_id'], row['type'], row['hour']): row['n'] for row in hourly},
+        )
+        if count_commenters:
+            commenters = rows.values('event_id', 'profile_id').annotate(n=Count('id')).order_by()
+            _merge_counts(
+                EventCommenterStat, ('event_id', 'profile_id'), 'comment_count',
+                {(row['event_id'], row['profile_id']): row['n'] for row in commenters},
+            )
+
+        watermark.last_id = ids[-1]
+        watermark.save(update_fields=['last_id', 'updated_at'])
+        return len(ids)
+
+
+def _merge_counts(model, key_fields, count_field, increments):
+    """Adds `increments` {key tuple: n} to the matching rows of `model`, creating missing ones."""
+    if not increments:
+        return
+    existing = {}
+    lookups = {f"{field}__in": {key[i] for key in increments} for i, field in enumerate(key_fields)}
+    for obj in model.objects.filter(**lookups):
+        key = tuple(getattr(obj, field) for field in key_fields)
+        if key in increments:
+            existing[key] = obj
+
+    to_update, to_create = [], []
+    for key, n in increments.items():
+        obj = existing.get(key)
+        if obj is not None:
+            setattr(obj, count_field, getattr(obj, count_field) + n)
+            to_update.append(obj)
+        else:
+            to_create.append(model(**dict(zip(key_fields, key)), **{count_field: n}))
+    model.objects.bulk_update(to_update, [count_field], batch_size=1000)
+    model.objects.bulk_create(to_create, batch_size=1000)
+
+
+def rollup_event_activity(batch_size=5000):
+    """Rolls up everything added since the last run. Returns the number of source rows processed."""
+    before = timezone.now() - ROLLUP_SETTLE_DELAY
+    sources = [
+        (ACTIVITY_LOG_SOURCE, EventActivityLog.objects.all(), 'timestamp', F('activity_type'), False),
+        (COMMENT_SOURCE, EventComment.objects.all(), 'created_at', Value(EventActivityType.COMMENT), True),
+    ]
+    processed = 0
+    for source, queryset, time_field, activity_type, count_commenters in sources:
+        while True:
+            done = _rollup_batch(source, queryset, time_field, activity_type, count_commenters, before, batch_size)
+            processed += done
+            if done < batch_size:
+                break
+    return processed
+
+
+def unroll_deleted_row(source, row_id, event_id, activity_type, at, commenter_id=None):
+    """
+    Takes a deleted source row out of the rollups if a run already counted
+    it (row_id up to the watermark). The watermark row is locked, so a run
+    in progress commits first: the row is counted and taken out, or never
+    counted at all.
+    """
+    with transaction.atomic():
+        watermark = EventRollupWatermark.objects.select_for_update().filter(source=source).first()
+        if watermark is None or row_id > watermark.last_id:
+            return
+        # Same hour as TruncHour in the current time zone
+        hour = timezone.localtime(at).replace(minute=0, second=0, microsecond=0)
+        EventActivityHourly.objects.filter(event_id=event_id, activity_type=activity_type, hour=hour).update(
+            count=Greatest(F('count') - 1, 0)
+        )
+        if commenter_id is not None:
+            stats = EventCommenterStat.objects.filter(event_id=event_id, profile_id=commenter_id)
+            stats.update(comment_count=Greatest(F('comment_count') - 1, 0))
+            stats.filter(comment_count=0).delete()
+
+
+def get_events_analytics(events):
+    """
+    {event_id: analytics} for many events in three grouped queries: reach,
+    RSVP breakdown and rate, peak engagement hour and top commenters. Reads
+    the rollups, so activity of the last few minutes may not be counted yet.
+    """
+    event_ids = [event.id for event in events]
+    hourly = EventActivityHourly.objects.filter(event_id__in=event_ids)
+
+    # EventActivityLog holds one view per profile, so the views are the reach
+    reach = dict(
+        hourly.filter(activity_type=EventActivityType.VIEW)
+        .values('event_id').annotate(total=Sum('count')).order_by().values_list('event_id', 'total')
+    )
+
+    peaks = {}
+    for row in (
+        hourly.filter(activity_type__in=[EventActivityType.VIEW, EventActivityType.COMMENT])
+        .annotate(hour_of_day=ExtractHour('hour')).values('event_id', 'hour_of_day')
+        .annotate(total=Sum('count')).order_by('event_id', '-total', 'hour_of_day')
+    ):
+        peaks.setdefault(row['event_id'], {"hour": row['hour_of_day'], "total": row['total']})
+
+    top_commenters = {event_id: [] for event_id in event_ids}
+    for row in (
+        EventCommenterStat.objects.filter(event_id__in=event_ids)
+        .annotate(rank=Window(
+            RowNumber(), partition_by=[F('event_id')], order_by=[F('comment_count').desc(), F('profile_id').asc()]
+        ))
+        .filter(rank__lte=5).order_by('event_id', 'rank')
+        .values('event_id', 'profile__username', total_comments=F('comment_count'))
+    ):
+        event_id = row.pop('event_id')
+        top_commenters[event_id].append(row)
+
+    analytics = {}
+    for event in events:
+        event_reach = reach.get(event.id, 0)
+        rsvp_rate = (event.attendee_count / event_reach * 100) if event_reach > 0 else 0
+        analytics[event.id] = {
+            "reach": event_reach,
+            "rsvp_counts": {status: getattr(event, field) for status, field in RSVP_COUNTER_FIELDS.items()},
+            "rsvp_rate": round(rsvp_rate, 2),
+            "peak_engagement_hour": peaks.get(event.id),
+            "top_commenters": top_commenters[event.id],
+        }
+    return analytics
+
+
+def get_event_analytics(event):
+    return get_events_analytics([event])[event.id]
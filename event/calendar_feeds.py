@@ -0,0 +1,179 @@
+"""
+iCalendar (.ics) subscription feeds: one per profile (hosted, co-hosted and
+RSVP'd events) and one per group (the group's events).
+
+Calendar clients poll feeds often and cannot log in, so a feed URL carries a
+signed token. Each feed has a version kept in the cache: the time it last
+changed. ETag and Last-Modified are derived from that version, which makes a
+conditional GET a single cache read. Signals (event.signals) bump the
+version when an event, its co-hosts or an RSVP change. A changed feed is
+rebuilt from per-event VEVENT blocks, themselves cached by event id and
+updated_at, so only the events that changed are rendered again.
+"""
+import hashlib
+import time
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+
+from event.choices import AttendanceStatus, EventStatus
+from event.models import Event
+
+FEED_TOKEN_SALT = 'event.calendar-feed'
+FEED_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+# Past events kept in a feed
+FEED_PAST_DAYS = 90
+FEED_RSVP_STATUSES = [AttendanceStatus.INTERESTED, AttendanceStatus.PENDING]
+FEED_EVENT_STATUSES = [EventStatus.PUBLISHED, EventStatus.COMPLETED, EventStatus.CANCELLED]
+
+# Event fields rendered in a VEVENT or deciding which feeds list the event
+FEED_SOURCE_FIELDS = {
+    'title', 'description', 'status', 'start_datetime', 'end_datetime', 'is_online', 'address', 'online_link',
+    'slug', 'host', 'group',
+}
+
+PROFILE_FEED = 'profile'
+GROUP_FEED = 'group'
+
+
+def make_feed_token(kind, object_id):
+    return signing.dumps([kind, object_id], salt=FEED_TOKEN_SALT)
+
+
+def read_feed_token(token):
+    """(kind, object_id) of a feed token, or None when it was tampered with."""
+    try:
+        kind, object_id = signing.loads(token, salt=FEED_TOKEN_SALT)
+    except (signing.BadSignature, ValueError, TypeError):
+        return None
+    return kind, object_id
+
+
+def _version_key(kind, object_id):
+    return f"ics:{kind}:{object_id}:version"
+
+
+def get_feed_version(kind, object_id):
+    """Time of the last change of the feed; set to now when unknown (first poll or evicted)."""
+    key = _version_key(kind, object_id)
+    version = cache.get(key)
+    if version is None:
+        version = time.time()
+        if not cache.add(key, version, FEED_CACHE_TIMEOUT):
+            version = cache.get(key, version)
+    return version
+
+
+def invalidate_feeds(profile_ids=(), group_ids=()):
+    """Marks the given profile and group feeds as changed."""
+    now = time.time()
+    keys = {_version_key(PROFILE_FEED, pid): now for pid in profile_ids if pid}
+    keys.update({_version_key(GROUP_FEED, gid): now for gid in group_ids if gid})
+    if keys:
+        cache.set_many(keys, FEED_CACHE_TIMEOUT)
+
+
+def feed_etag(kind, object_id, version):
+    return hashlib.md5(f"{kind}:{object_id}:{version}".encode()).hexdigest()
+
+
+def feed_events(kind, object_id):
+    events = Event.objects.filter(
+        status__in=FEED_EVENT_STATUSES,
+        end_datetime__gte=timezone.now() - timedelta(days=FEED_PAST_DAYS),
+    )
+    if kind == PROFILE_FEED:
+        events = events.filter(
+            Q(host_id=object_id) |
+            Q(co_hosts__id=object_id) |
+            Q(eventattendance__profile_id=object_id, eventattendance__status__in=FEED_RSVP_STATUSES)
+        ).distinct()
+    else:
+        events = events.filter(group_id=object_id)
+    return events.order_by('start_datetime')
+
+
+def get_feed_body(kind, object_id, version):
+    """The rendered feed for this version, from the cache when possible."""
+    key = f"ics:{kind}:{object_id}:body:{version}"
+    body = cache.get(key)
+    if body is None:
+        body = render_feed(feed_events(kind, object_id), name=f"{kind.title()} events")
+        cache.set(key, body, FEED_CACHE_TIMEOUT)
+    return body
+
+
+def render_feed(events, name):
+    events = list(events.only(
+        'id', 'title', 'description', 'status', 'start_datetime', 'end_datetime', 'updated_at',
+        'is_online', 'address', 'online_link', 'slug'
+    ))
+    keys = {f"ics:vevent:{event.id}:{event.updated_at.timestamp()}": event for event in events}
+    blocks = cache.get_many(keys)
+    missing = {key: render_vevent(event) for key, event in keys.items() if key not in blocks}
+    if missing:
+        cache.set_many(missing, FEED_CACHE_TIMEOUT)
+        blocks.update(missing)
+
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//dxb//events//EN",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        _fold(f"X-WR-CALNAME:{_escape(name)}"),
+    ]
+    body = "\r\n".join(lines) + "\r\n" + "".join(blocks[key] for key in keys) + "END:VCALENDAR\r\n"
+    return body
+
+
+def render_vevent(event):
+    location = event.online_link if event.is_online else event.address
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:event-{event.id}@dxb",
+        f"DTSTAMP:{_format_dt(event.updated_at)}",
+        f"LAST-MODIFIED:{_format_dt(event.updated_at)}",
+        f"DTSTART:{_format_dt(event.start_datetime)}",
+        f"DTEND:{_format_dt(event.end_datetime)}",
+        f"SUMMARY:{_escape(event.title)}",
+        f"DESCRIPTION:{_escape(event.description or '')}",
+        f"URL:{settings.FRONTEND_URL}/events/{event.slug}",
+        f"STATUS:{'CANCELLED' if event.status == EventStatus.CANCELLED else 'CONFIRMED'}",
+        f"SEQUENCE:{int(event.updated_at.timestamp())}",
+    ]
+    if location:
+        lines.append(f"LOCATION:{_escape(location)}")
+    lines.append("END:VEVENT")
+    return "".join(_fold(line) + "\r\n" for line in lines)
+
+
+def _format_dt(value):
+    return value.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def _escape(text):
+    return (
+        text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+        .replace('\r\n', '\\n').replace('\n', '\\n')
+    )
+
+
+def _fold(line):
+    """Splits a content line into 75-octet pieces (RFC 5545 3.1)."""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line
+    parts, start = [], 0
+    while start < len(encoded):
+        end = min(start + (75 if not parts else 74), len(encoded))
+        # Do not cut a multi-byte character
+        while end < len(encoded) and (encoded[end] & 0xC0) == 0x80:
+            end -= 1
+        parts.append(encoded[start:end].decode('utf-8'))
+        start = end
+    return "\r\n ".join(parts)
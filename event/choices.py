@@ -25,6 +25,7 @@ class AttendanceStatus(models.TextChoices):
     NOT_INTERESTED = 'not_interested', 'Not Interested'
     PENDING = 'pending', 'Pending'
     DECLINED = 'declined', 'Declined'
+    WAITLISTED = 'waitlisted', 'Waitlisted'
 
     
 class EventActivityType(models.TextChoices):
@@ -33,4 +34,15 @@ class EventActivityType(models.TextChoices):
     LIKE = 'like', 'Like'
     MEDIA_UPLOAD = 'media_upload', 'Media Upload'
     RSVP = 'rsvp', 'RSVP'
-    SHARE = 'share', 'Share'
\ No newline at end of file
+    SHARE = 'share', 'Share'
+
+class ExportStatus(models.TextChoices):
+    PENDING = 'pending', 'Pending'
+    RUNNING = 'running', 'Running'
+    DONE = 'done', 'Done'
+    FAILED = 'failed', 'Failed'
+
+
+class ExportFormat(models.TextChoices):
+    XLSX = 'xlsx', 'Excel'
+    CSV = 'csv', 'CSV'
@@ -0,0 +1,77 @@
+"""
+Attendance exports in constant memory: rows come from one values_list()
+query read with iterator(), CSV is streamed line by line and Excel is
+written with openpyxl's write-only mode.
+"""
+import csv
+from datetime import timedelta
+
+import openpyxl
+from django.db.models.functions import Coalesce
+from django.utils.text import get_valid_filename
+
+from event.models import EventAttendance
+
+ATTENDANCE_EXPORT_HEADERS = ["ID", "Username", "Email", "Status", "Joined At"]
+# A background export RUNNING for longer lost its worker: it may be claimed again, and is failed by
+# event.tasks.fail_stale_attendance_exports
+EXPORT_RUNNING_TIMEOUT = timedelta(hours=1)
+EXPORT_CONTENT_TYPES = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv',
+}
+
+
+def iter_attendance_rows(event_id, chunk_size=2000):
+    """Export rows of an event, ordered by status, without loading them all at once."""
+    rows = (
+        EventAttendance.objects.filter(event_id=event_id)
+        .annotate(email=Coalesce('profile__user__email', 'profile__organization__user__email'))
+        .order_by('status', 'id')
+        .values_list('id', 'profile__username', 'email', 'status', 'created_at')
+    )
+    for attendance_id, username, email, status, created_at in rows.iterator(chunk_size=chunk_size):
+        yield [attendance_id, username, email or '', status, created_at.strftime('%Y-%m-%d %H:%M:%S')]
+
+
+class _Echo:
+    """File-like object handing csv.writer output straight back."""
+
+    def write(self, value):
+        return value
+
+
+def stream_attendance_csv(event_id):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(ATTENDANCE_EXPORT_HEADERS)
+    for row in iter_attendance_rows(event_id):
+        yield writer.writerow(row)
+
+
+def write_attendance_csv(event_id, fileobj):
+    """Writes the CSV export to a text file object; returns the number of rows."""
+    writer = csv.writer(fileobj)
+    writer.writerow(ATTENDANCE_EXPORT_HEADERS)
+    count = 0
+    for row in iter_attendance_rows(event_id):
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+def write_attendance_xlsx(event, fileobj):
+    """Writes the Excel export to a path or binary file object; returns the number of rows."""
+    wb = openpyxl.Workbook(write_only=True)
+    # Sheet titles are limited to 31 characters
+    ws = wb.create_sheet(title=f"Attendance for {event.title}"[:31].translate(str.maketrans('', '', '[]:*?/\\')))
+    ws.append(ATTENDANCE_EXPORT_HEADERS)
+    count = 0
+    for row in iter_attendance_rows(event.id):
+        ws.append(row)
+        count += 1
+    wb.save(fileobj)
+    return count
+
+
+def attendance_export_filename(event, file_format):
+    return get_valid_filename(f"{event.title}_attendance.{file_format}")
@@ -0,0 +1,92 @@
+"""
+Geohash cells and distance math for nearby-event search, without PostGIS.
+
+Events store the geohash of their location. A radius or bounding-box search
+is turned into a handful of geohash prefixes covering the area. Each prefix
+becomes an indexed range scan (geohash >= prefix AND geohash < prefix + "~"),
+which works the same on SQLite and PostgreSQL. The exact distance check runs
+on the candidates with vectorized Haversine.
+"""
+import math
+
+import numpy as np
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+EARTH_RADIUS_KM = 6371.0088
+GEOHASH_PRECISION = 9
+MAX_COVER_CELLS = 16
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        interval, coordinate = (lon_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        if coordinate >= middle:
+            value = (value << 1) | 1
+            interval[0] = middle
+        else:
+            value <<= 1
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+def cell_size(precision):
+    """(height, width) of a geohash cell in degrees."""
+    total_bits = 5 * precision
+    lon_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """(min_lat, min_lon, max_lat, max_lon) enclosing the circle."""
+    delta_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    cos_lat = max(math.cos(math.radians(latitude)), 1e-6)
+    delta_lon = min(180.0, math.degrees(radius_km / (EARTH_RADIUS_KM * cos_lat)))
+    return (
+        max(-90.0, latitude - delta_lat), max(-180.0, longitude - delta_lon),
+        min(90.0, latitude + delta_lat), min(180.0, longitude + delta_lon),
+    )
+
+
+def covering_cells(min_lat, min_lon, max_lat, max_lon, max_cells=MAX_COVER_CELLS):
+    """
+    Geohash prefixes covering the box, at the finest precision that needs at
+    most `max_cells` of them. Boxes crossing the antimeridian are clamped.
+    """
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        rows = math.floor(max_lat / height) - math.floor(min_lat / height) + 1
+        columns = math.floor(max_lon / width) - math.floor(min_lon / width) + 1
+        if rows * columns > max_cells:
+            continue
+
+        cells = set()
+        for row in range(rows):
+            latitude = min(max_lat, min_lat + row * height)
+            for column in range(columns):
+                longitude = min(max_lon, min_lon + column * width)
+                cells.add(encode_geohash(latitude, longitude, precision))
+        # Corners, in case float steps skipped the last row/column
+        for latitude in (min_lat, max_lat):
+            for longitude in (min_lon, max_lon):
+                cells.add(encode_geohash(latitude, longitude, precision))
+        return sorted(cells)
+    return [""]
+
+
+def haversine_km(latitude, longitude, latitudes, longitudes):
+    """Distances in km from one point to arrays of points."""
+    lat1 = math.radians(latitude)
+    lat2 = np.radians(np.asarray(latitudes, dtype=float))
+    delta_lat = lat2 - lat1
+    delta_lon = np.radians(np.asarray(longitudes, dtype=float) - longitude)
+    a = np.sin(delta_lat / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin(delta_lon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from event.geo import encode_geohash
+from event.models import Event
+
+
+class Command(BaseCommand):
+    help = "Copies city coordinates and geohash onto events (Event.latitude/longitude/geohash)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        fields = ['latitude', 'longitude', 'geohash']
+
+        events_qs = Event.objects.order_by('id').values_list('id', 'is_online', 'city__latitude', 'city__longitude')
+        last_id, updated = 0, 0
+        while True:
+            rows = list(events_qs.filter(id__gt=last_id)[:batch_size])
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            events = []
+            for event_id, is_online, latitude, longitude in rows:
+                event = Event(id=event_id, latitude=None, longitude=None, geohash=None)
+                if not is_online and latitude is not None and longitude is not None:
+                    event.latitude, event.longitude = float(latitude), float(longitude)
+                    event.geohash = encode_geohash(event.latitude, event.longitude)
+                events.append(event)
+            Event.objects.bulk_update(events, fields)
+            updated += len(events)
+
+        self.stdout.write(self.style.SUCCESS(f"Updated locations of {updated} events"))
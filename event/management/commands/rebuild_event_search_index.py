@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from event.models import Event
+from event.search import refresh_search_documents
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the event search documents (EventSearchDocument) from the events"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        event_ids = Event.objects.order_by('id').values_list('id', flat=True)
+        last_id, updated = 0, 0
+        while True:
+            ids = list(event_ids.filter(id__gt=last_id)[:batch_size])
+            if not ids:
+                break
+            last_id = ids[-1]
+            updated += refresh_search_documents(ids)
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt search documents of {updated} events"))
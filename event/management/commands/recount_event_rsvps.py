@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from event.models import Event, EventAttendance, EventComment, EventMedia, RSVP_COUNTER_FIELDS, POPULARITY_FIELDS
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the Event counters (RSVPs per status, comments, media) and popularity_score from their tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        fields = [*RSVP_COUNTER_FIELDS.values(), 'comment_count', 'media_count', 'popularity_score']
+
+        event_ids = Event.objects.order_by('id').values_list('id', flat=True)
+        last_id, updated = 0, 0
+        while True:
+            ids = list(event_ids.filter(id__gt=last_id)[:batch_size])
+            if not ids:
+                break
+            last_id = ids[-1]
+
+            counts = {}
+            for row in EventAttendance.objects.filter(event_id__in=ids).values('event_id', 'status').annotate(n=Count('id')).order_by():
+                counts[(row['event_id'], row['status'])] = row['n']
+            comments = dict(
+                EventComment.objects.filter(event_id__in=ids).values('event_id').annotate(n=Count('id')).order_by().values_list('event_id', 'n')
+            )
+            media = dict(
+                EventMedia.objects.filter(event_id__in=ids).values('event_id').annotate(n=Count('id')).order_by().values_list('event_id', 'n')
+            )
+
+            events = list(Event.objects.filter(id__in=ids).only('id', *fields))
+            for event in events:
+                for status, field in RSVP_COUNTER_FIELDS.items():
+                    setattr(event, field, counts.get((event.id, status), 0))
+                event.comment_count = comments.get(event.id, 0)
+                event.media_count = media.get(event.id, 0)
+                event.popularity_score = sum(getattr(event, field) for field in POPULARITY_FIELDS)
+            Event.objects.bulk_update(events, fields)
+            updated += len(events)
+
+        self.stdout.write(self.style.SUCCESS(f"Recounted counters for {updated} events"))
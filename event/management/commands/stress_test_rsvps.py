@@ -0,0 +1,167 @@
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.utils import timezone
+
+from event.choices import AttendanceStatus
+from event.models import Event, EventAttendance, RSVP_COUNTER_FIELDS, SEAT_STATUSES
+from event.utils import change_rsvp_status, create_rsvp
+from profiles.models import Profile
+
+
+class Command(BaseCommand):
+    help = (
+        "Fires concurrent RSVPs (each profile twice) at a throwaway event with a small capacity, "
+        "has profiles that first answered 'not interested' RSVP again, cancels some seats concurrently, "
+        "saves host edits of the event alongside, and checks there is no overbooking, no duplicate RSVP, "
+        "the counters match the rows and the waitlist is promoted in the order RSVPs joined it"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--capacity', type=int, default=10)
+        parser.add_argument('--profiles', type=int, default=40, help="Profiles RSVPing (existing ones are used)")
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--rejoin', type=int, default=3,
+                            help="Profiles answering 'not interested' before the burst and 'interested' after it")
+        parser.add_argument('--cancel', type=int, default=5, help="Seats cancelled concurrently afterwards")
+        parser.add_argument('--edits', type=int, default=5,
+                            help="Host edits of the event, loaded beforehand, saved alongside the RSVPs and cancellations")
+        parser.add_argument('--keep', action='store_true', help="Keep the test event")
+
+    def handle(self, *args, **options):
+        capacity, threads = options['capacity'], options['threads']
+        profile_ids = list(Profile.objects.order_by('id').values_list('id', flat=True)[:options['profiles'] + 1])
+        if len(profile_ids) < 2:
+            raise CommandError("Needs at least two profiles")
+        host_id, profile_ids = profile_ids[0], profile_ids[1:]
+
+        now = timezone.now()
+        event = Event.objects.create(
+            host_id=host_id, title="RSVP stress test", description="Created by stress_test_rsvps",
+            start_datetime=now + timedelta(days=30), end_datetime=now + timedelta(days=30, hours=2),
+            max_attendees=capacity, is_online=True,
+        )
+        errors = []
+        try:
+            self._run(
+                event.id, profile_ids, capacity, threads, options['rejoin'], options['cancel'], options['edits'], errors
+            )
+        finally:
+            if not options['keep']:
+                event.delete()
+
+        if errors:
+            raise CommandError("\n".join(errors))
+        self.stdout.write(self.style.SUCCESS("RSVP stress test passed"))
+
+    def _concurrently(self, threads, func, items):
+        """Runs func on every item from `threads` threads released at the same time; returns the exceptions."""
+        start = threading.Event()
+
+        def call(item):
+            start.wait()
+            try:
+                func(item)
+            except Exception as e:
+                return e
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            futures = [pool.submit(call, item) for item in items]
+            start.set()
+            return [error for error in (future.result() for future in futures) if error]
+
+    def _alongside_edits(self, event_id, edits, steps):
+        """
+        Shuffles `edits` host saves of the event in with the steps. The edits
+        are loaded now, so each saves an event older than the RSVPs it races.
+        """
+        def edit(event):
+            event.description = f"Edited by stress_test_rsvps at {timezone.now().isoformat()}"
+            event.save()
+
+        steps = list(steps)
+        for _ in range(edits):
+            event = Event.objects.get(id=event_id)
+            steps.append(lambda event=event: edit(event))
+        random.shuffle(steps)
+        return steps
+
+    def _run(self, event_id, profile_ids, capacity, threads, rejoin, cancel, edits, errors):
+        rejoin_ids, burst_ids = profile_ids[:rejoin], profile_ids[rejoin:]
+        rsvps = EventAttendance.objects.filter(event_id=event_id)
+
+        # RSVPs created first but joining the waitlist last: they must not jump the queue
+        for profile_id in rejoin_ids:
+            create_rsvp(event_id, profile_id, AttendanceStatus.NOT_INTERESTED)
+
+        # Every other profile RSVPs twice at once, while the host edits the event
+        steps = self._alongside_edits(event_id, edits, [
+            lambda profile_id=profile_id: create_rsvp(event_id, profile_id, AttendanceStatus.INTERESTED)
+            for profile_id in burst_ids * 2
+        ])
+        failures = self._concurrently(threads, lambda step: step(), steps)
+        errors.extend(f"RSVP failed: {error!r}" for error in failures)
+        self._check(event_id, len(profile_ids), min(capacity, len(burst_ids)), errors)
+        waitlisted = list(
+            rsvps.filter(status=AttendanceStatus.WAITLISTED).order_by('waitlisted_at', 'id').values_list('id', flat=True)
+        )
+
+        failures = self._concurrently(
+            threads,
+            lambda attendance_id: change_rsvp_status(attendance_id, AttendanceStatus.INTERESTED),
+            list(rsvps.filter(profile_id__in=rejoin_ids).values_list('id', flat=True)),
+        )
+        errors.extend(f"Re-RSVP failed: {error!r}" for error in failures)
+        self._check(event_id, len(profile_ids), min(capacity, len(profile_ids)), errors)
+        waitlisted += list(
+            rsvps.filter(status=AttendanceStatus.WAITLISTED).exclude(id__in=waitlisted)
+            .order_by('waitlisted_at', 'id').values_list('id', flat=True)
+        )
+
+        # Cancel some seats at once, again with host edits; the first RSVPs to join the waitlist must take them
+        seated = list(rsvps.filter(status__in=SEAT_STATUSES).order_by('id').values_list('id', flat=True)[:cancel])
+        steps = self._alongside_edits(event_id, edits, [
+            lambda attendance_id=attendance_id: change_rsvp_status(attendance_id, AttendanceStatus.NOT_INTERESTED)
+            for attendance_id in seated
+        ])
+        failures = self._concurrently(threads, lambda step: step(), steps)
+        errors.extend(f"Cancellation failed: {error!r}" for error in failures)
+        expected_seats = min(capacity, len(profile_ids) - len(seated))
+        self._check(event_id, len(profile_ids), expected_seats, errors)
+
+        expected_promoted = set(waitlisted[:len(seated)])
+        promoted = set(rsvps.filter(id__in=waitlisted, status__in=SEAT_STATUSES).values_list('id', flat=True))
+        if promoted != expected_promoted:
+            errors.append(f"Waitlist not promoted in order: expected {sorted(expected_promoted)}, got {sorted(promoted)}")
+
+    def _check(self, event_id, expected_rows, expected_seats, errors):
+        event = Event.objects.get(id=event_id)
+        rows = dict(
+            EventAttendance.objects.filter(event_id=event_id).values('status').annotate(n=Count('id')).order_by()
+            .values_list('status', 'n')
+        )
+        total = sum(rows.values())
+        seats = sum(rows.get(status, 0) for status in SEAT_STATUSES)
+        self.stdout.write(
+            f"RSVP rows: {total}, seats taken: {seats}/{event.max_attendees}, "
+            f"waitlisted: {rows.get(AttendanceStatus.WAITLISTED, 0)}, spots remaining: {event.spots_remaining}"
+        )
+
+        if total != expected_rows:
+            errors.append(f"Expected {expected_rows} RSVP rows (one per profile), found {total}")
+        if seats != expected_seats:
+            errors.append(f"Expected {expected_seats} seats taken, found {seats}")
+        if seats > event.max_attendees:
+            errors.append(f"Overbooked: {seats} seats taken for {event.max_attendees}")
+        for status, field in RSVP_COUNTER_FIELDS.items():
+            if getattr(event, field) != rows.get(status, 0):
+                errors.append(f"{field} is {getattr(event, field)}, but there are {rows.get(status, 0)} {status} RSVPs")
+        if event.spots_remaining != event.max_attendees - seats:
+            errors.append(f"spots_remaining is {event.spots_remaining}, expected {event.max_attendees - seats}")
@@ -5,8 +5,9 @@ from django.core.validators import FileExtensionValidator
 from django.utils.text import slugify
 
 # Local imports
+from event.geo import encode_geohash
 from event.choices import (
-    EventType, EventStatus, AttendanceStatus,EventActivityType
+    EventType, EventStatus, AttendanceStatus,EventActivityType, ExportStatus, ExportFormat
 )
 from profiles.models import (
     Profile
@@ -24,6 +25,22 @@ from group.models import (
 # Python imports
 import pytz
 
+# Event counter field for each attendance status
+RSVP_COUNTER_FIELDS = {
+    AttendanceStatus.INTERESTED: 'rsvp_interested_count',
+    AttendanceStatus.NOT_INTERESTED: 'rsvp_not_interested_count',
+    AttendanceStatus.PENDING: 'rsvp_pending_count',
+    AttendanceStatus.DECLINED: 'rsvp_declined_count',
+    AttendanceStatus.WAITLISTED: 'rsvp_waitlisted_count',
+}
+# RSVP statuses holding one of the max_attendees seats; pending ones too, so approving never overbooks
+SEAT_STATUSES = (AttendanceStatus.INTERESTED, AttendanceStatus.PENDING)
+# Counters summed into Event.popularity_score: every RSVP, comment and media
+POPULARITY_FIELDS = ('comment_count', 'media_count', *RSVP_COUNTER_FIELDS.values())
+# Written only by F() updates (event.utils.update_event_counters), never by Event.save
+COUNTER_FIELDS = frozenset((*POPULARITY_FIELDS, 'popularity_score'))
+
+
 class EventTag(BaseModel):
     """
     Tags for categorizing events
@@ -91,6 +108,10 @@ class Event(BaseModel):
     state = models.ForeignKey(State, blank=True, null=True, on_delete=models.SET_NULL)
     country = models.ForeignKey(Country, blank=True, null=True, on_delete=models.SET_NULL)
     online_link = models.URLField(blank=True, null=True)
+    # Coordinates and geohash (event.geo) copied from the city, for nearby search
+    latitude = models.FloatField(blank=True, null=True, editable=False)
+    longitude = models.FloatField(blank=True, null=True, editable=False)
+    geohash = models.CharField(max_length=12, blank=True, null=True, editable=False)
     
     # Event details
     max_attendees = models.PositiveIntegerField(null=True, blank=True)
@@ -113,6 +134,17 @@ class Event(BaseModel):
     # In Event model
     completion_mail_sent = models.BooleanField(default=False)
 
+    # RSVP counters per attendance status, updated with every RSVP write
+    # (event.utils.apply_rsvp_change), rebuilt by `manage.py recount_event_rsvps`
+    rsvp_interested_count = models.PositiveIntegerField(default=0, editable=False)
+    rsvp_not_interested_count = models.PositiveIntegerField(default=0, editable=False)
+    rsvp_pending_count = models.PositiveIntegerField(default=0, editable=False)
+    rsvp_declined_count = models.PositiveIntegerField(default=0, editable=False)
+    rsvp_waitlisted_count = models.PositiveIntegerField(default=0, editable=False)
+    media_count = models.PositiveIntegerField(default=0, editable=False)
+    # Sum of the POPULARITY_FIELDS counters, kept in step with them (event.utils.update_event_counters)
+    popularity_score = models.PositiveIntegerField(default=0, editable=False)
+
     
     # Attendees
     attendees = models.ManyToManyField(
@@ -130,9 +162,23 @@ class Event(BaseModel):
     
     class Meta:
         ordering = ['-start_datetime']
+        indexes = [
+            models.Index(fields=['geohash']),
+            models.Index(fields=['-popularity_score', 'start_datetime']),
+        ]
         
     def __str__(self):
         return f"{self.title} - {self.start_datetime.strftime('%Y-%m-%d %H:%M')}"
+
+    def sync_location(self):
+        """Copies the city coordinates and their geohash; online events have none."""
+        latitude = longitude = geohash = None
+        if not self.is_online and self.city_id:
+            coordinates = City.objects.filter(id=self.city_id).values_list('latitude', 'longitude').first()
+            if coordinates and None not in coordinates:
+                latitude, longitude = float(coordinates[0]), float(coordinates[1])
+                geohash = encode_geohash(latitude, longitude)
+        self.latitude, self.longitude, self.geohash = latitude, longitude, geohash
     
     def save(self, *args, **kwargs):
         # Only generate slug if not provided
@@ -145,6 +191,19 @@ class Event(BaseModel):
                 counter += 1
             self.slug = slug
 
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or {'city', 'is_online'} & set(update_fields):
+            self.sync_location()
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'latitude', 'longitude', 'geohash'}
+
+        if update_fields is None and not self._state.adding and not kwargs.get('force_insert'):
+            # A full save would write back the counters as loaded, undoing concurrent RSVPs, comments and media
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in COUNTER_FIELDS
+            ]
+
         super().save(*args, **kwargs)
     
     @property
@@ -157,27 +216,37 @@ class Event(BaseModel):
     
     @property
     def attendee_count(self):
-        return self.attendees.count()
+        """All RSVPs, whatever their status."""
+        return sum(getattr(self, field) for field in RSVP_COUNTER_FIELDS.values())
     
     @property
     def interested_count(self):
         """Count of attendees with status 'INTERESTED'."""
-        return self.eventattendance_set.filter(status=AttendanceStatus.INTERESTED).count()
+        return self.rsvp_interested_count
 
     @property
     def not_interested_count(self):
         """Count of attendees with status 'NOT_INTERESTED'."""
-        return self.eventattendance_set.filter(status=AttendanceStatus.NOT_INTERESTED).count()
+        return self.rsvp_not_interested_count
     
     @property
     def pending_count(self):
         """Count of attendees with status 'pending'."""
-        return self.eventattendance_set.filter(status=AttendanceStatus.PENDING).count()
+        return self.rsvp_pending_count
+    
+    @property
+    def waitlisted_count(self):
+        return self.rsvp_waitlisted_count
+
+    @property
+    def seats_taken(self):
+        """RSVPs holding a seat (SEAT_STATUSES)."""
+        return sum(getattr(self, RSVP_COUNTER_FIELDS[status]) for status in SEAT_STATUSES)
     
     @property
     def spots_remaining(self):
         if self.max_attendees:
-            return max(0, self.max_attendees - self.attendee_count)
+            return max(0, self.max_attendees - self.seats_taken)
         return None
 
 
@@ -192,9 +261,12 @@ class EventAttendance(BaseModel):
         choices=AttendanceStatus.choices,
         default=AttendanceStatus.INTERESTED
     )
+    # When the RSVP last joined the waitlist, its place in it (event.utils.promote_waitlist)
+    waitlisted_at = models.DateTimeField(blank=True, null=True, editable=False)
     
     class Meta:
         unique_together = ['profile', 'event']
+        indexes = [models.Index(fields=['event', 'status', 'waitlisted_at'])]
         
     def __str__(self):
         return f"{self.profile.username} - {self.event.title} ({self.status})"
@@ -364,3 +436,100 @@ class EventActivityLog(BaseModel):
     class Meta:
         unique_together = ('profile', 'event', 'activity_type')
         indexes = [models.Index(fields=['event', 'activity_type'])]
+
+
+class EventActivityHourly(models.Model):
+    """
+    Activity count per event, activity type and hour, rolled up from
+    EventActivityLog and EventComment by event.analytics.rollup_event_activity.
+    """
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='activity_hourly')
+    activity_type = models.CharField(max_length=20, choices=EventActivityType.choices)
+    hour = models.DateTimeField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('event', 'activity_type', 'hour')
+
+    def __str__(self):
+        return f"{self.event_id} {self.activity_type} @ {self.hour}: {self.count}"
+
+
+class EventCommenterStat(models.Model):
+    """Comments per profile on an event, rolled up with EventActivityHourly for the top commenters."""
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='commenter_stats')
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE)
+    comment_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('event', 'profile')
+        indexes = [models.Index(fields=['event', '-comment_count'])]
+
+
+class EventRollupWatermark(models.Model):
+    """Highest source row id already rolled up, per source table."""
+    source = models.CharField(max_length=50, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.source}: {self.last_id}"
+
+
+class EventAttendanceExport(BaseModel):
+    """Attendance export generated in the background (event.tasks.generate_attendance_export_task)."""
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='attendance_exports')
+    requested_by = models.ForeignKey(Profile, on_delete=models.CASCADE)
+    file_format = models.CharField(max_length=10, choices=ExportFormat.choices, default=ExportFormat.XLSX)
+    status = models.CharField(max_length=20, choices=ExportStatus.choices, default=ExportStatus.PENDING)
+    file = models.FileField(upload_to='events/exports/', blank=True, null=True)
+    row_count = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Attendance export {self.id} of event {self.event_id} ({self.status})"
+
+
+class EventSearchDocument(models.Model):
+    """
+    Denormalized copy of the searchable fields of an event, with the names
+    of its city, state, country, host, co-hosts and tags, so the event
+    search and its facet counts run on one indexed table without joins.
+    Kept in step by event.signals, rebuilt by `manage.py rebuild_event_search_index`.
+    """
+    event = models.OneToOneField(Event, on_delete=models.CASCADE, primary_key=True, related_name='search_document')
+    title = models.CharField(max_length=200)
+    address = models.TextField(blank=True, default='')
+    host_name = models.CharField(max_length=200, blank=True, default='')
+    # "|name|name|" lists, matched with icontains
+    co_host_names = models.TextField(blank=True, default='')
+    tag_names = models.TextField(blank=True, default='')
+
+    # Facets
+    is_online = models.BooleanField(default=False)
+    is_free = models.BooleanField(default=True)
+    city = models.ForeignKey(City, blank=True, null=True, on_delete=models.SET_NULL, related_name='+')
+    city_name = models.CharField(max_length=100, blank=True, default='')
+    state = models.ForeignKey(State, blank=True, null=True, on_delete=models.SET_NULL, related_name='+')
+    state_name = models.CharField(max_length=100, blank=True, default='')
+    country = models.ForeignKey(Country, blank=True, null=True, on_delete=models.SET_NULL, related_name='+')
+    country_name = models.CharField(max_length=100, blank=True, default='')
+    start_datetime = models.DateTimeField()
+    end_datetime = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['start_datetime']),
+            models.Index(fields=['end_datetime']),
+            models.Index(fields=['is_online', 'is_free', 'start_datetime']),
+            models.Index(fields=['city', 'start_datetime']),
+            models.Index(fields=['country', 'start_datetime']),
+        ]
+
+    def __str__(self):
+        return f"Search document of event {self.event_id}"
@@ -0,0 +1,118 @@
+"""
+Event search on EventSearchDocument, with facet counts.
+
+Each event has a search document holding its searchable fields and the
+names of its city, state, country, host, co-hosts and tags. Filtering the
+documents needs no joins and so no distinct(); the facet counts (online,
+free, city, country, tag, date bucket) are grouped queries over the same
+filtered documents.
+"""
+from datetime import timedelta
+
+from django.db.models import Count, F, Prefetch, Q
+from django.utils import timezone
+
+from event.models import Event, EventSearchDocument, EventTag
+from profiles.models import Profile
+
+FACET_LIMIT = 20
+SEARCH_DOCUMENT_FIELDS = [
+    'title', 'address', 'host_name', 'co_host_names', 'tag_names', 'is_online', 'is_free',
+    'city', 'city_name', 'state', 'state_name', 'country', 'country_name',
+    'start_datetime', 'end_datetime', 'updated_at',
+]
+# Event fields copied into the search document
+SEARCH_SOURCE_FIELDS = {
+    'title', 'address', 'host', 'is_online', 'is_free', 'city', 'state', 'country', 'start_datetime', 'end_datetime',
+}
+
+
+def _joined(names):
+    names = [name for name in names if name]
+    return f"|{'|'.join(sorted(names))}|" if names else ''
+
+
+def build_search_document(event):
+    """Unsaved document of an event with host, city, state, country, co_hosts and tags loaded."""
+    return EventSearchDocument(
+        event=event,
+        title=event.title,
+        address=event.address or '',
+        host_name=event.host.username or '',
+        co_host_names=_joined(profile.username for profile in event.co_hosts.all()),
+        tag_names=_joined(tag.name for tag in event.tags.all()),
+        is_online=event.is_online,
+        is_free=event.is_free,
+        city=event.city,
+        city_name=event.city.name if event.city else '',
+        state=event.state,
+        state_name=event.state.name if event.state else '',
+        country=event.country,
+        country_name=event.country.name if event.country else '',
+        start_datetime=event.start_datetime,
+        end_datetime=event.end_datetime,
+    )
+
+
+def refresh_search_documents(event_ids):
+    """Writes the search documents of the given events in one upsert. Returns how many were written."""
+    events = (
+        Event.objects.filter(id__in=list(event_ids))
+        .select_related('host', 'city', 'state', 'country')
+        .prefetch_related(
+            Prefetch('co_hosts', queryset=Profile.objects.only('id', 'username')),
+            Prefetch('tags', queryset=EventTag.objects.only('id', 'name')),
+        )
+    )
+    documents = [build_search_document(event) for event in events]
+    EventSearchDocument.objects.bulk_create(
+        documents, update_conflicts=True, unique_fields=['event'], update_fields=SEARCH_DOCUMENT_FIELDS
+    )
+    return len(documents)
+
+
+def date_bucket_filters(now=None):
+    """{bucket: Q} splitting events into past, today, this week, this month and later."""
+    now = now or timezone.now()
+    today = timezone.localtime(now).replace(hour=0, minute=0, second=0, microsecond=0)
+    tomorrow, week, month = today + timedelta(days=1), today + timedelta(days=7), today + timedelta(days=30)
+    current = Q(end_datetime__gte=now)
+    return {
+        'past': Q(end_datetime__lt=now),
+        'today': current & Q(start_datetime__lt=tomorrow),
+        'this_week': current & Q(start_datetime__gte=tomorrow, start_datetime__lt=week),
+        'this_month': current & Q(start_datetime__gte=week, start_datetime__lt=month),
+        'later': current & Q(start_datetime__gte=month),
+    }
+
+
+def get_search_facets(documents, limit=FACET_LIMIT):
+    """Facet counts over the filtered documents, in four queries."""
+    buckets = date_bucket_filters()
+    counts = documents.aggregate(
+        online=Count('pk', filter=Q(is_online=True)),
+        in_person=Count('pk', filter=Q(is_online=False)),
+        free=Count('pk', filter=Q(is_free=True)),
+        paid=Count('pk', filter=Q(is_free=False)),
+        **{f"date_{bucket}": Count('pk', filter=q) for bucket, q in buckets.items()},
+    )
+    cities = (
+        documents.exclude(city=None).values(id=F('city_id'), name=F('city_name'))
+        .annotate(count=Count('pk')).order_by('-count', 'name')[:limit]
+    )
+    countries = (
+        documents.exclude(country=None).values(id=F('country_id'), name=F('country_name'))
+        .annotate(count=Count('pk')).order_by('-count', 'name')[:limit]
+    )
+    tags = (
+        Event.tags.through.objects.filter(event_id__in=documents.values('event_id'))
+        .values(name=F('eventtag__name')).annotate(count=Count('id')).order_by('-count', 'name')[:limit]
+    )
+    return {
+        "is_online": {"true": counts['online'], "false": counts['in_person']},
+        "is_free": {"true": counts['free'], "false": counts['paid']},
+        "date_bucket": {bucket: counts[f"date_{bucket}"] for bucket in buckets},
+        "city": list(cities),
+        "country": list(countries),
+        "tag": list(tags),
+    }
@@ -6,7 +6,8 @@ from rest_framework import serializers
 
 # Local imports
 from event.models import (
-    Event, EventAttendance, EventMedia, EventComment, EventMediaComment, EventMediaLike, EventMediaCommentLike, EventActivityLog
+    Event, EventAttendance, EventMedia, EventComment, EventMediaComment, EventMediaLike, EventMediaCommentLike, EventActivityLog,
+    EventAttendanceExport
 )
 from event.utils import generate_google_calendar_link, is_host_or_cohost
 from event.choices import (
@@ -38,6 +39,8 @@ class EventDetailSerializer(TimezoneAwareSerializerMixin):
     interested_count = serializers.SerializerMethodField()
     not_interested_count = serializers.SerializerMethodField()
     pending_count = serializers.SerializerMethodField()
+    waitlisted_count = serializers.IntegerField(read_only=True)
+    spots_remaining = serializers.IntegerField(read_only=True)
     user_rsvp_status = serializers.SerializerMethodField()
     view_count = serializers.SerializerMethodField()
     is_host_or_cohost = serializers.SerializerMethodField()
@@ -52,7 +55,7 @@ class EventDetailSerializer(TimezoneAwareSerializerMixin):
             'event_logo', 'total_attendee_count', 'interested_count', 'not_interested_count',
             'pending_count', 'allow_public_media', 'created_at', 'updated_at','view_count', 'user_rsvp_status',
             'updated_end_datetime', 'updated_start_datetime', 'max_attendees', 'aprove_attendees', 'show_views',
-            'share_count', 'is_host_or_cohost'
+            'share_count', 'is_host_or_cohost', 'waitlisted_count', 'spots_remaining'
         ]
 
     def get_host(self, obj):
@@ -66,40 +69,53 @@ class EventDetailSerializer(TimezoneAwareSerializerMixin):
         return int(obj.attendee_count)
     
     def get_interested_count(self, obj):
-        return obj.eventattendance_set.filter(status=AttendanceStatus.INTERESTED).count()
+        return obj.rsvp_interested_count
 
     def get_not_interested_count(self, obj):
-        return obj.eventattendance_set.filter(status=AttendanceStatus.NOT_INTERESTED).count()
+        return obj.rsvp_not_interested_count
     
     def get_pending_count(self, obj):
-        return obj.eventattendance_set.filter(status=AttendanceStatus.PENDING).count()
+        return obj.rsvp_pending_count
+
+    def _viewer_profile(self):
+        # List views pass it (event.utils.get_event_viewer_context), resolve it once otherwise
+        if 'viewer_profile' not in self.context:
+            request = self.context.get('request')
+            user = getattr(request, 'user', None)
+            self.context['viewer_profile'] = get_user_profile(user) if user and user.is_authenticated else None
+        return self.context['viewer_profile']
+
+    def _is_host_or_cohost(self, obj):
+        profile = self._viewer_profile()
+        if not profile:
+            return False
+        if 'cohosted_event_ids' in self.context:
+            return obj.host_id == profile.id or obj.id in self.context['cohosted_event_ids']
+        # Single event: checked once, shared by view_count and is_host_or_cohost
+        cache = self.context.setdefault('_host_or_cohost', {})
+        if obj.id not in cache:
+            cache[obj.id] = is_host_or_cohost(obj, profile)
+        return cache[obj.id]
     
     def get_user_rsvp_status(self, obj):
         try:
-            request = self.context.get('request')
-            if not request or not request.user.is_authenticated:
+            profile = self._viewer_profile()
+            if not profile:
                 return None
-
-            user = request.user
-            profile = get_user_profile(user)
+            if 'viewer_rsvps' in self.context:
+                return self.context['viewer_rsvps'].get(obj.id)
 
             # Now check for the specific event attendance
-            event_attendance = EventAttendance.objects.filter(
+            return EventAttendance.objects.filter(
                 profile=profile,
                 event=obj
-            ).first()
-
-            if event_attendance:
-                return event_attendance.status
-            return None
+            ).values_list('status', flat=True).first()
         except Exception:
             return None
     
     def get_view_count(self, obj):
         try:
-            user = self.context.get('request').user
-            profile = get_user_profile(user)
-            if is_host_or_cohost(obj, profile):
+            if self._is_host_or_cohost(obj):
                 return obj.view_count
             return obj.view_count if obj.show_views else None
         except:
@@ -107,9 +123,7 @@ class EventDetailSerializer(TimezoneAwareSerializerMixin):
     
     def get_is_host_or_cohost(self, obj):
         try:
-            user = self.context.get('request').user
-            profile = get_user_profile(user)
-            return is_host_or_cohost(obj, profile)
+            return self._is_host_or_cohost(obj)
         except:
             return None
         
@@ -155,6 +169,14 @@ class EventListSerializer(TimezoneAwareSerializerMixin):
     class Meta:
         model = Event
         fields = "__all__"
+
+
+class NearbyEventSerializer(EventListSerializer):
+    """EventListSerializer plus the distance from the searched point, given as context["distances"]."""
+    distance_km = serializers.SerializerMethodField()
+
+    def get_distance_km(self, obj):
+        return self.context.get('distances', {}).get(obj.id)
         
 
 class EventAttendanceSerializer(TimezoneAwareSerializerMixin):
@@ -398,4 +420,10 @@ class EventActivityLogSerializer(serializers.ModelSerializer):
     class Meta:
         model = EventActivityLog
         fields = ['id', 'event', 'activity_type', 'timestamp']
-        read_only_fields = ['id', 'timestamp']
\ No newline at end of file
+        read_only_fields = ['id', 'timestamp']
+
+class EventAttendanceExportSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = EventAttendanceExport
+        fields = ['id', 'event', 'file_format', 'status', 'file', 'row_count', 'error', 'created_at', 'finished_at']
+        read_only_fields = fields
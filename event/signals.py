@@ -0,0 +1,197 @@
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from core.models import City, Country, State
+from event.analytics import ACTIVITY_LOG_SOURCE, COMMENT_SOURCE, unroll_deleted_row
+from event.calendar_feeds import FEED_RSVP_STATUSES, FEED_SOURCE_FIELDS, invalidate_feeds
+from event.choices import EventActivityType
+from event.geo import encode_geohash
+from event.models import (
+    Event, EventActivityLog, EventAttendance, EventComment, EventMedia, EventSearchDocument, EventTag
+)
+from event.search import SEARCH_SOURCE_FIELDS, refresh_search_documents
+from event.utils import apply_rsvp_change, promote_waitlist, update_event_counters
+from profiles.models import Profile
+
+
+def _deleted_with_event(origin):
+    """Whether a delete started from events (instance or queryset), whose RSVPs go with them."""
+    return isinstance(origin, Event) or (isinstance(origin, QuerySet) and origin.model is Event)
+
+
+@receiver(post_delete, sender=EventAttendance)
+def release_rsvp_counter_on_delete(sender, instance, origin=None, **kwargs):
+    """Keeps the Event RSVP counters right when an RSVP is deleted (directly or by cascade)."""
+    # Nothing to keep when the event goes too: no counters, no waitlist to promote
+    if not _deleted_with_event(origin):
+        apply_rsvp_change(instance.event_id, old_status=instance.status)
+
+
+@receiver(post_save, sender=Event)
+def promote_waitlist_on_capacity_change(sender, instance, created, update_fields=None, **kwargs):
+    """Raising or removing max_attendees frees seats for the waitlist."""
+    if not created and (update_fields is None or 'max_attendees' in update_fields):
+        promote_waitlist(instance.id)
+
+
+@receiver(post_save, sender=EventComment)
+@receiver(post_save, sender=EventMedia)
+def count_event_comment_or_media(sender, instance, created, **kwargs):
+    """Keeps Event.comment_count / media_count and the popularity score in step."""
+    if created:
+        field = 'comment_count' if sender is EventComment else 'media_count'
+        update_event_counters(instance.event_id, **{field: 1})
+
+
+@receiver(post_delete, sender=EventComment)
+@receiver(post_delete, sender=EventMedia)
+def uncount_event_comment_or_media(sender, instance, **kwargs):
+    field = 'comment_count' if sender is EventComment else 'media_count'
+    update_event_counters(instance.event_id, **{field: -1})
+
+
+@receiver(post_delete, sender=EventActivityLog)
+@receiver(post_delete, sender=EventComment)
+def unroll_deleted_activity(sender, instance, origin=None, **kwargs):
+    """Keeps the analytics rollups (event.analytics) in step with deleted activity logs and comments."""
+    if _deleted_with_event(origin):
+        return  # The rollups of the event go with it
+    if sender is EventComment:
+        unroll_deleted_row(
+            COMMENT_SOURCE, instance.id, instance.event_id, EventActivityType.COMMENT, instance.created_at,
+            commenter_id=instance.profile_id,
+        )
+    else:
+        unroll_deleted_row(
+            ACTIVITY_LOG_SOURCE, instance.id, instance.event_id, instance.activity_type, instance.timestamp
+        )
+
+
+@receiver(post_save, sender=City)
+def sync_event_locations_on_city_change(sender, instance, created, **kwargs):
+    """Moves the denormalized coordinates of the city's in-person events along with the city."""
+    if created:
+        return
+    if instance.latitude is None or instance.longitude is None:
+        location = {'latitude': None, 'longitude': None, 'geohash': None}
+    else:
+        latitude, longitude = float(instance.latitude), float(instance.longitude)
+        location = {'latitude': latitude, 'longitude': longitude, 'geohash': encode_geohash(latitude, longitude)}
+    Event.objects.filter(city=instance, is_online=False).update(**location)
+
+
+def _event_feed_profile_ids(event):
+    """Profiles whose feed lists the event: host, co-hosts and RSVP'd profiles."""
+    profile_ids = {event.host_id}
+    profile_ids.update(Event.co_hosts.through.objects.filter(event_id=event.id).values_list('profile_id', flat=True))
+    profile_ids.update(
+        EventAttendance.objects.filter(event_id=event.id, status__in=FEED_RSVP_STATUSES).values_list('profile_id', flat=True)
+    )
+    return profile_ids
+
+
+def _invalidate_feeds_on_commit(profile_ids=(), group_ids=()):
+    # After commit, so a poll racing the write cannot cache the old feed under the new version
+    profile_ids, group_ids = list(profile_ids), list(group_ids)
+    transaction.on_commit(lambda: invalidate_feeds(profile_ids=profile_ids, group_ids=group_ids))
+
+
+@receiver(pre_save, sender=Event)
+def remember_feed_owners_before_event_save(sender, instance, update_fields=None, **kwargs):
+    """The host and group before the save: their feeds still list the event if it moves away from them."""
+    instance._feed_previous_owners = None
+    if instance.pk and (update_fields is None or {'host', 'group'} & set(update_fields)):
+        instance._feed_previous_owners = (
+            Event.objects.filter(pk=instance.pk).values_list('host_id', 'group_id').first()
+        )
+
+
+@receiver(post_save, sender=Event)
+def invalidate_calendar_feeds_on_event_save(sender, instance, update_fields=None, **kwargs):
+    # Counter saves (view_count, ...) would otherwise bump every attendee's feed
+    if update_fields is None or FEED_SOURCE_FIELDS & set(update_fields):
+        profile_ids, group_ids = _event_feed_profile_ids(instance), {instance.group_id}
+        previous = getattr(instance, '_feed_previous_owners', None)
+        if previous:
+            profile_ids.add(previous[0])
+            group_ids.add(previous[1])
+        _invalidate_feeds_on_commit(profile_ids, group_ids)
+
+
+@receiver(pre_delete, sender=Event)
+def invalidate_calendar_feeds_on_event_delete(sender, instance, **kwargs):
+    _invalidate_feeds_on_commit(_event_feed_profile_ids(instance), [instance.group_id])
+
+
+@receiver(m2m_changed, sender=Event.co_hosts.through)
+def invalidate_calendar_feeds_on_cohost_change(sender, instance, action, pk_set, **kwargs):
+    if action == 'pre_clear' and isinstance(instance, Event):
+        _invalidate_feeds_on_commit(instance.co_hosts.values_list('id', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        _invalidate_feeds_on_commit((pk_set or ()) if isinstance(instance, Event) else [instance.id])
+
+
+@receiver(post_save, sender=EventAttendance)
+@receiver(post_delete, sender=EventAttendance)
+def invalidate_calendar_feed_on_rsvp_change(sender, instance, origin=None, **kwargs):
+    # A deleted event invalidates the feeds of its RSVPs once, in its pre_delete
+    if not _deleted_with_event(origin):
+        _invalidate_feeds_on_commit([instance.profile_id])
+
+
+@receiver(post_save, sender=Event)
+def refresh_search_document_on_event_save(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or SEARCH_SOURCE_FIELDS & set(update_fields):
+        refresh_search_documents([instance.id])
+
+
+@receiver(m2m_changed, sender=Event.co_hosts.through)
+@receiver(m2m_changed, sender=Event.tags.through)
+def refresh_search_documents_on_m2m_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            refresh_search_documents([instance.id])
+        return
+    # From the profile or tag side: the events are in pk_set, or gone after a clear
+    related = instance.co_hosted_events if sender is Event.co_hosts.through else instance.events
+    if action == 'pre_clear':
+        instance._search_event_ids = list(related.values_list('id', flat=True))
+    elif action == 'post_clear':
+        refresh_search_documents(getattr(instance, '_search_event_ids', ()))
+    elif action in ('post_add', 'post_remove'):
+        refresh_search_documents(pk_set or ())
+
+
+@receiver(post_save, sender=Profile)
+def sync_search_host_names(sender, instance, created, update_fields=None, **kwargs):
+    """Follows username changes in the host and co-host names of the search documents."""
+    if created or (update_fields is not None and 'username' not in update_fields):
+        return
+    username = instance.username or ''
+    EventSearchDocument.objects.filter(event__host=instance).exclude(host_name=username).update(host_name=username)
+    stale = EventSearchDocument.objects.filter(event__co_hosts=instance)
+    if username:
+        stale = stale.exclude(co_host_names__contains=f"|{username}|")
+    refresh_search_documents(stale.values_list('event_id', flat=True))
+
+
+@receiver(post_save, sender=EventTag)
+def sync_search_tag_names(sender, instance, created, **kwargs):
+    if not created:
+        refresh_search_documents(
+            EventSearchDocument.objects.filter(event__tags=instance)
+            .exclude(tag_names__contains=f"|{instance.name}|").values_list('event_id', flat=True)
+        )
+
+
+@receiver(post_save, sender=City)
+@receiver(post_save, sender=State)
+@receiver(post_save, sender=Country)
+def sync_search_place_names(sender, instance, created, **kwargs):
+    if not created:
+        field = sender._meta.model_name
+        EventSearchDocument.objects.filter(**{field: instance}).exclude(**{f"{field}_name": instance.name}).update(
+            **{f"{field}_name": instance.name}
+        )
@@ -1,32 +1,49 @@
 from celery import shared_task
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from datetime import timedelta
 from django.contrib.contenttypes.models import ContentType
 from django.db import transaction
 from django.core.exceptions import ObjectDoesNotExist
+from django.core.files import File
 from django.db.models import Q, Count, F
 from django.db.models.functions import ExtractHour
 
 from django.contrib.auth import get_user_model
-from event.choices import AttendanceStatus, EventActivityType
-from event.models import Event, EventActivityLog, EventAttendance, EventComment, EventMedia,EventStatus
+from event.choices import AttendanceStatus, EventActivityType, ExportFormat, ExportStatus
+from event.models import Event, EventActivityHourly, EventAttendanceExport, EventActivityLog, EventAttendance, EventComment, EventMedia,EventStatus
+from event.exports import (
+    EXPORT_RUNNING_TIMEOUT, attendance_export_filename, write_attendance_csv, write_attendance_xlsx
+)
+from event.analytics import get_event_analytics, get_events_analytics, rollup_event_activity
 from core.services import get_actual_user, send_dynamic_email_using_template
-from notification.task_monitor import monitor_task
+from notification.task_monitor import monitor_task, report_items_processed
+from notification.task_lock import single_instance_task
+from notification.batch_jobs import batch_job, start_batch_job
 from profiles . models import Profile
 
-from notification.models import NotificationType
+from notification.models import Notification, NotificationType
 
-from notification.utils import create_notification, send_notification_email
+from notification.utils import create_notification, create_notifications_bulk, send_notification_email
 
+import io
 import logging
+import tempfile
 
 
 logger = logging.getLogger(__name__)
 
 
 @shared_task
+@single_instance_task("mark_completed_events_and_notify", ttl=900)
 @monitor_task(task_name="mark_completed_events_and_notify", expected_interval_minutes=60)
-def mark_completed_events_and_notify():
+def mark_completed_events_and_notify(batch_size=500):
+    """
+    Marks published events that ended over an hour ago as completed and
+    notifies their hosts and attendees. Per batch: one UPDATE sets status and
+    completion_mail_sent on the locked events, and the notifications go in
+    with bulk INSERTs, in the same transaction.
+    """
     logger.info("Running: mark_completed_events_and_notify")
     now = timezone.now()
     one_hour_ago = now - timezone.timedelta(hours=1)
@@ -38,118 +55,112 @@ def mark_completed_events_and_notify():
         status=EventStatus.PUBLISHED,
         completion_mail_sent=False 
     )
-
+    event_type = ContentType.objects.get_for_model(Event)
     completed_count = 0
 
-    for event in event_to_mark:
-        event.status = EventStatus.COMPLETED
-        event.save()
-        completed_count += 1
+    while True:
+        with transaction.atomic():
+            event_ids = list(
+                event_to_mark.select_for_update(skip_locked=True).order_by('id').values_list('id', flat=True)[:batch_size]
+            )
+            if not event_ids:
+                break
+            Event.objects.filter(id__in=event_ids).update(status=EventStatus.COMPLETED, completion_mail_sent=True)
+
+            events = Event.objects.filter(id__in=event_ids).select_related(
+                'host__user', 'host__organization__user'
+            ).in_bulk()
+            notifications = [
+                Notification(
+                    sender=event.host,
+                    recipient=event.host,
+                    notification_type=NotificationType.STATUS_CHANGE,
+                    message=f"Your event '{event.title}' has been automatically marked as completed.",
+                    content_type=event_type,
+                    object_id=event.id,
+                )
+                for event in events.values()
+            ]
 
-        logger.info(f"[MarkCompletedEvents] Event '{event.title}' (ID: {event.id}) marked as COMPLETED.")
+            attendances = EventAttendance.objects.filter(event_id__in=event_ids).select_related(
+                'profile__user', 'profile__organization__user'
+            )
+            for attendance in attendances:
+                event = events[attendance.event_id]
+                attendee_user = get_actual_user(attendance.profile)
+                if attendee_user and attendee_user != get_actual_user(event.host):
+                    notifications.append(Notification(
+                        sender=event.host,
+                        recipient=attendance.profile,
+                        notification_type=NotificationType.STATUS_CHANGE,
+                        message=f"The event '{event.title}' you attended is now marked as completed.",
+                        content_type=event_type,
+                        object_id=event.id,
+                    ))
+            create_notifications_bulk(notifications)
+
+        completed_count += len(event_ids)
+        report_items_processed(len(event_ids))
+        logger.info(f"[MarkCompletedEvents] Marked {len(event_ids)} events as COMPLETED, sent {len(notifications)} notifications.")
 
-        host = event.host
-        host_user = get_actual_user(host)
+    logger.info(f"[MarkCompletedEvents] Task completed. Total events marked: {completed_count}")
+
+
+@shared_task
+@single_instance_task("rollup_event_activity", ttl=900)
+@monitor_task(task_name="rollup_event_activity", expected_interval_minutes=10)
+def rollup_event_activity_task():
+    """Folds new activity log and comment rows into the hourly analytics rollups."""
+    processed = rollup_event_activity()
+    report_items_processed(processed)
+    return f"Rolled up {processed} activity rows."
+
+
+def send_analytics_report(event, recipients, analytics):
+    """Emails and notifies `recipients` (host and co-hosts) about the event analytics."""
+    peak_hour = analytics["peak_engagement_hour"]
+    context = {
+        "event_title": event.title,
+        "reach": analytics["reach"],
+        "rsvp_counts": analytics["rsvp_counts"],
+        "rsvp_rate": analytics["rsvp_rate"],
+        "peak_engagement_hour": peak_hour["hour"] if peak_hour else None,
+        "top_commenters": analytics["top_commenters"],
+    }
+    sent = 0
+    for profile in recipients:
+        user = get_actual_user(profile)
+        if not user or not user.email:
+            continue
+
+        # Send email
+        send_dynamic_email_using_template(
+            template_name="event-analytics-report",
+            recipient_list=[user.email],
+            context={**context, "name": profile.username},
+        )
 
-        message = f"Your event '{event.title}' has been automatically marked as completed."
+        # Send in-app notification
         create_notification(
-            sender=host,
-            recipient=host,
+            sender=event.host,
+            recipient=profile,
             instance=event,
-            message=message,
-            notification_type=NotificationType.STATUS_CHANGE
+            message=f"Your weekly analytics report for event \"{event.title}\" is now available.",
+            notification_type=NotificationType.EVENT_REMINDER
         )
-        logger.info(f"[MarkCompletedEvents] Notified host: {host.username}")
-
-        attendees = event.attendees.all()
-        for attendee in attendees:
-            attendee_user = get_actual_user(attendee)
-            if attendee_user and attendee_user != host_user:
-                message_attendee = f"The event '{event.title}' you attended is now marked as completed."
-                create_notification(
-                    sender=host,
-                    recipient=attendee,
-                    instance=event,
-                    message=message_attendee,
-                    notification_type=NotificationType.STATUS_CHANGE
-                )
-                logger.info(f"[MarkCompletedEvents] Notified attendee: {attendee.username}")
-        event.completion_mail_sent = True
-        event.save(update_fields=['completion_mail_sent'])
-    logger.info(f"[MarkCompletedEvents] Task completed. Total events marked: {completed_count}")
+        sent += 1
+    return sent
 
 
 @shared_task
 def send_event_analytics_report_task(event_id):
     try:
         event = Event.objects.get(id=event_id)
-
-        reach = EventActivityLog.objects.filter(
-            event=event,
-            activity_type=EventActivityType.VIEW
-        ).values('profile').distinct().count()
-
-        attendance_stats = (
-            EventAttendance.objects
-            .filter(event=event)
-            .values('status')
-            .annotate(count=Count('id'))
-        )
-        rsvp_counts = {status: 0 for status in AttendanceStatus.values}
-        for entry in attendance_stats:
-            rsvp_counts[entry["status"]] = entry["count"]
-
-        rsvped_users = EventAttendance.objects.filter(
-            event=event
-        ).values('profile').distinct().count()
-
-        rsvp_rate = (rsvped_users / reach * 100) if reach > 0 else 0
-
-        peak_hour = EventActivityLog.objects.filter(
-            event=event,
-            activity_type__in=[EventActivityType.VIEW, EventActivityType.COMMENT]
-        ).annotate(hour=ExtractHour('timestamp')).values('hour').annotate(
-            total=Count('id')
-        ).order_by('-total').first()
-
-        top_commenters = EventComment.objects.filter(
-            event=event
-        ).values('profile__username').annotate(
-            total_comments=Count('id')
-        ).order_by('-total_comments')[:5]
-
-        context = {
-            "event_title": event.title,
-            "reach": reach,
-            "rsvp_counts": rsvp_counts,
-            "rsvp_rate": round(rsvp_rate, 2),
-            "peak_engagement_hour": peak_hour["hour"] if peak_hour else None,
-            "top_commenters": list(top_commenters),
-        }
+        analytics = get_event_analytics(event)
 
         def send_email_and_notify():
             try:
-                all_profiles = [event.host] + list(event.co_hosts.all())
-                for profile in all_profiles:
-                    user = get_actual_user(profile)
-                    if not user or not user.email:
-                        continue
-
-                    # Send email
-                    send_dynamic_email_using_template(
-                        template_name="event-analytics-report",
-                        recipient_list=[user.email],
-                        context={**context, "name": profile.username},
-                    )
-
-                    # Send in-app notification
-                    create_notification(
-                        sender=event.host,
-                        recipient=profile,
-                        instance=event,
-                        message=f"Your weekly analytics report for event \"{event.title}\" is now available.",
-                        notification_type=NotificationType.EVENT_REMINDER
-                    )
+                send_analytics_report(event, [event.host] + list(event.co_hosts.all()), analytics)
             except Exception as e:
                 logger.warning(f"[AnalyticsReport] Failed to send email or notify: {e}", exc_info=True)
 
@@ -161,29 +172,117 @@ def send_event_analytics_report_task(event_id):
         logger.error(f"[AnalyticsReport] Unexpected error: {e}", exc_info=True)
 
 @shared_task
+@single_instance_task("trigger_event_analytics_for_all_events", ttl=1800)
 @monitor_task(task_name="trigger_event_analytics_for_all_events", expected_interval_minutes=1440)
 def trigger_event_analytics_for_all_events():
-    logger.info("Running: trigger_event_analytics_for_all_events")
     """
-    This task triggers analytics for all events by scheduling the send_event_analytics_report_task for each event.
-    It runs daily to ensure all events are processed.
+    Daily analytics reports, as one batch job instead of a task per event.
+    Only hosts and co-hosts of events with activity in the last 24 hours are
+    emailed; see send_event_analytics_reports_chunk.
     """
-    try:
-        now = timezone.now()
-        events = Event.objects.filter(
-            status__in=[
-                EventStatus.PUBLISHED,
-                EventStatus.DRAFT,
-                EventStatus.CANCELLED
-            ]
-        )
+    logger.info("Running: trigger_event_analytics_for_all_events")
+    now = timezone.now()
+    run = start_batch_job("send_event_analytics_reports", params={
+        "start": (now - timedelta(days=1)).isoformat(),
+        "end": now.isoformat(),
+    })
+    if run is None:
+        return "Skipped: the previous batch run is still in progress"
+    return f"Batch run {run.id}: {run.total_chunks} chunks"
+
+
+@batch_job(
+    "send_event_analytics_reports",
+    queryset=lambda: Event.objects.filter(status__in=[EventStatus.PUBLISHED, EventStatus.COMPLETED]),
+    chunk_size=1000,
+)
+def send_event_analytics_reports_chunk(events, start, end):
+    # One query finds the events of this chunk with rolled-up activity in the window
+    active_ids = set(
+        EventActivityHourly.objects.filter(
+            event__in=events, hour__gte=parse_datetime(start), hour__lt=parse_datetime(end)
+        ).values_list('event_id', flat=True).distinct()
+    )
+    if not active_ids:
+        return 0
+
+    active_events = list(
+        Event.objects.filter(id__in=active_ids).select_related('host__user', 'host__organization__user')
+    )
+    analytics = get_events_analytics(active_events)
 
-        for event in events:
-            send_event_analytics_report_task.delay(event.id)
+    co_hosts = {}
+    for link in Event.co_hosts.through.objects.filter(event_id__in=active_ids).select_related(
+        'profile__user', 'profile__organization__user'
+    ):
+        co_hosts.setdefault(link.event_id, []).append(link.profile)
 
-        return f"Triggered analytics for {events.count()} events."
+    sent = 0
+    for event in active_events:
+        try:
+            sent += send_analytics_report(event, [event.host] + co_hosts.get(event.id, []), analytics[event.id])
+        except Exception as e:
+            logger.warning(f"[AnalyticsReport] Failed to send report for event {event.id}: {e}", exc_info=True)
+    return sent
+
+
+@shared_task
+@single_instance_task("fail_stale_attendance_exports", ttl=900)
+@monitor_task(task_name="fail_stale_attendance_exports", expected_interval_minutes=15)
+def fail_stale_attendance_exports():
+    """Marks exports whose worker died mid-build (RUNNING past the timeout) as FAILED."""
+    now = timezone.now()
+    failed = EventAttendanceExport.objects.filter(
+        status=ExportStatus.RUNNING, updated_at__lt=now - EXPORT_RUNNING_TIMEOUT
+    ).update(
+        status=ExportStatus.FAILED, error="The export did not finish in time, please request it again.",
+        finished_at=now, updated_at=now,
+    )
+    report_items_processed(failed)
+    return f"Failed {failed} stale attendance exports."
 
+
+@shared_task
+def generate_attendance_export_task(export_id):
+    """Builds a background attendance export file and notifies the requester."""
+    # Claim the export so a duplicate delivery does not build it twice; a RUNNING
+    # export past the timeout lost its worker and is built again
+    now = timezone.now()
+    claimed = EventAttendanceExport.objects.filter(
+        Q(status=ExportStatus.PENDING) | Q(status=ExportStatus.RUNNING, updated_at__lt=now - EXPORT_RUNNING_TIMEOUT),
+        id=export_id,
+    ).update(status=ExportStatus.RUNNING, updated_at=now)
+    if not claimed:
+        return
+
+    export = EventAttendanceExport.objects.select_related('event__host', 'requested_by').get(id=export_id)
+    event = export.event
+    try:
+        with tempfile.TemporaryFile() as tmp:
+            if export.file_format == ExportFormat.CSV:
+                text = io.TextIOWrapper(tmp, encoding='utf-8', newline='')
+                export.row_count = write_attendance_csv(event.id, text)
+                text.flush()
+                text.detach()
+            else:
+                export.row_count = write_attendance_xlsx(event, tmp)
+            tmp.seek(0)
+            export.file.save(attendance_export_filename(event, export.file_format), File(tmp), save=False)
+        export.status = ExportStatus.DONE
+        export.error = None
     except Exception as e:
-        logger.error(f"[AnalyticsTrigger] Failed to schedule analytics: {e}", exc_info=True)
-        return "Error occurred"
-    
+        logger.error(f"[AttendanceExport] Export {export_id} failed: {e}", exc_info=True)
+        export.status = ExportStatus.FAILED
+        export.error = str(e)
+
+    export.finished_at = timezone.now()
+    export.save(update_fields=['status', 'file', 'row_count', 'error', 'finished_at', 'updated_at'])
+
+    if export.status == ExportStatus.DONE:
+        create_notification(
+            sender=event.host,
+            recipient=export.requested_by,
+            instance=event,
+            message=f"Your attendance export for '{event.title}' ({export.row_count} rows) is ready to download.",
+            notification_type=NotificationType.STATUS_CHANGE
+        )
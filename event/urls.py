@@ -6,7 +6,8 @@ from event.views import (
     EventDetailAPIView,SuggestedEventsAPIView,EventMediaDetailAPIView, MyHostedEventsAPIView, AddCoHostsAPIView, RemoveCoHostAPIView,
     ApproveRSVPAPIView, EventMediaLikeAPIView, EventMediaLikeDetailAPIView, EventMediaLikesByIdAPIView, EventListByHostOrCoHostAPIView, 
     EventMediaCommentLikeToggleAPIView, EventMediaCommentLikeListAPIView, GetCoHostListAPIView, EventViewActivityAPIView, EventShareActivityAPIView, EventAnalyticsAPIView, 
-    ShareEventWithProfilesAPIView, PublicEventDetailAPIView, DownloadEventAttendanceExcel, FilterEventListAPIView, EventByTagAPIView
+    ShareEventWithProfilesAPIView, PublicEventDetailAPIView, DownloadEventAttendanceExcel, FilterEventListAPIView, EventByTagAPIView,
+    NearbyEventsAPIView, EventAttendanceExportAPIView, CalendarFeedAPIView, CalendarFeedURLAPIView
 )
 
 
@@ -18,6 +19,7 @@ urlpatterns = [
     path('public-details/<str:slug>/', PublicEventDetailAPIView.as_view(), name='detials'),
     path('update/<int:event_id>/', UpdateEventAPIView.as_view(), name='update'),
     path('list/', EventListAPIView.as_view(), name='event-list'),
+    path('nearby/', NearbyEventsAPIView.as_view(), name='nearby-events'),
     path('rsvp/', EventAttendacneAPIView.as_view(), name='event-rsvp'),
     path('rsvp/<int:event_id>/', EventAttendacneAPIView.as_view(), name='event-rsvp'),
     path('my-rsvp-events/', MyRSVPEventsListAPIView.as_view(), name='my-rsvp-events'),
@@ -53,7 +55,10 @@ urlpatterns = [
     path('share/event/bulk/', ShareEventWithProfilesAPIView.as_view(), name='share-event-bulk'),
 
     path('events/attendance/download/<int:event_id>/', DownloadEventAttendanceExcel.as_view(), name='download-attendance-excel'),
+    path('events/attendance/export/<int:event_id>/', EventAttendanceExportAPIView.as_view(), name='attendance-export'),
     path('filter/events/', FilterEventListAPIView.as_view(), name='event-list'),
     path('tags/', EventByTagAPIView.as_view(), name='event-tags'),
+    path('calendar/feed-url/', CalendarFeedURLAPIView.as_view(), name='calendar-feed-url'),
+    path('calendar/<str:token>.ics', CalendarFeedAPIView.as_view(), name='calendar-feed'),
 
 ]
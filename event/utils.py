@@ -1,17 +1,23 @@
 from urllib.parse import urlencode
-from django.db import transaction
-from django.db.models import F
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+from django.utils import timezone
 from django.utils.timezone import is_aware
 from django.shortcuts import get_object_or_404
 
 
-from event.models import EventTag, Event,EventActivityLog
-from notification.task import send_event_share_notification_task
-from event.choices import EventActivityType
+from event.models import EventTag, Event,EventActivityLog, EventAttendance, RSVP_COUNTER_FIELDS, POPULARITY_FIELDS, SEAT_STATUSES
+from notification.task import send_event_share_notification_task, send_event_rsvp_notification_task
+from event.choices import EventActivityType, AttendanceStatus
+from core.services import get_user_profile
+from event.geo import bounding_box, covering_cells, haversine_km
 
 
+import operator
 import pytz 
 import re
+from functools import reduce
 
 def generate_google_calendar_link(event, request=None):
     """
@@ -73,6 +79,204 @@ def is_host_or_cohost(event, profile):
     # Check if profile is in the co-hosts ManyToMany relation
     return event.co_hosts.filter(id=profile.id).exists()
 
+def update_event_counters(event_id, condition=None, **deltas):
+    """
+    Adds `deltas` ({counter field: +n/-n}) to the event counters in one
+    UPDATE, never below 0, and recomputes popularity_score from the same new
+    values (the right-hand sides all read the row before the update). With a
+    `condition` (Q on Event) the row is only updated if it matches; returns
+    the number of rows updated.
+    """
+    updates = {}
+    for field, delta in deltas.items():
+        if delta > 0:
+            updates[field] = F(field) + delta
+        elif delta < 0:
+            updates[field] = Greatest(F(field) + delta, 0)
+    if not updates:
+        return 0
+    if any(field in POPULARITY_FIELDS for field in updates):
+        updates['popularity_score'] = reduce(operator.add, (updates.get(field, F(field)) for field in POPULARITY_FIELDS))
+    events = Event.objects.filter(id=event_id)
+    if condition is not None:
+        events = events.filter(condition)
+    return events.update(**updates)
+
+
+def attendee_total_expression():
+    """SQL sum of the RSVP counters of Event (all RSVPs, like Event.attendee_count)."""
+    return reduce(operator.add, (F(field) for field in RSVP_COUNTER_FIELDS.values()))
+
+
+def free_seat_condition():
+    """Q matching events with a free seat: no limit (max_attendees empty or 0) or fewer seats taken."""
+    seats_taken = reduce(operator.add, (F(RSVP_COUNTER_FIELDS[status]) for status in SEAT_STATUSES))
+    return Q(max_attendees__isnull=True) | Q(max_attendees=0) | Q(max_attendees__gt=seats_taken)
+
+
+def _rsvp_deltas(old_status, new_status):
+    deltas = {}
+    if old_status in RSVP_COUNTER_FIELDS:
+        deltas[RSVP_COUNTER_FIELDS[old_status]] = -1
+    if new_status in RSVP_COUNTER_FIELDS:
+        deltas[RSVP_COUNTER_FIELDS[new_status]] = 1
+    return deltas
+
+
+def apply_rsvp_change(event_id, old_status=None, new_status=None, attendance=None):
+    """
+    Moves one RSVP between the Event status counters: old_status=None for a
+    new RSVP, new_status=None for a deleted one. Taking a seat
+    (SEAT_STATUSES) is a conditional UPDATE that only succeeds while the
+    event has one free, so concurrent RSVPs cannot overbook it; a full event
+    puts the RSVP on the waitlist instead. A freed seat goes to the waitlist.
+    Returns the status to save and, given the (unsaved) `attendance`, sets
+    its status and waitlisted_at: call it in the same transaction as the
+    EventAttendance write.
+    """
+    if old_status == new_status:
+        return new_status
+    if new_status in SEAT_STATUSES and old_status not in SEAT_STATUSES:
+        if update_event_counters(event_id, condition=free_seat_condition(), **_rsvp_deltas(old_status, new_status)):
+            return _set_rsvp_status(attendance, old_status, new_status)
+        new_status = AttendanceStatus.WAITLISTED
+        if old_status == new_status:
+            return new_status
+    update_event_counters(event_id, **_rsvp_deltas(old_status, new_status))
+    if old_status in SEAT_STATUSES and new_status not in SEAT_STATUSES:
+        promote_waitlist(event_id)
+    return _set_rsvp_status(attendance, old_status, new_status)
+
+
+def _set_rsvp_status(attendance, old_status, new_status):
+    if attendance is not None:
+        attendance.status = new_status
+        if new_status == AttendanceStatus.WAITLISTED and old_status != new_status:
+            # The waitlist is served in the order RSVPs joined it, not the order they were created
+            attendance.waitlisted_at = timezone.now()
+    return new_status
+
+
+def create_rsvp(event_id, profile_id, status):
+    """
+    Creates an RSVP, on the waitlist when the event is full. Returns None
+    when the profile already has one, even one created concurrently.
+    """
+    attendance = EventAttendance(event_id=event_id, profile_id=profile_id)
+    try:
+        with transaction.atomic():
+            apply_rsvp_change(event_id, new_status=status, attendance=attendance)
+            attendance.save(force_insert=True)
+            return attendance
+    except IntegrityError:
+        return None
+
+
+def change_rsvp_status(attendance_id, status):
+    """Moves an RSVP to `status` (or the waitlist when the event is full), with the row locked. Returns it."""
+    with transaction.atomic():
+        attendance = EventAttendance.objects.select_for_update().get(id=attendance_id)
+        previous_status = attendance.status
+        apply_rsvp_change(attendance.event_id, previous_status, status, attendance=attendance)
+        if attendance.status != previous_status:
+            attendance.save(update_fields=['status', 'waitlisted_at', 'updated_at'])
+    return attendance
+
+
+def promote_waitlist(event_id):
+    """
+    Gives the free seats of the event to its waitlisted RSVPs, in the order
+    they joined the waitlist. They become pending when the host approves
+    attendees. Returns the ids of the promoted RSVPs; each gets the RSVP
+    notification once committed.
+    """
+    promoted = []
+    with transaction.atomic():
+        approve_attendees = Event.objects.filter(id=event_id).values_list('aprove_attendees', flat=True).first()
+        if approve_attendees is None:
+            return promoted
+        seat_status = AttendanceStatus.PENDING if approve_attendees else AttendanceStatus.INTERESTED
+        waitlist = (
+            EventAttendance.objects.select_for_update(skip_locked=True)
+            .filter(event_id=event_id, status=AttendanceStatus.WAITLISTED).order_by('waitlisted_at', 'id')
+        )
+        while True:
+            attendance = waitlist.first()
+            if attendance is None:
+                break
+            deltas = _rsvp_deltas(AttendanceStatus.WAITLISTED, seat_status)
+            if not update_event_counters(event_id, condition=free_seat_condition(), **deltas):
+                break
+            attendance.status = seat_status
+            attendance.save(update_fields=['status', 'updated_at'])
+            promoted.append(attendance.id)
+
+    for attendance_id in promoted:
+        transaction.on_commit(lambda attendance_id=attendance_id: send_event_rsvp_notification_task.delay(attendance_id))
+    return promoted
+
+
+def get_event_viewer_context(events, request):
+    """
+    Viewer-specific data for a page of events, loaded in two queries instead
+    of per event: the viewer's RSVP status and the events they co-host.
+    Pass it in the EventDetailSerializer context.
+    """
+    profile = None
+    if request and request.user.is_authenticated:
+        profile = get_user_profile(request.user)
+    if not profile:
+        return {'viewer_profile': None, 'viewer_rsvps': {}, 'cohosted_event_ids': set()}
+
+    event_ids = [event.id for event in events]
+    return {
+        'viewer_profile': profile,
+        'viewer_rsvps': dict(
+            EventAttendance.objects.filter(profile=profile, event_id__in=event_ids).values_list('event_id', 'status')
+        ),
+        'cohosted_event_ids': set(
+            Event.co_hosts.through.objects.filter(profile_id=profile.id, event_id__in=event_ids).values_list('event_id', flat=True)
+        ),
+    }
+
+
+def geohash_cells_filter(min_lat, min_lon, max_lat, max_lon):
+    """Q matching events whose geohash falls in the cells covering the box (indexed range scans)."""
+    condition = Q()
+    for cell in covering_cells(min_lat, min_lon, max_lat, max_lon):
+        condition |= Q(geohash__gte=cell, geohash__lt=cell + '~')
+    return condition
+
+
+def find_nearby_events(queryset, latitude, longitude, radius_km=None, bbox=None):
+    """
+    [(event_id, distance_km)] of the events in `queryset` within `radius_km`
+    of the point, or inside `bbox` (min_lat, min_lon, max_lat, max_lon),
+    nearest first. The geohash cells narrow the rows read from the database;
+    the exact check is one vectorized Haversine over the candidates.
+    """
+    if bbox is None:
+        bbox = bounding_box(latitude, longitude, radius_km)
+    min_lat, min_lon, max_lat, max_lon = bbox
+
+    rows = list(
+        queryset.filter(
+            geohash_cells_filter(*bbox),
+            latitude__range=(min_lat, max_lat),
+            longitude__range=(min_lon, max_lon),
+        ).values_list('id', 'latitude', 'longitude')
+    )
+    if not rows:
+        return []
+
+    ids, latitudes, longitudes = zip(*rows)
+    distances = haversine_km(latitude, longitude, latitudes, longitudes)
+    order = distances.argsort(kind='stable')
+    if radius_km is not None:
+        order = order[distances[order] <= radius_km]
+    return [(ids[i], round(float(distances[i]), 3)) for i in order]
+
+
 def get_event_by_id_or_slug(id=None, slug=None):
     if id:
         event = get_object_or_404(Event, id=id)
@@ -7,6 +7,7 @@ from rest_framework.exceptions import ValidationError, PermissionDenied
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from django.db import transaction
 import openpyxl
+import tempfile
 from datetime import datetime, time
 
 
@@ -15,24 +16,38 @@ from django.utils import timezone
 from django.db.models import Q, Count, F, IntegerField, ExpressionWrapper
 from django.db.models.functions import ExtractHour, Coalesce
 from django.shortcuts import get_object_or_404
-from django.http import Http404, HttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.http import Http404, HttpResponse, StreamingHttpResponse, FileResponse
 from django.db import IntegrityError
 
 # Local imports
 from event.serializers import (
     EventCreateSerializer, EventListSerializer, EventAttendanceSerializer, EventSerializer, EventSummarySerializer, EventMediaSerializer, 
     EventCommentSerializer, EventCommentListSerializer, EventMediaCommentSerializer, EventDetailSerializer, EventSerializer,
-    EventUpdateSerializer,EventMediaLikeSerializer,EventMediaCommentLikeSerializer, EventActivityLogSerializer
+    EventUpdateSerializer,EventMediaLikeSerializer,EventMediaCommentLikeSerializer, EventActivityLogSerializer,
+    NearbyEventSerializer, EventAttendanceExportSerializer
 )
 from event.models import (
     Event, EventAttendance, EventMedia, EventComment, EventMediaComment, EventMediaLike,EventMediaCommentLike, EventActivityLog,
-    EventTag
+    EventTag, EventAttendanceExport, EventSearchDocument, RSVP_COUNTER_FIELDS
 )
 from event.choices import (
-    EventStatus, AttendanceStatus, EventActivityType
+    EventStatus, AttendanceStatus, EventActivityType, ExportFormat
 )
+from event.exports import (
+    EXPORT_CONTENT_TYPES, attendance_export_filename, stream_attendance_csv, write_attendance_xlsx
+)
+from event.tasks import generate_attendance_export_task
+from event.calendar_feeds import (
+    GROUP_FEED, PROFILE_FEED, feed_etag, get_feed_body, get_feed_version, make_feed_token, read_feed_token
+)
+from event.analytics import get_event_analytics
+from event.search import date_bucket_filters, get_search_facets
 from event.utils import (
-    handle_event_hashtags, is_host_or_cohost, get_event_by_id_or_slug,handle_event_share
+    handle_event_hashtags, is_host_or_cohost, get_event_by_id_or_slug,handle_event_share, create_rsvp, change_rsvp_status,
+    get_event_viewer_context, find_nearby_events, attendee_total_expression
 )
 from notification.task import (
     send_event_creation_notification_task, send_event_rsvp_notification_task, send_event_media_notification_task, 
@@ -48,7 +63,7 @@ from group.models import (
     Group, GroupMember
 )
 from group.choices import (
-    RoleChoices
+    RoleChoices, PrivacyChoices
 )
 
 from core.services import success_response, error_response, get_user_profile
@@ -116,13 +131,13 @@ class EventDetailAPIView(APIView):
         try:
             if event_id:
                 event = get_object_or_404(
-                    Event.objects.select_related('host'),
+                    Event.objects.select_related('host', 'city', 'state', 'country'),
                     id=event_id,
                     status='published'
                 )
             elif slug:
                 event = get_object_or_404(
-                    Event.objects.select_related('host'),
+                    Event.objects.select_related('host', 'city', 'state', 'country'),
                     slug=slug,
                     status='published'
                 )
@@ -181,6 +196,85 @@ class EventListAPIView(APIView, PaginationMixin):
             return Response(error_response(str(e)), status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+class NearbyEventsAPIView(APIView, PaginationMixin):
+    """
+    GET /event/nearby/
+    Upcoming in-person events around a point, nearest first.
+    Query params:
+      - lat, lng: the point (defaults to the coordinates of the user's city)
+      - radius_km: search radius, default 25, max 500
+      - bbox: min_lat,min_lng,max_lat,max_lng, searched instead of the radius
+      - sort: "distance" (default) or "start" (start time, over all events in range)
+    Each event carries distance_km from the point.
+    """
+    permission_classes = [IsAuthenticated]
+    DEFAULT_RADIUS_KM = 25
+    MAX_RADIUS_KM = 500
+
+    def get(self, request):
+        try:
+            params = request.query_params
+            try:
+                latitude, longitude = self.get_point(request)
+                radius_km = bbox = None
+                if params.get('bbox'):
+                    bbox = tuple(float(value) for value in params['bbox'].split(','))
+                    if len(bbox) != 4 or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+                        raise ValueError("bbox must be min_lat,min_lng,max_lat,max_lng")
+                    if latitude is None:
+                        latitude, longitude = (bbox[0] + bbox[2]) / 2, (bbox[1] + bbox[3]) / 2
+                else:
+                    radius_km = float(params.get('radius_km', self.DEFAULT_RADIUS_KM))
+                    if not 0 < radius_km <= self.MAX_RADIUS_KM:
+                        raise ValueError(f"radius_km must be between 0 and {self.MAX_RADIUS_KM}")
+            except ValueError as e:
+                return Response(error_response(str(e)), status=status.HTTP_400_BAD_REQUEST)
+
+            if latitude is None:
+                return Response(
+                    error_response("lat and lng are required when your profile has no city coordinates"),
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            upcoming = Event.objects.filter(
+                status=EventStatus.PUBLISHED, is_online=False, end_datetime__gte=timezone.now()
+            )
+            nearby = find_nearby_events(upcoming, latitude, longitude, radius_km=radius_km, bbox=bbox)
+            distances = dict(nearby)
+            event_ids = list(distances)
+            if params.get('sort') == 'start':
+                # Every event within the radius in start order, before paginating
+                event_ids = list(
+                    Event.objects.filter(id__in=event_ids).order_by('start_datetime', 'id').values_list('id', flat=True)
+                )
+
+            page_ids = self.paginate_queryset(event_ids, request)
+            events = Event.objects.filter(id__in=page_ids).select_related('host').prefetch_related(
+                'co_hosts', 'attendees', 'tags'
+            ).in_bulk()
+            page = [events[event_id] for event_id in page_ids if event_id in events]
+
+            serializer = NearbyEventSerializer(page, many=True, context={'request': request, 'distances': distances})
+            return self.get_paginated_response(serializer.data)
+
+        except Exception as e:
+            return Response(error_response(str(e)), status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    def get_point(self, request):
+        lat, lng = request.query_params.get('lat'), request.query_params.get('lng')
+        if lat is not None and lng is not None:
+            latitude, longitude = float(lat), float(lng)
+            if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+                raise ValueError("lat/lng out of range")
+            return latitude, longitude
+
+        profile = get_user_profile(request.user)
+        city = getattr(profile, 'city', None)
+        if city and city.latitude is not None and city.longitude is not None:
+            return float(city.latitude), float(city.longitude)
+        return None, None
+
+
 class EventAttendacneAPIView(APIView, PaginationMixin):
     """
     API for Event RSVP
@@ -214,12 +308,18 @@ class EventAttendacneAPIView(APIView, PaginationMixin):
 
             serializer = EventAttendanceSerializer(data=data, context={'request': request})
             serializer.is_valid(raise_exception=True)
-            attendance = serializer.save()
+            # Takes a seat atomically, or a waitlist place when the event is full
+            attendance = create_rsvp(event.id, profile.id, status_value)
+            if attendance is None:
+                # A concurrent request for the same profile got in first
+                return Response(success_response("RSVP already submitted"), status=status.HTTP_200_OK)
             try:
                 transaction.on_commit(lambda:send_event_rsvp_notification_task.delay(attendance.id))
             except:
                 pass
-            return Response(success_response(serializer.data), status=status.HTTP_200_OK)
+            event.refresh_from_db(fields=['max_attendees', *RSVP_COUNTER_FIELDS.values()])
+            data = EventAttendanceSerializer(attendance, context={'request': request}).data
+            return Response(success_response({**data, "spots_remaining": event.spots_remaining}), status=status.HTTP_200_OK)
         
         except Event.DoesNotExist:
             return Response(error_response("Event not found"), status=status.HTTP_404_NOT_FOUND)
@@ -264,14 +364,13 @@ class EventAttendacneAPIView(APIView, PaginationMixin):
                 # Force RSVP to pending regardless of requested status
                 status_value = AttendanceStatus.PENDING
 
-            data = {'status': status_value}
-            serializer = EventAttendanceSerializer(attendance, data=data, partial=True, context={'request': request})
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
+            attendance = change_rsvp_status(attendance.id, status_value)
+            event.refresh_from_db(fields=['max_attendees', *RSVP_COUNTER_FIELDS.values()])
 
             return Response(success_response( {
-                    "event": attendance.event.title,
-                    "status": attendance.status
+                    "event": event.title,
+                    "status": attendance.status,
+                    "spots_remaining": event.spots_remaining
                 }),  status=status.HTTP_200_OK)
         except ValidationError as e:
             return Response(error_response(e.detail), status=status.HTTP_400_BAD_REQUEST)
@@ -604,23 +703,18 @@ class PopularEventsAPIView(APIView, PaginationMixin):
         try:
             now = timezone.now()
 
-            # Filter events: published & upcoming
+            # Filter events: published & upcoming, ranked by the stored score (no joins)
             events_qs = Event.objects.filter(
                 status=EventStatus.PUBLISHED,
                 start_datetime__gte=now
-            ).annotate(
-                annotated_attendee_count=Count('attendees', distinct=True),
-                annotated_media_count=Count('media', distinct=True)
-            ).annotate(
-                popularity_score=F('annotated_attendee_count') + F('comment_count') + F('annotated_media_count')
-            ).order_by('-popularity_score', 'start_datetime')
-            
-            higher_popular_events = events_qs.filter(
-                Q(annotated_attendee_count__gte=100) |
+            ).select_related('host').order_by('-popularity_score', 'start_datetime')
+
+            higher_popular_events = events_qs.alias(attendee_total=attendee_total_expression()).filter(
+                Q(attendee_total__gte=100) |
                 Q(comment_count__gte=50) | 
-                Q(annotated_media_count__gte=20)
+                Q(media_count__gte=20)
             )
-            if higher_popular_events:
+            if higher_popular_events.exists():
                 popular_events = higher_popular_events
             else:
                 popular_events = events_qs
@@ -745,11 +839,13 @@ class MyHostedEventsAPIView(APIView, PaginationMixin):
             # Fetch events where user is host or co-host
             events = Event.objects.filter(
                 (Q(host=profile) | Q(co_hosts=profile))
-            ).order_by('-start_datetime')
+            ).select_related('host', 'city', 'state', 'country').order_by('-start_datetime')
 
             # Paginate
             paginated_events = self.paginate_queryset(events, request)
-            serializer = EventDetailSerializer(paginated_events, many=True, context={'request': request})
+            serializer = EventDetailSerializer(paginated_events, many=True, context={
+                'request': request, **get_event_viewer_context(paginated_events, request)
+            })
 
             return self.get_paginated_response(serializer.data)
 
@@ -1069,10 +1165,12 @@ class EventListByHostOrCoHostAPIView(APIView, PaginationMixin):
             events = Event.objects.filter(
                 Q(host=profile) | Q(co_hosts=profile),
                 status='published'
-            ).distinct()
+            ).select_related('host', 'city', 'state', 'country').distinct()
 
             paginated = self.paginate_queryset(events, request)
-            serializer = EventDetailSerializer(paginated, many=True, context={'request': request})
+            serializer = EventDetailSerializer(paginated, many=True, context={
+                'request': request, **get_event_viewer_context(paginated, request)
+            })
             return self.get_paginated_response(success_response(serializer.data))
 
         except Exception as e:
@@ -1104,13 +1202,9 @@ class ApproveRSVPAPIView(APIView):
                     status=status.HTTP_403_FORBIDDEN
                 )
 
-            # Perform action
-            if action == 'approve':
-                attendance.status = AttendanceStatus.INTERESTED
-            else:
-                attendance.status = AttendanceStatus.DECLINED
-
-            attendance.save()
+            # Perform action (approving a waitlisted RSVP still needs a free seat)
+            new_status = AttendanceStatus.INTERESTED if action == 'approve' else AttendanceStatus.DECLINED
+            attendance = change_rsvp_status(attendance.id, new_status)
 
             return Response(success_response({
                 "profile": attendance.profile.username,
@@ -1286,50 +1380,8 @@ class EventAnalyticsAPIView(APIView):
     def get(self, request, event_id):
         try:
             event = Event.objects.get(id=event_id)
-
-            # Reach
-            reach = EventActivityLog.objects.filter(
-                event=event, activity_type=EventActivityType.VIEW
-            ).values('profile').distinct().count()
-            attendance_stats = (
-                EventAttendance.objects
-                .filter(event=event)
-                .values('status')
-                .annotate(count=Count('id'))
-            )
-            rsvp_counts = {status: 0 for status in AttendanceStatus.values}
-            for entry in attendance_stats:
-                status = entry["status"]
-                count = entry["count"]
-                rsvp_counts[status] = count
-            # RSVP Rate
-            rsvped_users = EventAttendance.objects.filter(
-                event=event
-            ).values('profile').distinct().count()
-            rsvp_rate = (rsvped_users / reach * 100) if reach > 0 else 0
-
-            # Peak Engagement Time
-            peak_hour = EventActivityLog.objects.filter(
-                event=event,
-                activity_type__in=[EventActivityType.VIEW, EventActivityType.COMMENT]
-            ).annotate(hour=ExtractHour('timestamp')).values('hour').annotate(
-                total=Count('id')
-            ).order_by('-total').first()
-
-            # Top Commenters
-            top_commenters = EventComment.objects.filter(
-                event=event
-            ).values('profile__username').annotate(
-                total_comments=Count('id')
-            ).order_by('-total_comments')[:5]
-
-            return Response({
-                "reach": reach,
-                "rsvp_counts": rsvp_counts,
-                "rsvp_rate": round(rsvp_rate, 2),
-                "peak_engagement_hour": peak_hour,
-                "top_commenters": list(top_commenters)
-            })
+            # Pre-aggregated hourly rollups, see event.analytics
+            return Response(get_event_analytics(event))
 
         except Event.DoesNotExist:
             return Response({"detail": "Event not found."}, status=404)
@@ -1410,13 +1462,13 @@ class PublicEventDetailAPIView(APIView):
         try:
             if event_id:
                 event = get_object_or_404(
-                    Event.objects.select_related('host'),
+                    Event.objects.select_related('host', 'city', 'state', 'country'),
                     id=event_id,
                     status='published'
                 )
             elif slug:
                 event = get_object_or_404(
-                    Event.objects.select_related('host'),
+                    Event.objects.select_related('host', 'city', 'state', 'country'),
                     slug=slug,
                     status='published'
                 )
@@ -1436,6 +1488,11 @@ class PublicEventDetailAPIView(APIView):
         
 
 class DownloadEventAttendanceExcel(APIView):
+    """
+    GET /event/events/attendance/download/<event_id>/?file_format=xlsx|csv
+    Streams the attendance list in constant memory, whatever the event size.
+    For very large events prefer EventAttendanceExportAPIView (background).
+    """
     permission_classes = [IsAuthenticated]
 
     def get(self, request, event_id):
@@ -1445,42 +1502,120 @@ class DownloadEventAttendanceExcel(APIView):
             return Response({"error": "Event not found"}, status=status.HTTP_404_NOT_FOUND)
 
         profile = get_user_profile(request.user)  
-        if profile != event.host and profile not in event.co_hosts.all():
+        if not is_host_or_cohost(event, profile):
             return Response({"error": "Only host or co-host can download attendance"}, status=status.HTTP_403_FORBIDDEN)
 
-        # Create workbook
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = f"Attendance for {event.title}"
-
-        # Add headers
-        ws.append(["ID", "Username", "Email", "Status", "Joined At"])
-
-        # Order by status
-        attendance_qs = EventAttendance.objects.filter(event=event).select_related("profile").order_by("status")
-
-        for att in attendance_qs:
-            ws.append([
-                att.id,
-                att.profile.username,
-                att.profile.user.email,
-                att.status,
-                att.created_at.strftime('%Y-%m-%d %H:%M:%S') if hasattr(att, 'created_at') else ''
-            ])
-
-        # Return Excel file
-        response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        filename = f"{event.title}_attendance.xlsx".replace(" ", "_")
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        wb.save(response)
+        file_format = request.query_params.get('file_format', ExportFormat.XLSX)
+        if file_format not in ExportFormat.values:
+            return Response({"error": "file_format must be xlsx or csv"}, status=status.HTTP_400_BAD_REQUEST)
+
+        filename = attendance_export_filename(event, file_format)
+        if file_format == ExportFormat.CSV:
+            response = StreamingHttpResponse(stream_attendance_csv(event.id), content_type=EXPORT_CONTENT_TYPES['csv'])
+            response['Content-Disposition'] = f'attachment; filename="{filename}"'
+            return response
+
+        # Write-only workbook spooled to disk, then streamed from the file
+        tmp = tempfile.TemporaryFile()
+        write_attendance_xlsx(event, tmp)
+        tmp.seek(0)
+        return FileResponse(tmp, as_attachment=True, filename=filename, content_type=EXPORT_CONTENT_TYPES['xlsx'])
+
+
+class EventAttendanceExportAPIView(APIView):
+    """
+    Background attendance exports for very large events.
+    POST /event/events/attendance/export/<event_id>/ {"file_format": "xlsx"|"csv"}
+        queues an export; the requester is notified when the file is ready
+    GET  /event/events/attendance/export/<event_id>/
+        the requester's recent exports of the event, with status and file URL
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get_event(self, request, event_id):
+        event = get_object_or_404(Event, id=event_id)
+        profile = get_user_profile(request.user)
+        if not is_host_or_cohost(event, profile):
+            raise PermissionDenied("Only host or co-host can export attendance")
+        return event, profile
+
+    def post(self, request, event_id):
+        event, profile = self.get_event(request, event_id)
+        file_format = request.data.get('file_format', ExportFormat.XLSX)
+        if file_format not in ExportFormat.values:
+            return Response(error_response("file_format must be xlsx or csv"), status=status.HTTP_400_BAD_REQUEST)
+
+        export = EventAttendanceExport.objects.create(event=event, requested_by=profile, file_format=file_format)
+        transaction.on_commit(lambda: generate_attendance_export_task.delay(export.id))
+        serializer = EventAttendanceExportSerializer(export, context={'request': request})
+        return Response(success_response(serializer.data), status=status.HTTP_202_ACCEPTED)
+
+    def get(self, request, event_id):
+        event, profile = self.get_event(request, event_id)
+        exports = EventAttendanceExport.objects.filter(event=event, requested_by=profile)[:10]
+        serializer = EventAttendanceExportSerializer(exports, many=True, context={'request': request})
+        return Response(success_response(serializer.data))
+
+
+
+class CalendarFeedAPIView(APIView):
+    """
+    GET /event/calendar/<token>.ics
+    iCalendar subscription feed of a profile or group (token from
+    CalendarFeedURLAPIView). Answers conditional GETs (If-None-Match /
+    If-Modified-Since) with 304 from the cache alone.
+    """
+    permission_classes = [AllowAny]
+    authentication_classes = []
+
+    def get(self, request, token):
+        feed = read_feed_token(token)
+        if feed is None or feed[0] not in (PROFILE_FEED, GROUP_FEED):
+            raise Http404("Unknown calendar feed")
+        kind, object_id = feed
+
+        version = get_feed_version(kind, object_id)
+        etag = quote_etag(feed_etag(kind, object_id, version))
+        response = get_conditional_response(request, etag=etag, last_modified=int(version))
+        if response is None:
+            response = HttpResponse(get_feed_body(kind, object_id, version), content_type='text/calendar; charset=utf-8')
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(version)
+        response['Cache-Control'] = 'private, no-cache'
         return response
 
 
+class CalendarFeedURLAPIView(APIView):
+    """
+    GET /event/calendar/feed-url/            -> the user's own feed (hosted and RSVP'd events)
+    GET /event/calendar/feed-url/?group=<id> -> a group's feed (private groups: members only)
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        profile = get_user_profile(request.user)
+        group_id = request.query_params.get('group')
+        if group_id:
+            group = get_object_or_404(Group, id=group_id)
+            if group.privacy == PrivacyChoices.PRIVATE and not GroupMember.objects.filter(
+                group=group, profile=profile, is_banned=False
+            ).exists():
+                return Response(error_response("Only members can subscribe to this group's calendar"), status=status.HTTP_403_FORBIDDEN)
+            token = make_feed_token(GROUP_FEED, group.id)
+        else:
+            token = make_feed_token(PROFILE_FEED, profile.id)
+
+        url = request.build_absolute_uri(reverse('calendar-feed', kwargs={'token': token}))
+        return Response(success_response({"url": url, "webcal_url": url.replace('https://', 'webcal://').replace('http://', 'webcal://')}))
+
 
 class FilterEventListAPIView(APIView, PaginationMixin):
+    """
+    Event search with facet counts. Filters run on the search documents
+    (event.search), so no filter needs a join or distinct().
+    """
     def get(self, request):
         try:
-            queryset = Event.objects.all()
             filters = Q()
 
             # Filters
@@ -1496,6 +1631,7 @@ class FilterEventListAPIView(APIView, PaginationMixin):
             host_name = request.GET.get('host_name')
             co_host_name = request.GET.get('co_host_name')
             tag = request.GET.get('tag')
+            date_bucket = request.GET.get('date_bucket')
             start_date = request.GET.get('start_date')
             end_date = request.GET.get('end_date')
             ordering = request.GET.get('ordering')
@@ -1509,21 +1645,26 @@ class FilterEventListAPIView(APIView, PaginationMixin):
             if address:
                 filters &= Q(address__icontains=address)
             if city_name:
-                filters &= Q(city__name__icontains=city_name)
+                filters &= Q(city_name__icontains=city_name)
             if state_name:
-                filters &= Q(state__name__icontains=state_name)
+                filters &= Q(state_name__icontains=state_name)
             if country_name:
-                filters &= Q(country__name__icontains=country_name)
+                filters &= Q(country_name__icontains=country_name)
             if host_name:
-                filters &= Q(host__username__icontains=host_name)
+                filters &= Q(host_name__icontains=host_name)
             if co_host_name:
-                filters &= Q(co_hosts__username__icontains=co_host_name)
+                filters &= Q(co_host_names__icontains=co_host_name)
             if tag:
-                filters &= Q(tags__name__icontains=tag)
+                filters &= Q(tag_names__icontains=tag)
             if upcoming and upcoming.lower() == 'true':
                 filters &= Q(start_datetime__gt=timezone.now())
             if past and past.lower() == 'true':
                 filters &= Q(end_datetime__lt=timezone.now())
+            if date_bucket:
+                buckets = date_bucket_filters()
+                if date_bucket not in buckets:
+                    raise ValueError(f"Invalid date_bucket. Use one of: {', '.join(buckets)}.")
+                filters &= buckets[date_bucket]
 
             # Start and end date filter
             if start_date and end_date:
@@ -1534,35 +1675,25 @@ class FilterEventListAPIView(APIView, PaginationMixin):
                 except ValueError:
                     return Response({"error": "Invalid date format. Use YYYY-MM-DD."}, status=400)
 
-            queryset = queryset.filter(filters)
-
-            # Annotate attendance
-            queryset = queryset.annotate(
-                attendance_count=Count('eventattendance', distinct=True)
-            )
+            documents = EventSearchDocument.objects.filter(filters)
+            queryset = Event.objects.filter(id__in=documents.values('event_id'))
 
-            # Popularity
-            queryset = queryset.annotate(
-                popularity=ExpressionWrapper(
-                    Coalesce(F('view_count'), 0) +
-                    Coalesce(F('share_count'), 0) +
-                    Coalesce(F('attendance_count'), 0),
-                    output_field=IntegerField()
-                )
-            )
-
-            # Ordering
+            # Ordering (popularity from stored counters, no joins)
             if ordering == 'popular':
-                queryset = queryset.order_by('-popularity')
+                queryset = queryset.alias(
+                    popularity=F('view_count') + F('share_count') + attendee_total_expression()
+                ).order_by('-popularity')
             elif ordering == 'date':
                 queryset = queryset.order_by('start_datetime')
             elif ordering == 'latest':
                 queryset = queryset.order_by('-id')
 
-            queryset = queryset.distinct()
+            queryset = queryset.select_related('host').prefetch_related('co_hosts', 'attendees', 'tags')
             paginated_queryset = self.paginate_queryset(queryset, request)
             serializer = EventListSerializer(paginated_queryset, many=True)
-            return self.get_paginated_response(serializer.data)
+            response = self.get_paginated_response(serializer.data)
+            response.data['facets'] = get_search_facets(documents)
+            return response
 
         except ValueError as e:
             return Response(error_response(str(e)), status=status.HTTP_400_BAD_REQUEST)
@@ -1,9 +1,11 @@
 # groups/signals.py
+from django.db import transaction
 from django.db.models.signals import post_delete
 from django.dispatch import receiver
 
 from .models import GroupMember
 from chat.models import ChatGroup, ChatGroupMember
+from chat.utils import notify_chat_member_removed
 
 
 @receiver(post_delete, sender=GroupMember)
@@ -16,9 +18,13 @@ def remove_chat_member_on_group_remove(sender, instance, **kwargs):
         # Find ChatGroup for this Group
         chat_group = ChatGroup.objects.filter(group=instance.group).first()
         if chat_group:
-            ChatGroupMember.objects.filter(
+            removed, _ = ChatGroupMember.objects.filter(
                 group=chat_group,
                 profile=instance.profile
             ).delete()
+            if removed:
+                # Revoke open WebSocket connections of the removed member
+                chat_group_id, profile_id = chat_group.id, instance.profile_id
+                transaction.on_commit(lambda: notify_chat_member_removed(chat_group_id, profile_id))
     except Exception as e:
         pass
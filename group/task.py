@@ -5,10 +5,13 @@ from django.db.models import Count, Q
 from django.db import transaction
 
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from datetime import timedelta
 from django.db.models import Count, Avg, Q, Max
 
 from notification.task_monitor import monitor_task
+from notification.task_lock import single_instance_task
+from notification.batch_jobs import batch_job, start_batch_job
 from profiles.models import Profile
 from group.models import (Group ,GroupMember, GroupPost, GroupPostComment, GroupPostCommentLike, GroupPostLike, GroupActionLog)
 from group.choices import RoleChoices,JoiningRequestStatus
@@ -391,17 +394,37 @@ def notify_owner_of_group_comment_like(comment_like_id):
 
 
 @shared_task
+@single_instance_task("send_weekly_group_digest", ttl=1800)
 @monitor_task(task_name="send_weekly_group_digest", expected_interval_minutes=10080)
 def send_weekly_group_digest(event_id=None, debug=False, return_data=False):
     logger.info("Running: send_weekly_group_digest")
-    one_week_ago = timezone.now() - timedelta(days=7)
     now = timezone.now()
+    one_week_ago = now - timedelta(days=7)
+
+    run = start_batch_job("send_weekly_group_digest", params={
+        "start": one_week_ago.isoformat(),
+        "end": now.isoformat(),
+        "send_emails": not return_data,
+    })
+    if run is None:
+        return "Skipped: the previous batch run is still in progress"
+    return f"Batch run {run.id}: {run.total_chunks} chunks"
+
+
+@batch_job("send_weekly_group_digest", queryset=lambda: Group.objects.all(), chunk_size=200)
+def send_weekly_group_digest_chunk(groups, start, end, send_emails=True):
+    one_week_ago = parse_datetime(start)
+    now = parse_datetime(end)
+    processed = 0
+
+    # Upcoming events are the same for every group
+    upcoming_events = list(
+        Event.objects.filter(start_datetime__gte=now)
+        .order_by("start_datetime")[:5]
+    )
 
-
-    try:
-        groups = Group.objects.all()
-
-        for group in groups:
+    for group in groups:
+        try:
             # Top posts (past week)
             top_posts = (
                 GroupPost.objects.filter(group=group, created_at__range=(one_week_ago, now))
@@ -417,23 +440,15 @@ def send_weekly_group_digest(event_id=None, debug=False, return_data=False):
                 .order_by("-post_count")[:5]
             )
 
-            # Upcoming events
-            upcoming_events = (
-                Event.objects.filter(start_datetime__gte=now)
-                .order_by("start_datetime")[:5]
-            )
-
             # Admin members with email notifications enabled
             admin_members = Profile.objects.filter(
                 id__in=GroupMember.objects.filter(
                     group=group, role=RoleChoices.ADMIN
                 ).values_list("profile_id", flat=True),
                 notify_email=True
-            )
-
+            ).select_related("user", "organization__user")
 
-
-            def send_emails_and_notify():
+            if send_emails:
                 for member in admin_members:
                     user = get_actual_user(member)
                     if not user or not user.email:
@@ -460,12 +475,12 @@ def send_weekly_group_digest(event_id=None, debug=False, return_data=False):
                             f"[send_weekly_group_digest] Failed to send digest to {member.username} ({user.email}): {e}",
                             exc_info=True
                         )
+            processed += 1
 
-            if not return_data:
-                transaction.on_commit(send_emails_and_notify)
+        except Exception as e:
+            logger.error(f"[send_weekly_group_digest] Unexpected error for group {group.id}: {e}", exc_info=True)
 
-    except Exception as e:
-        logger.error(f"[send_weekly_group_digest] Unexpected error: {e}", exc_info=True)
+    return processed
 
 
 @shared_task
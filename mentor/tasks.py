@@ -18,6 +18,8 @@ from mentor.models import (
 from notification.choices import NotificationType
 from notification.models import Notification
 from notification.task_monitor import monitor_task
+from notification.task_lock import single_instance_task
+from notification.batch_jobs import batch_job, start_batch_job
 from notification.utils import create_notification
 from profiles.models import (
     Profile
@@ -102,17 +104,31 @@ def calculate_mentor_metrics_for_profile(profile):
         print(f"[MentorMetricError] for profile {profile.id}: {e}")
 
 @shared_task
+@single_instance_task("run_mentor_eligibility_check", ttl=1800)
 @monitor_task(task_name="run_mentor_eligibility_check", expected_interval_minutes=1440)
 def run_mentor_eligibility_check():
     logger.info("Running: run_mentor_eligibility_check")
     """
     This task checks all profiles for mentor eligibility and updates their metrics.         
     It runs daily to ensure all profiles are evaluated.
+    The profiles are processed in checkpointed chunks, see notification.batch_jobs.
     """
-    profiles = Profile.objects.filter(is_active=True, mentor_blacklisted=False,mentor_mail_sent=False, )
+    run = start_batch_job("run_mentor_eligibility_check")
+    if run is None:
+        return "Skipped: the previous batch run is still in progress"
+    return f"Batch run {run.id}: {run.total_chunks} chunks"
 
+
+@batch_job(
+    "run_mentor_eligibility_check",
+    queryset=lambda: Profile.objects.filter(is_active=True, mentor_blacklisted=False, mentor_mail_sent=False),
+)
+def mentor_eligibility_chunk(profiles):
+    processed = 0
     for profile in profiles:
         calculate_mentor_metrics_for_profile(profile)
+        processed += 1
+    return processed
 
 
 # from mentor.tasks import calculate_mentor_metrics_for_profile
@@ -2,7 +2,7 @@ from django.contrib import admin
 from import_export.admin import ImportExportModelAdmin
 
 from notification.models import (
-    Notification,DailyQuote,DailyQuoteSeen, ScheduledTaskMonitor
+    Notification,DailyQuote,DailyQuoteSeen, ScheduledTaskMonitor, ScheduledTaskRun, TaskLock, BatchJobRun, BatchJobChunk
 )
 from .resources import DailyQuoteResource
 
@@ -23,4 +23,26 @@ class DailyQuoteSeenAdmin(admin.ModelAdmin):
 
 @admin.register(ScheduledTaskMonitor)
 class ScheduledTaskMonitorAdmin(admin.ModelAdmin):
-    list_display=['task_name', 'last_run_at', 'expected_interval_minutes']
\ No newline at end of file
+    list_display=['task_name', 'last_run_at', 'expected_interval_minutes', 'p50_duration_seconds', 'p95_duration_seconds']
+
+@admin.register(ScheduledTaskRun)
+class ScheduledTaskRunAdmin(admin.ModelAdmin):
+    list_display=['monitor', 'started_at', 'duration_seconds', 'items_processed', 'success', 'overlapped']
+    list_filter=['monitor', 'success', 'overlapped']
+    date_hierarchy='started_at'
+    list_select_related=['monitor']
+
+@admin.register(TaskLock)
+class TaskLockAdmin(admin.ModelAdmin):
+    list_display=['name', 'owner', 'acquired_at', 'expires_at']
+
+@admin.register(BatchJobRun)
+class BatchJobRunAdmin(admin.ModelAdmin):
+    list_display=['job_name', 'status', 'completed_chunks', 'failed_chunks', 'total_chunks', 'items_processed', 'started_at', 'finished_at']
+    list_filter=['job_name', 'status']
+
+@admin.register(BatchJobChunk)
+class BatchJobChunkAdmin(admin.ModelAdmin):
+    list_display=['run', 'start_id', 'end_id', 'status', 'items_processed', 'attempts', 'finished_at']
+    list_filter=['status']
+    list_select_related=['run']
@@ -0,0 +1,242 @@
+import logging
+import uuid
+from datetime import timedelta
+
+from celery import chain, group, shared_task
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from notification.choices import BatchChunkStatus, BatchJobStatus
+from notification.models import BatchJobChunk, BatchJobRun, ScheduledTaskMonitor
+from notification.task_lock import get_lock_store
+from notification.task_monitor import defer_run_completion, finish_deferred_run
+
+logger = logging.getLogger(__name__)
+
+# job name -> BatchJob, filled by the @batch_job decorator at import time
+BATCH_JOBS = {}
+
+
+class BatchJob:
+    def __init__(self, name, get_queryset, process_chunk, chunk_size, concurrency, resume_within, stale_chunk_after):
+        self.name = name
+        self.get_queryset = get_queryset
+        self.process_chunk = process_chunk
+        self.chunk_size = chunk_size
+        self.concurrency = concurrency
+        self.resume_within = resume_within
+        self.stale_chunk_after = stale_chunk_after
+
+
+def batch_job(name, queryset, chunk_size=500, concurrency=4,
+              resume_within=timedelta(hours=6), stale_chunk_after=timedelta(hours=1)):
+    """
+    Registers `func(queryset, **params)` as the chunk processor of job `name`.
+
+    `queryset` is a callable returning the rows to process. It is split into
+    primary-key ranges of `chunk_size` rows, and each range is handed to the
+    processor as a filtered queryset. The processor returns the number of
+    items it handled.
+
+    At most `concurrency` chunks run at the same time, and a run never
+    starts while one of the same job is still in progress. An unfinished
+    run started within `resume_within` is resumed rather than restarted.
+    Chunks stuck in "running" for longer than `stale_chunk_after` are
+    treated as crashed and re-queued.
+
+    Usage:
+
+        @batch_job("run_mentor_eligibility_check", queryset=lambda: Profile.objects.filter(is_active=True))
+        def mentor_eligibility_chunk(profiles):
+            ...
+            return processed
+    """
+    def decorator(func):
+        BATCH_JOBS[name] = BatchJob(
+            name, queryset, func, chunk_size, concurrency, resume_within, stale_chunk_after
+        )
+        return func
+    return decorator
+
+
+def iter_pk_ranges(queryset, chunk_size):
+    """Yields (first_pk, last_pk) for consecutive keyset pages of the queryset."""
+    pks = queryset.order_by('pk').values_list('pk', flat=True)
+    last_pk = None
+    while True:
+        page = pks if last_pk is None else pks.filter(pk__gt=last_pk)
+        ids = list(page[:chunk_size])
+        if not ids:
+            return
+        yield ids[0], ids[-1]
+        last_pk = ids[-1]
+
+
+def _run_in_progress(job):
+    """Unfinished run of the job that started, or had a chunk start or finish, within stale_chunk_after."""
+    since = timezone.now() - job.stale_chunk_after
+    return BatchJobRun.objects.filter(job_name=job.name, status=BatchJobStatus.RUNNING).filter(
+        Q(started_at__gte=since) | Q(chunks__started_at__gte=since) | Q(chunks__finished_at__gte=since)
+    ).order_by('-started_at').first()
+
+
+def _resumable_run(job):
+    run = BatchJobRun.objects.filter(
+        job_name=job.name,
+        status__in=[BatchJobStatus.RUNNING, BatchJobStatus.FAILED],
+        started_at__gte=timezone.now() - job.resume_within,
+    ).order_by('-started_at').first()
+    if not run:
+        return None
+
+    # Failed chunks get another attempt, crashed ones are re-queued
+    run.chunks.filter(
+        Q(status=BatchChunkStatus.FAILED) |
+        Q(status=BatchChunkStatus.RUNNING, started_at__lt=timezone.now() - job.stale_chunk_after)
+    ).update(status=BatchChunkStatus.PENDING, error=None)
+    run.status = BatchJobStatus.RUNNING
+    run.finished_at = None
+    run.save(update_fields=['status', 'finished_at'])
+    return run
+
+
+def start_batch_job(name, params=None):
+    """
+    Starts (or resumes) batch job `name` and dispatches its pending chunks as
+    a Celery group of `concurrency` chains. Returns the BatchJobRun, or None
+    when a run of the job is still in progress.
+
+    Called from a monitor_task, the monitored run stays open until the last
+    chunk settles, and reports the items and failures of the chunks.
+    """
+    job = BATCH_JOBS[name]
+    lock_store, owner = get_lock_store(), uuid.uuid4().hex
+    # Held while checking for a run in progress, so two dispatches cannot both start one
+    if not lock_store.acquire(f"batch_job:{name}", owner, ttl=300):
+        logger.warning(f"[BatchJob] {name} not started: another dispatch is starting it")
+        return None
+    try:
+        running = _run_in_progress(job)
+        if running:
+            logger.warning(f"[BatchJob] {name} not started: run {running.id} is still in progress")
+            return None
+        return _start_run(job, params)
+    finally:
+        lock_store.release(f"batch_job:{name}", owner)
+
+
+def _start_run(job, params):
+    name = job.name
+    monitor_run = defer_run_completion()
+    run = _resumable_run(job)
+    if run:
+        logger.info(f"[BatchJob] Resuming {name} run {run.id}")
+        if run.monitor_run_id:
+            finish_deferred_run(
+                run.monitor_run_id, success=False, items=run.items_processed,
+                error=f"Batch run {run.id} stalled and was resumed by a later run",
+            )
+        run.monitor_run = monitor_run
+        run.save(update_fields=['monitor_run'])
+    else:
+        run = BatchJobRun.objects.create(job_name=name, params=params or {}, monitor_run=monitor_run)
+        BatchJobChunk.objects.bulk_create(
+            BatchJobChunk(run=run, start_id=start_id, end_id=end_id)
+            for start_id, end_id in iter_pk_ranges(job.get_queryset(), job.chunk_size)
+        )
+
+    chunk_ids = list(
+        run.chunks.filter(status=BatchChunkStatus.PENDING).order_by('start_id').values_list('id', flat=True)
+    )
+    update_batch_progress(run.id)
+
+    if chunk_ids:
+        lanes = [chunk_ids[i::job.concurrency] for i in range(job.concurrency)]
+        group(
+            chain(process_batch_chunk.si(chunk_id) for chunk_id in lane)
+            for lane in lanes if lane
+        ).apply_async()
+
+    logger.info(f"[BatchJob] {name} run {run.id}: dispatched {len(chunk_ids)} chunks")
+    run.refresh_from_db()
+    return run
+
+
+@shared_task
+def process_batch_chunk(chunk_id):
+    # Claim the chunk so a resumed or duplicate dispatch never runs it twice
+    claimed = BatchJobChunk.objects.filter(id=chunk_id, status=BatchChunkStatus.PENDING).update(
+        status=BatchChunkStatus.RUNNING, started_at=timezone.now()
+    )
+    if not claimed:
+        return
+
+    chunk = BatchJobChunk.objects.select_related('run').get(id=chunk_id)
+    run = chunk.run
+    chunk.attempts += 1
+
+    try:
+        job = BATCH_JOBS[run.job_name]
+        queryset = job.get_queryset().filter(pk__gte=chunk.start_id, pk__lte=chunk.end_id).order_by('pk')
+        chunk.items_processed = job.process_chunk(queryset, **run.params) or 0
+        chunk.status = BatchChunkStatus.DONE
+        chunk.error = None
+    except Exception as e:
+        # Do not raise: the rest of this chain must still run
+        logger.error(f"[BatchJob] {run.job_name} chunk {chunk.start_id}-{chunk.end_id} failed: {e}", exc_info=True)
+        chunk.status = BatchChunkStatus.FAILED
+        chunk.error = str(e)
+
+    chunk.finished_at = timezone.now()
+    chunk.save(update_fields=['status', 'items_processed', 'attempts', 'error', 'finished_at'])
+    update_batch_progress(run.id)
+
+
+def update_batch_progress(run_id):
+    """
+    Recomputes run counters from its chunk checkpoints, closes the run (and
+    the monitored run that started it) once every chunk is settled and
+    mirrors progress onto ScheduledTaskMonitor.
+    """
+    stats = BatchJobChunk.objects.filter(run_id=run_id).aggregate(
+        total=Count('id'),
+        done=Count('id', filter=Q(status=BatchChunkStatus.DONE)),
+        failed=Count('id', filter=Q(status=BatchChunkStatus.FAILED)),
+        items=Sum('items_processed'),
+    )
+    run = BatchJobRun.objects.get(id=run_id)
+    run.total_chunks = stats['total']
+    run.completed_chunks = stats['done']
+    run.failed_chunks = stats['failed']
+    run.items_processed = stats['items'] or 0
+    run.save(update_fields=['total_chunks', 'completed_chunks', 'failed_chunks', 'items_processed'])
+
+    if run.completed_chunks + run.failed_chunks >= run.total_chunks:
+        final_status = BatchJobStatus.FAILED if run.failed_chunks else BatchJobStatus.COMPLETED
+        finished_at = timezone.now()
+        if BatchJobRun.objects.filter(id=run_id, status=BatchJobStatus.RUNNING).update(
+            status=final_status, finished_at=finished_at
+        ):
+            run.status, run.finished_at = final_status, finished_at
+            logger.info(f"[BatchJob] {run.job_name} run {run.id} finished: {final_status}")
+            if run.monitor_run_id:
+                finish_deferred_run(
+                    run.monitor_run_id, success=not run.failed_chunks, items=run.items_processed,
+                    result=f"Batch run {run.id}: {run.completed_chunks}/{run.total_chunks} chunks",
+                    error=f"{run.failed_chunks} chunks failed" if run.failed_chunks else None,
+                )
+
+    # The monitor of the task that started the run, whose name can differ from the job's
+    monitors = ScheduledTaskMonitor.objects.filter(
+        **({'runs': run.monitor_run_id} if run.monitor_run_id else {'task_name': run.job_name})
+    )
+    monitors.update(progress={
+        "run_id": run.id,
+        "status": run.status,
+        "total_chunks": run.total_chunks,
+        "completed_chunks": run.completed_chunks,
+        "failed_chunks": run.failed_chunks,
+        "items_processed": run.items_processed,
+        "started_at": run.started_at.isoformat(),
+        "finished_at": run.finished_at.isoformat() if run.finished_at else None,
+    })
@@ -17,4 +17,16 @@ class NotificationType(models.TextChoices):
     EVENT_CREATE ='event create','Event Create'
     EVENT_RSVP='event rsvp','Event Rsvp'
     MENTOR_ELIGIBILITY = 'mentor eligiblity', 'Mentor Eligiblity'
-    Group = 'Group', 'group'
\ No newline at end of file
+    Group = 'Group', 'group'
+
+class BatchJobStatus(models.TextChoices):
+    RUNNING = 'running', 'Running'
+    COMPLETED = 'completed', 'Completed'
+    FAILED = 'failed', 'Failed'
+
+
+class BatchChunkStatus(models.TextChoices):
+    PENDING = 'pending', 'Pending'
+    RUNNING = 'running', 'Running'
+    DONE = 'done', 'Done'
+    FAILED = 'failed', 'Failed'
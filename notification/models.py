@@ -1,3 +1,5 @@
+import math
+
 # Django imports
 from django.db import models
 from django.contrib.contenttypes.models import ContentType
@@ -7,7 +9,7 @@ from django.utils import timezone
 from user.models import CustomUser
 from profiles.models import Profile
 from core.models import BaseModel
-from notification.choices import NotificationType
+from notification.choices import NotificationType, BatchJobStatus, BatchChunkStatus
 
 
 class Notification(models.Model):
@@ -75,10 +77,135 @@ class ScheduledTaskMonitor(models.Model):
 
     last_response = models.JSONField(default=dict, blank=True, null=True)
 
+    # Rolling duration percentiles over the most recent finished runs
+    p50_duration_seconds = models.FloatField(null=True, blank=True)
+    p95_duration_seconds = models.FloatField(null=True, blank=True)
+
+    # Progress of the latest chunked batch run, see notification.batch_jobs
+    progress = models.JSONField(default=dict, blank=True)
+
     def is_overdue(self):
         if not self.last_run_at:
             return True
         return timezone.now() - self.last_run_at > timezone.timedelta(minutes=self.expected_interval_minutes + 5)
 
+    def refresh_duration_percentiles(self, sample_size=100):
+        durations = list(
+            self.runs.filter(duration_seconds__isnull=False)
+            .order_by('-started_at')
+            .values_list('duration_seconds', flat=True)[:sample_size]
+        )
+        self.p50_duration_seconds = percentile(durations, 50)
+        self.p95_duration_seconds = percentile(durations, 95)
+        self.save(update_fields=['p50_duration_seconds', 'p95_duration_seconds'])
+
+    def __str__(self):
+        return self.task_name
+
+
+class ScheduledTaskRun(models.Model):
+    """
+    One execution of a monitored periodic task.
+    Keeps the history behind ScheduledTaskMonitor so durations and
+    throughput can be trended over time.
+    """
+    monitor = models.ForeignKey(ScheduledTaskMonitor, on_delete=models.CASCADE, related_name='runs')
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField(null=True, blank=True)
+    duration_seconds = models.FloatField(null=True, blank=True)
+    success = models.BooleanField(null=True, blank=True)
+    error = models.TextField(blank=True, null=True)
+    items_processed = models.PositiveIntegerField(default=0)
+    overlapped = models.BooleanField(default=False)
+
+    class Meta:
+        ordering = ['-started_at']
+        indexes = [
+            models.Index(fields=['monitor', 'started_at']),
+            models.Index(fields=['monitor', 'finished_at']),
+        ]
+
+    @property
+    def seconds_per_item(self):
+        if not self.items_processed or self.duration_seconds is None:
+            return None
+        return self.duration_seconds / self.items_processed
+
     def __str__(self):
-        return self.task_name
\ No newline at end of file
+        return f"{self.monitor.task_name} @ {self.started_at}"
+
+
+class TaskLock(models.Model):
+    """
+    Lease held by a running periodic task, see notification.task_lock.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    owner = models.CharField(max_length=64)
+    acquired_at = models.DateTimeField()
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name} (until {self.expires_at})"
+
+
+class BatchJobRun(models.Model):
+    """
+    One execution of a chunked batch job (notification.batch_jobs).
+    Chunks are checkpointed individually so a crashed run can be resumed.
+    """
+    job_name = models.CharField(max_length=255)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=BatchJobStatus.choices, default=BatchJobStatus.RUNNING)
+    total_chunks = models.PositiveIntegerField(default=0)
+    completed_chunks = models.PositiveIntegerField(default=0)
+    failed_chunks = models.PositiveIntegerField(default=0)
+    items_processed = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Monitored run of the task that started this one, closed when the last chunk settles
+    monitor_run = models.ForeignKey(
+        ScheduledTaskRun, on_delete=models.SET_NULL, null=True, blank=True, related_name='batch_runs'
+    )
+
+    class Meta:
+        ordering = ['-started_at']
+        indexes = [
+            models.Index(fields=['job_name', 'status', 'started_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.job_name} #{self.id} ({self.status})"
+
+
+class BatchJobChunk(models.Model):
+    """
+    Primary-key range [start_id, end_id] of a batch job queryset.
+    """
+    run = models.ForeignKey(BatchJobRun, on_delete=models.CASCADE, related_name='chunks')
+    start_id = models.BigIntegerField()
+    end_id = models.BigIntegerField()
+    status = models.CharField(max_length=20, choices=BatchChunkStatus.choices, default=BatchChunkStatus.PENDING)
+    items_processed = models.PositiveIntegerField(default=0)
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, null=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['start_id']
+        unique_together = ('run', 'start_id')
+        indexes = [
+            models.Index(fields=['run', 'status']),
+        ]
+
+    def __str__(self):
+        return f"{self.run.job_name} [{self.start_id}-{self.end_id}] {self.status}"
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers, None when empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
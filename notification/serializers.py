@@ -1,6 +1,6 @@
 # serializers.py
 from rest_framework import serializers
-from .models import Notification
+from .models import Notification, ScheduledTaskMonitor
 
 class NotificationSerializer(serializers.ModelSerializer):
     sender_username = serializers.CharField(source='sender.username', read_only=True)
@@ -43,3 +43,24 @@ class NotificationSerializer(serializers.ModelSerializer):
             'post_id',
             'post_slug',
         ]
+
+
+class ScheduledTaskMonitorSerializer(serializers.ModelSerializer):
+    is_overdue = serializers.SerializerMethodField()
+
+    def get_is_overdue(self, obj):
+        return obj.is_overdue()
+
+    class Meta:
+        model = ScheduledTaskMonitor
+        fields = [
+            'id',
+            'task_name',
+            'last_run_at',
+            'expected_interval_minutes',
+            'is_overdue',
+            'p50_duration_seconds',
+            'p95_duration_seconds',
+            'progress',
+            'last_response',
+        ]
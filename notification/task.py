@@ -6,6 +6,7 @@ from django.utils.timezone import now
 
 from django.core.exceptions import ObjectDoesNotExist
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.contrib.contenttypes.models import ContentType
 from requests import post
 from django.db import transaction
@@ -18,8 +19,10 @@ from notification.models import DailyQuote, DailyQuoteSeen, Notification
 from notification.choices import NotificationType
 from post.models import PostReaction,Comment ,Post, PostView,SharePost
 from profiles.models import FriendRequest
-from notification.utils import create_notification, send_notification_email
-from notification.task_monitor import monitor_task
+from notification.utils import create_notification, create_notifications_bulk, send_notification_email
+from notification.task_monitor import monitor_task, report_items_processed
+from notification.batch_jobs import batch_job, start_batch_job
+from notification.task_lock import single_instance_task
 # Setup logger
 logger = logging.getLogger(__name__)
 
@@ -54,28 +57,37 @@ def send_welcome_email_task(profile_id):
 @monitor_task(task_name="send_daily_muse_to_all_profiles", expected_interval_minutes=1440)
 def send_daily_muse_to_all_profiles():
     logger.info("Running: send_daily_muse_to_all_profiles")
-    profiles = Profile.objects.filter(notify_email=True)
 
     # If there are literally no quotes in the system, stop early
     if not DailyQuote.objects.exists():
         logger.warning(" No quotes available in the system. Task aborted.")
         return
 
-    for profile in profiles:
-        try:
-            today = timezone.localdate()
+    run = start_batch_job("send_daily_muse_to_all_profiles")
+    if run is None:
+        return "Skipped: the previous batch run is still in progress"
+    return f"Batch run {run.id}: {run.total_chunks} chunks"
+
 
+@batch_job("send_daily_muse_to_all_profiles", queryset=lambda: Profile.objects.filter(notify_email=True))
+def send_daily_muse_chunk(profiles):
+    sent = 0
+    today = timezone.localdate()
+
+    for profile in profiles.select_related('user', 'organization__user'):
+        try:
             # Check if today's quote already sent
             today_seen = DailyQuoteSeen.objects.filter(
                 profile=profile,
                 created_at__date=today
-            ).first()
+            ).select_related('quote').first()
 
             if today_seen:
                 if not today_seen.email_sent:
                     send_daily_muse_email(profile, today_seen.quote)
                     today_seen.email_sent = True
                     today_seen.save(update_fields=["email_sent"])
+                    sent += 1
                     logger.info(f" Sent today's Daily Muse to profile {profile.id}")
                 else:
                     logger.info(f" Already sent today's Daily Muse to profile {profile.id}")
@@ -91,6 +103,7 @@ def send_daily_muse_to_all_profiles():
                 send_daily_muse_email(profile, quote)
                 seen_record.email_sent = True
                 seen_record.save(update_fields=["email_sent"])
+                sent += 1
                 logger.info(f" Sent new Daily Muse to profile {profile.id}")
             else:
                 logger.info(f" No unseen quotes left for profile {profile.id}")
@@ -98,6 +111,8 @@ def send_daily_muse_to_all_profiles():
         except Exception as e:
             logger.exception(f" Exception while sending Daily Muse to profile {profile.id}: {e}")
 
+    return sent
+
 
 def send_daily_muse_email(profile, quote):
     user = getattr(profile, 'user', None)
@@ -297,12 +312,25 @@ def send_mention_notification_task(from_profile_id, to_profile_id, post_id):
 @shared_task
 @monitor_task(task_name="send_weekly_profile_stats", expected_interval_minutes=10080)
 def send_weekly_profile_stats():
-    one_week_ago = timezone.now() - timedelta(days=7)
     now = timezone.now()
+    one_week_ago = now - timedelta(days=7)
+
+    run = start_batch_job("send_weekly_profile_stats", params={
+        "start": one_week_ago.isoformat(),
+        "end": now.isoformat(),
+    })
+    if run is None:
+        return "Skipped: the previous batch run is still in progress"
+    return f"Batch run {run.id}: {run.total_chunks} chunks"
 
-    profiles = Profile.objects.filter(notify_email=True)
 
-    for profile in profiles:
+@batch_job("send_weekly_profile_stats", queryset=lambda: Profile.objects.filter(notify_email=True))
+def send_weekly_profile_stats_chunk(profiles, start, end):
+    one_week_ago = parse_datetime(start)
+    now = parse_datetime(end)
+    sent = 0
+
+    for profile in profiles.select_related('user', 'organization__user'):
         user = get_user(profile)
         email_to = user.email
 
@@ -338,6 +366,9 @@ def send_weekly_profile_stats():
             recipient_list=[email_to],
             context=context,
         )
+        sent += 1
+
+    return sent
 
 @shared_task
 def send_event_creation_notification_task(event_id):
@@ -507,8 +538,15 @@ def shared_event_media_comment_notification_task(event_media_id, profile_id, com
 
 
 @shared_task
+@single_instance_task("send_event_reminder_notifications", ttl=1800)
 @monitor_task(task_name="send_event_reminder_notifications", expected_interval_minutes=60)
-def send_event_reminder_notifications():
+def send_event_reminder_notifications(batch_size=500):
+    """
+    Reminds attendees of events starting in 24 and in 3 hours. Per window and
+    batch of events: the events are locked and flagged reminded with one
+    UPDATE, and all attendee notifications go in with bulk INSERTs, in one
+    transaction so a batch is either fully sent or retried by the next run.
+    """
     logger.info("Running: send_event_reminder_notifications")
     try:
         now = timezone.now()
@@ -523,37 +561,43 @@ def send_event_reminder_notifications():
         window_3h_end = window_3h_start + timedelta(minutes=59, seconds=59)
 
         reminder_windows = {
-            'reminder_1st_sent': (window_24h_start, window_24h_end),  # 24 hours
-            'reminder_2nd_sent': (window_3h_start, window_3h_end),    # 3 hours
+            'reminder_1st_sent': ("24", window_24h_start, window_24h_end),  # 24 hours
+            'reminder_2nd_sent': ("3", window_3h_start, window_3h_end),     # 3 hours
         }
+        event_type = ContentType.objects.get_for_model(Event)
 
-        for reminder_flag, (start_time, end_time) in reminder_windows.items():
-            events = Event.objects.filter(
+        for reminder_flag, (hours, start_time, end_time) in reminder_windows.items():
+            due_events = Event.objects.filter(
                 start_datetime__range=(start_time, end_time),
-                status='published'
+                status='published',
+                **{reminder_flag: False}
             )
-
-            for event in events:
-                attendees = EventAttendance.objects.filter(event=event).select_related('profile')
-
-                for attendance in attendees:
-                    if getattr(attendance, reminder_flag):
-                        continue  
-
-                    profile = attendance.profile
-                    hours = "24" if reminder_flag == "reminder_1st_sent" else "3"
-                    message = f"Reminder: '{event.title}' starts in {hours} hours."
-
-                    create_notification(
-                        sender=event.host,
-                        recipient=profile,
-                        instance=event,
-                        message=message,
-                        notification_type=NotificationType.EVENT_REMINDER
+            while True:
+                with transaction.atomic():
+                    event_ids = list(
+                        due_events.select_for_update(skip_locked=True).order_by('id').values_list('id', flat=True)[:batch_size]
                     )
+                    if not event_ids:
+                        break
+                    Event.objects.filter(id__in=event_ids).update(**{reminder_flag: True})
 
-                    setattr(attendance, reminder_flag, True)
-                    attendance.save(update_fields=[reminder_flag])
+                    events = Event.objects.filter(id__in=event_ids).select_related('host').in_bulk()
+                    attendances = EventAttendance.objects.filter(event_id__in=event_ids).select_related(
+                        'profile__user', 'profile__organization__user'
+                    )
+                    notifications = [
+                        Notification(
+                            sender=events[attendance.event_id].host,
+                            recipient=attendance.profile,
+                            notification_type=NotificationType.EVENT_REMINDER,
+                            message=f"Reminder: '{events[attendance.event_id].title}' starts in {hours} hours.",
+                            content_type=event_type,
+                            object_id=attendance.event_id,
+                        )
+                        for attendance in attendances
+                    ]
+                    create_notifications_bulk(notifications)
+                report_items_processed(len(notifications))
 
     except Exception as e:
         logger.error(f"Error sending event reminders: {e}", exc_info=True)
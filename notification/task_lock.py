@@ -0,0 +1,181 @@
+import logging
+import threading
+import time
+import uuid
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from .models import TaskLock
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseLockStore:
+    """
+    Lock rows in the TaskLock table. Works across every worker sharing the
+    database, whatever cache backend is configured.
+    """
+
+    def acquire(self, name, owner, ttl):
+        now = timezone.now()
+        expires_at = now + timedelta(seconds=ttl)
+
+        # Take over an expired lock (previous holder died without releasing)
+        taken = TaskLock.objects.filter(name=name, expires_at__lte=now).update(
+            owner=owner, acquired_at=now, expires_at=expires_at
+        )
+        if taken:
+            return True
+
+        try:
+            with transaction.atomic():
+                TaskLock.objects.create(name=name, owner=owner, acquired_at=now, expires_at=expires_at)
+            return True
+        except IntegrityError:
+            return False
+
+    def renew(self, name, owner, ttl):
+        return TaskLock.objects.filter(name=name, owner=owner).update(
+            expires_at=timezone.now() + timedelta(seconds=ttl)
+        ) > 0
+
+    def release(self, name, owner):
+        TaskLock.objects.filter(name=name, owner=owner).delete()
+
+
+class CacheLockStore:
+    """
+    Lock keys in the Django cache. Only safe across workers when the cache is
+    shared (Redis/Memcached); cache.add is the atomic acquire.
+    """
+    key_prefix = "task-lock:"
+
+    def acquire(self, name, owner, ttl):
+        return cache.add(self.key_prefix + name, owner, ttl)
+
+    def renew(self, name, owner, ttl):
+        key = self.key_prefix + name
+        if cache.get(key) != owner:
+            return False
+        return cache.touch(key, ttl)
+
+    def release(self, name, owner):
+        key = self.key_prefix + name
+        if cache.get(key) == owner:
+            cache.delete(key)
+
+
+class LocalLockStore:
+    """In-process lock store for tests and single-worker setups."""
+
+    def __init__(self):
+        self._locks = {}
+        self._mutex = threading.Lock()
+
+    def acquire(self, name, owner, ttl):
+        with self._mutex:
+            current = self._locks.get(name)
+            if current and current[1] > time.monotonic():
+                return False
+            self._locks[name] = (owner, time.monotonic() + ttl)
+            return True
+
+    def renew(self, name, owner, ttl):
+        with self._mutex:
+            current = self._locks.get(name)
+            if not current or current[0] != owner:
+                return False
+            self._locks[name] = (owner, time.monotonic() + ttl)
+            return True
+
+    def release(self, name, owner):
+        with self._mutex:
+            current = self._locks.get(name)
+            if current and current[0] == owner:
+                del self._locks[name]
+
+
+LOCK_STORES = {
+    "database": DatabaseLockStore,
+    "cache": CacheLockStore,
+    "local": LocalLockStore,
+}
+
+_default_store = None
+
+
+def get_lock_store():
+    """Store selected by settings.TASK_LOCK_STORE (database by default)."""
+    global _default_store
+    if _default_store is None:
+        _default_store = LOCK_STORES[getattr(settings, "TASK_LOCK_STORE", "database")]()
+    return _default_store
+
+
+class _Heartbeat(threading.Thread):
+    """Keeps extending the lock TTL while the task body is still running."""
+
+    def __init__(self, store, name, owner, ttl, interval):
+        super().__init__(daemon=True, name=f"task-lock-heartbeat:{name}")
+        self.store = store
+        self.lock_name = name
+        self.owner = owner
+        self.ttl = ttl
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.interval):
+                if not self.store.renew(self.lock_name, self.owner, self.ttl):
+                    logger.error(f"Lost task lock '{self.lock_name}' while the task was still running")
+                    return
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join(timeout=self.interval)
+
+
+def single_instance_task(lock_name, ttl=600, heartbeat_interval=None, store=None):
+    """
+    Skips a run of the wrapped task while another run holds `lock_name`.
+
+    The lock expires after `ttl` seconds unless renewed, so a crashed worker
+    never blocks the job for longer than that. While the task runs a heartbeat
+    renews it every `heartbeat_interval` seconds (ttl / 3 by default).
+
+    Place it above monitor_task so skipped runs are not recorded as executions:
+
+        @shared_task
+        @single_instance_task("send_weekly_group_digest", ttl=900)
+        @monitor_task(task_name="send_weekly_group_digest", expected_interval_minutes=10080)
+        def send_weekly_group_digest(): ...
+    """
+    interval = heartbeat_interval or max(1, ttl // 3)
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            lock_store = store or get_lock_store()
+            owner = uuid.uuid4().hex
+
+            if not lock_store.acquire(lock_name, owner, ttl):
+                logger.warning(f"Task '{lock_name}' skipped: previous run still holds the lock")
+                return None
+
+            heartbeat = _Heartbeat(lock_store, lock_name, owner, ttl, interval)
+            heartbeat.start()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                heartbeat.stop()
+                lock_store.release(lock_name, owner)
+        return wrapper
+    return decorator
@@ -1,50 +1,142 @@
 # app/utils/task_monitor.py
 import logging
+from contextvars import ContextVar
+from datetime import timedelta
 from time import perf_counter
 from functools import wraps
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 from profiles.models import Profile  # adjust import path if needed
-from .models import ScheduledTaskMonitor
+from .models import ScheduledTaskMonitor, ScheduledTaskRun
 from notification.utils import create_notification, send_notification_email
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
 
+# Runs still marked as unfinished after this long are treated as dead workers,
+# not as overlapping executions.
+STALE_RUN_AFTER = timedelta(hours=24)
+
+# Items-processed counter of the monitored run executing in this context
+_current_run_items = ContextVar("current_task_run_items", default=None)
+# {"run": ScheduledTaskRun, "deferred": bool} of the monitored run executing in this context
+_current_run = ContextVar("current_task_run", default=None)
+
+
+def report_items_processed(count=1):
+    """
+    Lets a monitored task report how many items (profiles, events, emails...)
+    it handled. No-op when called outside of a monitor_task run.
+    """
+    counter = _current_run_items.get()
+    if counter is not None:
+        counter[0] += count
+
+
+def defer_run_completion():
+    """
+    Keeps the monitored run executing in this context open after the task
+    returns, for work it hands off to other tasks (batch job chunks), so its
+    duration, items and overlaps cover that work. Returns the
+    ScheduledTaskRun to close with finish_deferred_run, or None outside of
+    a monitor_task run.
+    """
+    current = _current_run.get()
+    if current is None:
+        return None
+    current["deferred"] = True
+    return current["run"]
+
+
+def finish_deferred_run(run_id, success, items, result=None, error=None):
+    """Closes a deferred run, timed from the task start until now. No-op if it is already closed."""
+    run = ScheduledTaskRun.objects.select_related("monitor").filter(id=run_id, finished_at__isnull=True).first()
+    if run is None:
+        return
+    duration = (timezone.now() - run.started_at).total_seconds()
+    _finish_run(
+        run.monitor, run, run.monitor.expected_interval_minutes,
+        success=success, duration=duration, items=items, result=result, error=error,
+    )
+
+
+def _start_run(task_name, expected_interval_minutes, run_at):
+    monitor, _ = ScheduledTaskMonitor.objects.get_or_create(
+        task_name=task_name,
+        defaults={"expected_interval_minutes": expected_interval_minutes},
+    )
+    overlapped = monitor.runs.filter(
+        finished_at__isnull=True,
+        started_at__gte=run_at - STALE_RUN_AFTER,
+    ).exists()
+    if overlapped:
+        logger.warning(f"Task '{task_name}' started while a previous run is still in progress")
+
+    run = ScheduledTaskRun.objects.create(monitor=monitor, started_at=run_at, overlapped=overlapped)
+    return monitor, run
+
+
+def _finish_run(monitor, run, expected_interval_minutes, success, duration, items, result=None, error=None):
+    run.finished_at = timezone.now()
+    run.duration_seconds = duration
+    run.success = success
+    run.error = error
+    run.items_processed = items
+    run.save(update_fields=["finished_at", "duration_seconds", "success", "error", "items_processed"])
+
+    monitor.last_run_at = run.started_at
+    monitor.expected_interval_minutes = expected_interval_minutes
+    monitor.last_response = {
+        "success": success,
+        "error": error,
+        "duration_seconds": duration,
+        "items_processed": items,
+        "overlapped": run.overlapped,
+        "result": result,
+        "run_at": run.started_at.isoformat(),
+    }
+    monitor.save(update_fields=["last_run_at", "expected_interval_minutes", "last_response"])
+    monitor.refresh_duration_percentiles()
+
+
 def monitor_task(task_name, expected_interval_minutes):
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
             start_time = perf_counter()
             run_at = timezone.now()
+            monitor, run = _start_run(task_name, expected_interval_minutes, run_at)
+            counter = [0]
+            token = _current_run_items.set(counter)
+            current = {"run": run, "deferred": False}
+            run_token = _current_run.set(current)
 
             try:
                 result = func(*args, **kwargs)
                 duration = perf_counter() - start_time
 
-                ScheduledTaskMonitor.objects.update_or_create(
-                    task_name=task_name,
-                    defaults={
-                        "last_run_at": run_at,
-                        "expected_interval_minutes": expected_interval_minutes,
-                        "last_response": {
-                            "success": True,
-                            "error": None,
-                            "duration_seconds": duration,
-                            "result": str(result),
-                            "run_at": run_at.isoformat(),
-                        }
-                    }
+                if current["deferred"]:
+                    logger.info(f"Task '{task_name}' handed off its work, the run is closed when that finishes")
+                    return result
+
+                _finish_run(
+                    monitor, run, expected_interval_minutes,
+                    success=True, duration=duration, items=counter[0], result=str(result),
                 )
 
                 logger.info(f"Task '{task_name}' completed successfully at {run_at}")
                 return result
 
             except Exception as e:
+                duration = perf_counter() - start_time
                 logger.error(f" Task '{task_name}' failed: {str(e)}", exc_info=True)
+                _finish_run(
+                    monitor, run, expected_interval_minutes,
+                    success=False, duration=duration, items=counter[0], error=str(e),
+                )
 
                 # Get all profiles whose linked user is a superuser
- 
+
                 superuser_profiles = Profile.objects.filter(user__is_superuser=True)
                 print(f"Superuser profiles: {superuser_profiles}")
 
@@ -67,20 +159,9 @@ def monitor_task(task_name, expected_interval_minutes):
                         message=msg,
                         notification_type="CRON_FAILURE"
                     )
-                ScheduledTaskMonitor.objects.update_or_create(
-                    task_name=task_name,
-                    defaults={
-                        "last_run_at": run_at,
-                        "expected_interval_minutes": expected_interval_minutes,
-                        "last_response": {
-                            "success": False,
-                            "error": str(e),
-                            "duration_seconds": duration,
-                            "result": None,
-                            "run_at": run_at.isoformat(),
-                        }
-                    }
-                )
                 raise
+            finally:
+                _current_run_items.reset(token)
+                _current_run.reset(run_token)
         return wrapper
     return decorator
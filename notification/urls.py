@@ -1,9 +1,10 @@
 # urls.py
 from django.urls import path
-from .views import NotificationListView, NotificationMarkReadView, BulkCustomEmailAPIView
+from .views import NotificationListView, NotificationMarkReadView, BulkCustomEmailAPIView, ScheduledTaskMetricsAPIView
 
 urlpatterns = [
     path('user/notifications/', NotificationListView.as_view(), name='notification-list'),
     path("notifications/mark-read/", NotificationMarkReadView.as_view(), name="notification-mark-read"),
     path("send-custom-email/", BulkCustomEmailAPIView.as_view(), name="send-custom-email"),
+    path("task-metrics/", ScheduledTaskMetricsAPIView.as_view(), name="task-metrics"),
 ]
@@ -3,6 +3,7 @@ from django.utils import timezone
 import random
 from datetime import timedelta
 from django.db import transaction
+from django.db.models.signals import post_save
 
 from notification.models import Notification,DailyQuote, DailyQuoteSeen
 
@@ -65,6 +66,30 @@ def create_notification(*args, **kwargs):
 
 
 
+def create_notifications_bulk(notifications, batch_size=1000):
+    """
+    Saves many unsaved Notification objects with bulk INSERTs, for sweeps
+    notifying thousands of profiles at once. post_save is sent for each row
+    (bulk_create skips it) so receivers such as the socket push still run.
+    Like create_notification, recipients with notify_email get an email,
+    sent once the surrounding transaction commits. Load sender and
+    recipient (with user / organization__user) on the objects beforehand.
+    """
+    created = Notification.objects.bulk_create(notifications, batch_size=batch_size)
+    for notification in created:
+        post_save.send(sender=Notification, instance=notification, created=True, update_fields=None, raw=False, using='default')
+
+    def send_emails():
+        for notification in created:
+            if notification.recipient.notify_email:
+                send_notification_email(
+                    notification.recipient, notification.sender, notification.message, notification.notification_type
+                )
+
+    transaction.on_commit(send_emails)
+    return created
+
+
 NOTIFICATION_CONFIG = {
     'like': {
         'message': '{sender} liked your post',
@@ -1,12 +1,14 @@
 # views.py
 from django.http import Http404
-from django.db.models import Q
+from django.db.models import Q, Avg, Max, Sum, Count
+from django.db.models.functions import TruncDate
 from django.utils import timezone
+from datetime import timedelta
 
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework import status
 
 
@@ -17,10 +19,10 @@ from profiles.models import Profile
 # from notification.task import send_daily_muse_email_task
 
 
-from .models import Notification, DailyQuoteSeen
+from .models import Notification, DailyQuoteSeen, ScheduledTaskMonitor, ScheduledTaskRun
 
-from .serializers import NotificationSerializer
-from core.services import error_response, get_user_profile, send_dynamic_email_using_template  # replace with your actual helper
+from .serializers import NotificationSerializer, ScheduledTaskMonitorSerializer
+from core.services import error_response, success_response, get_user_profile, send_dynamic_email_using_template  # replace with your actual helper
 from core.pagination import PaginationMixin
 
 class NotificationListView(APIView, PaginationMixin):
@@ -154,4 +156,58 @@ class BulkCustomEmailAPIView(APIView):
             "sent_emails": sent_emails,
             "skipped_count": len(skipped),
             "skipped": skipped
-        }, status=status.HTTP_200_OK)
\ No newline at end of file
+        }, status=status.HTTP_200_OK)
+
+
+class ScheduledTaskMetricsAPIView(APIView):
+    """
+    GET /notification/task-metrics/?days=30&task_name=<optional>
+
+    Returns every monitored beat task with its p50/p95 duration and a daily
+    trend (runs, avg/max duration, items processed, overlapping runs) so
+    jobs that grow with data size can be spotted before they outrun
+    their schedule.
+    """
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    def get(self, request):
+        try:
+            days = int(request.query_params.get("days", 30))
+            task_name = request.query_params.get("task_name")
+
+            monitors = ScheduledTaskMonitor.objects.order_by("task_name")
+            if task_name:
+                monitors = monitors.filter(task_name=task_name)
+
+            since = timezone.now() - timedelta(days=days)
+            daily = (
+                ScheduledTaskRun.objects.filter(monitor__in=monitors, started_at__gte=since)
+                .annotate(day=TruncDate("started_at"))
+                .values("monitor_id", "day")
+                .annotate(
+                    runs=Count("id"),
+                    failures=Count("id", filter=Q(success=False)),
+                    overlaps=Count("id", filter=Q(overlapped=True)),
+                    avg_duration_seconds=Avg("duration_seconds"),
+                    max_duration_seconds=Max("duration_seconds"),
+                    items_processed=Sum("items_processed"),
+                )
+                .order_by("monitor_id", "day")
+            )
+
+            trends = defaultdict(list)
+            for row in daily:
+                trends[row.pop("monitor_id")].append(row)
+
+            data = []
+            for monitor in monitors:
+                item = ScheduledTaskMonitorSerializer(monitor).data
+                item["daily"] = trends.get(monitor.id, [])
+                data.append(item)
+
+            return Response(success_response(data), status=status.HTTP_200_OK)
+
+        except ValueError as e:
+            return Response(error_response(str(e)), status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response(error_response(str(e)), status=status.HTTP_500_INTERNAL_SERVER_ERROR)